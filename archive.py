@@ -0,0 +1,60 @@
+# 정산이 끝난 경기와 그 베팅을 matches_archive / bets_archive 로 옮겨서 matches, bets 에는
+# 정산 전 데이터만 남긴다. 옮긴 경기도 find_match 로 조회할 수 있다.
+
+MATCH_COLUMNS = ('match_id, match_name, team1, team2, date, result, team1_dividend, team2_dividend, closed, '
+                 'team1_total_bet, team2_total_bet')
+BET_COLUMNS = 'bet_id, user_id, match_id, team, amount, timestamp'
+
+
+ARCHIVE_BATCH = 5000  # 트랜잭션 하나에 옮기는 베팅 수. 옮기는 동안 다른 쓰기가 너무 오래 기다리지 않게 한다
+
+
+def archive_match(conn, match_id, batch=ARCHIVE_BATCH):
+    """정산된 경기의 베팅을 batch 개 옮기고, 베팅이 남지 않았으면 경기도 옮긴다. 한 번 호출이 한 트랜잭션이다.
+    다 옮겼으면 True, 베팅이 남았으면 False, 정산 전이거나 없는 경기면 None 을 돌려준다."""
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM matches WHERE match_id = ? AND result IS NOT NULL', (match_id,))
+    if cursor.fetchone() is None:
+        return None
+
+    chunk = 'SELECT bet_id FROM bets WHERE match_id = ? LIMIT ?'
+    cursor.execute(f'INSERT INTO bets_archive ({BET_COLUMNS}) SELECT {BET_COLUMNS} FROM bets WHERE bet_id IN ({chunk})',
+                   (match_id, batch))
+    moved = cursor.rowcount
+    cursor.execute(f'DELETE FROM bets WHERE bet_id IN ({chunk})', (match_id, batch))
+    done = moved < batch
+    if done:
+        # archive_seq: 보관한 순서 (증분 내보내기의 기준)
+        cursor.execute(f'''
+        INSERT INTO matches_archive ({MATCH_COLUMNS}, archive_seq)
+        SELECT {MATCH_COLUMNS}, (SELECT COALESCE(MAX(archive_seq), 0) + 1 FROM matches_archive) FROM matches WHERE match_id = ?
+        ''', (match_id,))
+        cursor.execute('DELETE FROM matches WHERE match_id = ?', (match_id,))
+    conn.commit()
+    return done
+
+
+def settled_match_ids(conn):
+    # 정산됐지만 아직 옮기지 않은 경기
+    cursor = conn.cursor()
+    cursor.execute('SELECT match_id FROM matches WHERE result IS NOT NULL ORDER BY match_id')
+    return [row[0] for row in cursor.fetchall()]
+
+
+async def archive_all(db, match_ids):
+    # 워커를 오래 잡지 않도록 배치마다 다른 작업에 차례를 넘긴다
+    for match_id in match_ids:
+        while await db.run(archive_match, match_id) is False:
+            pass
+
+
+def find_match(conn, columns, match_id):
+    # 정산 전 경기는 matches 에, 옮겨진 경기는 matches_archive 에 있다
+    cursor = conn.cursor()
+    cursor.execute(f'''
+    SELECT {columns} FROM matches WHERE match_id = ?
+    UNION ALL
+    SELECT {columns} FROM matches_archive WHERE match_id = ?
+    LIMIT 1
+    ''', (match_id, match_id))
+    return cursor.fetchone()
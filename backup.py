@@ -0,0 +1,152 @@
+import argparse
+import itertools
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+BACKUP_DIR = 'backups'
+BACKUP_PAGES = 256     # 단계마다 복사할 페이지 수
+BACKUP_PAUSE = 0.002   # 단계 사이에 쉬는 시간(초). 그동안 다른 스레드가 GIL 과 디스크를 쓴다
+KEEP_BACKUPS = 7
+
+
+def _stem(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def _stamp():
+    return datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+
+
+def list_backups(db_path, backup_dir=BACKUP_DIR):
+    # 오래된 것부터. 복원 전에 만든 사본(…-pre-restore-…)은 돌려쓰기 대상이 아니다.
+    # 이름은 <stem>-날짜-시각[-마이크로초][-번호].db (예전 백업에는 마이크로초가 없다)
+    pattern = re.compile(rf'^{re.escape(_stem(db_path))}-(\d{{8}})-(\d{{6}})(?:-(\d{{6}}))?(?:-(\d+))?\.db$')
+    if not os.path.isdir(backup_dir):
+        return []
+    found = []
+    for name in os.listdir(backup_dir):
+        match = pattern.match(name)
+        if match:
+            # 문자열 순서로는 …-1.db 가 …\.db 보다 앞서므로 숫자로 정렬한다
+            found.append((tuple(int(part or 0) for part in match.groups()), os.path.join(backup_dir, name)))
+    return [path for key, path in sorted(found)]
+
+
+def _reserve(db_path, backup_dir):
+    """겹치지 않는 백업 경로를 고르고 그 .part 파일을 만들어 둔다. 같은 순간에 시작한 백업(주기 백업과
+    /backup 등)도 서로 다른 파일에 쓰므로 앞의 백업을 덮어쓰지 않는다."""
+    stamp = _stamp()
+    for n in itertools.count():
+        path = os.path.join(backup_dir, f'{_stem(db_path)}-{stamp}{f"-{n}" if n else ""}.db')
+        if os.path.exists(path):
+            continue
+        try:
+            os.close(os.open(path + '.part', os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        return path
+
+
+def backup(db_path, backup_dir=BACKUP_DIR, keep=KEEP_BACKUPS, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, name=None):
+    """SQLite 온라인 백업 API 로 db_path 를 backup_dir 에 복사한다. (경로, 페이지 수, 걸린 초) 를 돌려준다.
+
+    원본 커넥션에서 읽기 트랜잭션을 먼저 열어 두므로 WAL 에서는 시작 시점의 스냅샷이 복사되고, 복사하는
+    동안 봇이 커밋해도 백업이 처음부터 다시 시작되지 않는다. 쓰기는 막지 않는다.
+    끝나면 keep 개만 남기고 오래된 백업을 지운다.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, name) if name else _reserve(db_path, backup_dir)
+    part = path + '.part'
+    total_pages = 0
+
+    def progress(status, remaining, total):
+        nonlocal total_pages
+        total_pages = total
+        time.sleep(pause)
+
+    started = time.perf_counter()
+    try:
+        src = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, timeout=30, isolation_level=None)
+    except BaseException:
+        if os.path.exists(part):  # _reserve 가 만들어 둔 빈 파일
+            os.remove(part)
+        raise
+    dst = sqlite3.connect(part)
+    try:
+        src.execute('BEGIN')
+        src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()  # 여기서 스냅샷이 고정된다
+        src.backup(dst, pages=pages, progress=progress)
+        src.execute('COMMIT')
+    except BaseException:
+        dst.close()
+        os.remove(part)
+        raise
+    finally:
+        src.close()
+    dst.close()
+    os.replace(part, path)
+
+    if keep:
+        for old in list_backups(db_path, backup_dir)[:-keep]:
+            os.remove(old)
+    return path, total_pages, time.perf_counter() - started
+
+
+def restore(backup_path, db_path, backup_dir=BACKUP_DIR):
+    """backup_path 로 db_path 를 덮어쓴다. 봇을 멈춘 상태에서만 실행해야 한다.
+    덮어쓰기 전에 지금 db_path 를 backup_dir 에 …-pre-restore-… 로 남기고 그 경로를 돌려준다."""
+    check = sqlite3.connect(f'file:{backup_path}?mode=ro', uri=True)
+    try:
+        result = check.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        check.close()
+    if result != 'ok':
+        raise ValueError(f'{backup_path} 가 손상되었습니다: {result}')
+
+    saved = None
+    if os.path.exists(db_path):
+        saved, pages, elapsed = backup(db_path, backup_dir, keep=None,
+                                       name=f'{_stem(db_path)}-pre-restore-{_stamp()}.db')
+    src = sqlite3.connect(f'file:{backup_path}?mode=ro', uri=True)
+    dst = sqlite3.connect(db_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return saved
+
+
+if __name__ == '__main__':
+    # python backup.py create [points.db]
+    # python backup.py list [points.db]
+    # python backup.py restore <backup 파일> [points.db]   (봇을 멈춘 뒤에)
+    parser = argparse.ArgumentParser(description='Online backup and restore for points.db')
+    parser.add_argument('-d', '--dir', default=BACKUP_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create')
+    create.add_argument('db', nargs='?', default='points.db')
+    create.add_argument('--keep', type=int, default=KEEP_BACKUPS)
+    listing = commands.add_parser('list')
+    listing.add_argument('db', nargs='?', default='points.db')
+    restoring = commands.add_parser('restore')
+    restoring.add_argument('backup')
+    restoring.add_argument('db', nargs='?', default='points.db')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        path, pages, elapsed = backup(args.db, args.dir, args.keep)
+        print(f'{path}: {pages} pages in {elapsed:.2f}s')
+    elif args.command == 'list':
+        for path in list_backups(args.db, args.dir):
+            print(f'{path}  {os.path.getsize(path) // 1024} KB')
+    else:
+        try:
+            saved = restore(args.backup, args.db, args.dir)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f'{args.backup} -> {args.db} 복원 완료' + (f' (이전 파일은 {saved})' if saved else ''))
@@ -0,0 +1,106 @@
+import random
+import time
+from bisect import bisect_left
+from itertools import combinations
+
+EXACT_LIMIT = 14       # 이 인원까지는 모든 조합을 본다 (14명: 1716가지)
+TIME_BUDGET = 0.02     # 그보다 많으면 이 시간(초) 안에 지역 탐색으로 찾은 가장 좋은 답
+
+
+def average_gap(team1, team2):
+    avg1 = sum(mmr for _, mmr in team1) / len(team1) if team1 else 0
+    avg2 = sum(mmr for _, mmr in team2) / len(team2) if team2 else 0
+    return abs(avg1 - avg2)
+
+
+def balance_teams(players, time_budget=TIME_BUDGET, seed=None):
+    """players: [(user_id, mmr), ...] 를 인원 차이가 1 이하인 두 팀으로 나눠 평균 MMR 차이를 최소로 한다.
+    (team1, team2) 를 돌려주며 각 팀은 MMR 내림차순 [(user_id, mmr), ...] 이다.
+    EXACT_LIMIT 명까지는 최적해, 그보다 많으면 time_budget 초 안에 찾은 가장 좋은 답이다."""
+    players = sorted(players, key=lambda player: -player[1])
+    if len(players) < 2:
+        return players, []
+    if len(players) <= EXACT_LIMIT:
+        picked = _exact(players)
+    else:
+        picked = _local_search(players, time.perf_counter() + time_budget, random.Random(seed))
+    team1 = [player for i, player in enumerate(players) if i in picked]
+    team2 = [player for i, player in enumerate(players) if i not in picked]
+    return team1, team2
+
+
+def _exact(players):
+    n = len(players)
+    size = n // 2
+    mmrs = [mmr for _, mmr in players]
+    total = sum(mmrs)
+    best, best_gap = None, None
+    # 인원이 짝수면 0번을 항상 팀1에 두어 같은 분할을 두 번 보지 않는다
+    candidates = (((0,) + rest for rest in combinations(range(1, n), size - 1)) if n % 2 == 0
+                  else combinations(range(n), size))
+    for combo in candidates:
+        s = sum(mmrs[i] for i in combo)
+        gap = abs(s / size - (total - s) / (n - size))
+        if best_gap is None or gap < best_gap:
+            best, best_gap = combo, gap
+            if gap == 0:
+                break
+    return set(best)
+
+
+def _local_search(players, deadline, rng):
+    n = len(players)
+    size = n // 2
+    mmrs = [mmr for _, mmr in players]
+    total = sum(mmrs)
+    # 팀1 합이 target 이면 두 팀 평균이 같다
+    target = total * size / n
+
+    # 첫 시작점: MMR 높은 순으로 자리가 남은 쪽 중 평균이 낮은 팀에 넣는 탐욕 분할
+    team1, team2 = [], []
+    sum1 = sum2 = 0
+    for i in range(n):
+        if len(team2) >= n - size or (len(team1) < size and sum1 * (n - size) <= sum2 * size):
+            team1.append(i)
+            sum1 += mmrs[i]
+        else:
+            team2.append(i)
+            sum2 += mmrs[i]
+
+    best, best_error = set(team1), abs(sum1 - target)
+    while best_error > 0.5 and time.perf_counter() < deadline:
+        sum1 = _improve(team1, team2, sum1, target, mmrs, deadline)
+        if abs(sum1 - target) < best_error:
+            best, best_error = set(team1), abs(sum1 - target)
+        # 지역 최적해에서 벗어나도록 몇 명을 무작위로 맞바꾸고 다시 내려간다
+        for _ in range(max(1, n // 10)):
+            a, b = rng.randrange(size), rng.randrange(n - size)
+            sum1 += mmrs[team2[b]] - mmrs[team1[a]]
+            team1[a], team2[b] = team2[b], team1[a]
+    return best
+
+
+def _improve(team1, team2, sum1, target, mmrs, deadline):
+    # 팀1의 a 와 팀2의 b 를 맞바꾸면 sum1 이 mmrs[b] - mmrs[a] 만큼 바뀐다. 가장 좋은 맞교환을 더 나아지지 않을 때까지
+    while time.perf_counter() < deadline:
+        need = target - sum1
+        error = abs(need)
+        if error <= 0.5:
+            break
+        order2 = sorted(range(len(team2)), key=lambda j: mmrs[team2[j]])
+        values2 = [mmrs[team2[j]] for j in order2]
+        best = None
+        for i, a in enumerate(team1):
+            want = mmrs[a] + need
+            k = bisect_left(values2, want)
+            for j in (k - 1, k):
+                if 0 <= j < len(values2):
+                    new_error = abs(need - (values2[j] - mmrs[a]))
+                    if new_error < error:
+                        error, best = new_error, (i, order2[j])
+        if best is None:
+            break
+        i, j = best
+        sum1 += mmrs[team2[j]] - mmrs[team1[i]]
+        team1[i], team2[j] = team2[j], team1[i]
+    return sum1
@@ -0,0 +1,37 @@
+# 팀 밸런스 벤치마크: python -m benchmarks.balance
+# 로비 크기별로 무작위 분할과 balance_teams 의 평균 MMR 차이, 호출당 시간(최대값이 시간 예산 안인지)을 본다.
+import random
+import statistics
+import time
+
+from balance import TIME_BUDGET, average_gap, balance_teams
+
+SIZES = (10, 14, 20, 40, 100)
+LOBBIES = 200
+
+
+def random_lobby(rng, size):
+    return [(str(i), int(rng.gauss(1600, 400))) for i in range(size)]
+
+
+def main():
+    print(f'{"players":>7} {"random gap":>11} {"balanced gap":>13} {"avg ms":>8} {"max ms":>8}   (로비 {LOBBIES}개, 예산 {TIME_BUDGET * 1000:.0f} ms)')
+    rng = random.Random(0)
+    for size in SIZES:
+        random_gaps, gaps, times = [], [], []
+        for _ in range(LOBBIES):
+            lobby = random_lobby(rng, size)
+            shuffled = lobby[:]
+            rng.shuffle(shuffled)
+            random_gaps.append(average_gap(shuffled[:size // 2], shuffled[size // 2:]))
+            start = time.perf_counter()
+            team1, team2 = balance_teams(lobby, seed=0)
+            times.append(time.perf_counter() - start)
+            assert abs(len(team1) - len(team2)) <= 1 and len(team1) + len(team2) == size
+            gaps.append(average_gap(team1, team2))
+        print(f'{size:>7} {statistics.mean(random_gaps):>11.2f} {statistics.mean(gaps):>13.3f}'
+              f' {statistics.mean(times) * 1000:>8.2f} {max(times) * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+# 디스코드 없이 명령어 콜백을 직접 호출하는 부하 테스트
+# python -m benchmarks.loadtest --users 200 --rounds 5 [--guilds 4] [--workers 2]
+import argparse
+import asyncio
+import contextvars
+import random
+import re
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import discord
+
+import main
+import services
+from outbound import PayoutNotifier
+from workers import WorkerPool
+
+current_command = contextvars.ContextVar('current_command', default=None)
+
+
+class FakeMember:
+    def __init__(self, guild, user_id, administrator=False):
+        self.guild = guild
+        self.id = user_id
+        self.name = f'user{user_id}'
+        self.nick = None
+        self.display_name = self.name
+        self.mention = f'<@{user_id}>'
+        self.bot = False
+        self.administrator = administrator
+        self.dms = []
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.guild.api_latency)
+        self.dms.append(content)
+
+
+class FakeGuild:
+    def __init__(self, guild_id, api_latency):
+        self.id = guild_id
+        self.api_latency = api_latency
+        self.members = {}
+        self.channels = {}
+
+    def get_channel_or_thread(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def add_member(self, user_id, administrator=False):
+        member = self.members[user_id] = FakeMember(self, user_id, administrator)
+        return member
+
+    def get_member(self, user_id):
+        # discord.py 의 멤버 캐시가 비어 있는 상황(members intent 없음)을 흉내낸다
+        return None
+
+    async def fetch_member(self, user_id):
+        await asyncio.sleep(self.api_latency)
+        return self.members[int(user_id)]
+
+    async def query_members(self, user_ids, limit=5, cache=True, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        return [self.members[user_id] for user_id in user_ids[:limit] if user_id in self.members]
+
+
+class FakeClient:
+    # 당첨 DM 용: 유저 캐시에 없으면 API 로 가져오는 상황
+    def __init__(self, guilds):
+        self.guilds = guilds
+
+    def get_user(self, user_id):
+        return None
+
+    async def fetch_user(self, user_id):
+        guild = next(guild for guild in self.guilds if int(user_id) in guild.members)
+        return await guild.fetch_member(user_id)
+
+
+class FakeMessage:
+    def __init__(self, content, view=None):
+        self.id = random.getrandbits(48)
+        self.content = content
+        self.view = view
+        self.deleted = False
+
+    async def edit(self, content=None, view=None, **kwargs):
+        if self.deleted:
+            raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+        self.content = content if content is not None else self.content
+
+    async def pin(self, **kwargs):
+        pass
+
+    async def delete(self, **kwargs):
+        self.deleted = True
+
+
+class FakeChannel:
+    def __init__(self, channel_id, api_latency):
+        self.id = channel_id
+        self.api_latency = api_latency
+        self.sent = []
+
+    async def send(self, content=None, view=None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        message = FakeMessage(content, view)
+        self.sent.append(message)
+        return message
+
+    def get_partial_message(self, message_id):
+        return next(message for message in self.sent if message.id == message_id)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self, content=None, view=None):
+        if self._done:
+            raise RuntimeError('This interaction has already been responded to before')
+        self._done = True
+        await asyncio.sleep(self._interaction.api_latency)
+        self._interaction.messages.append(content)
+        self._interaction.message = FakeMessage(content, view)
+
+    async def send_message(self, content=None, *, view=None, ephemeral=False, **kwargs):
+        await self._respond(content, view)
+        return SimpleNamespace(message_id=self._interaction.message.id)
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    async def edit_message(self, content=None, view=None, **kwargs):
+        await self._respond(content, view)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, *, view=None, ephemeral=False, **kwargs):
+        await asyncio.sleep(self._interaction.api_latency)
+        self._interaction.messages.append(content)
+        self._interaction.message = FakeMessage(content, view)
+        return self._interaction.message
+
+
+class FakeInteraction:
+    def __init__(self, user, channel, api_latency):
+        self.user = user
+        self.guild = user.guild
+        self.guild_id = user.guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.client = main.bot
+        self.api_latency = api_latency
+        self.messages = []
+        self.message = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, content=None, view=None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        self.messages.append(content)
+
+    @property
+    def last_message(self):
+        return self.messages[-1] if self.messages else ''
+
+
+class Server:
+    # 가짜 서버 하나: 채널 하나, 관리자 한 명, 사용자들, 그 서버의 경기와 내전
+    def __init__(self, guild_id, api_latency):
+        self.guild = FakeGuild(guild_id, api_latency)
+        self.channel = self.guild.channels[guild_id] = FakeChannel(guild_id, api_latency)
+        self.admin = self.guild.add_member(10 ** 6 - guild_id, administrator=True)
+        self.users = []
+        self.match_ids = []
+        self.lobbies = []  # [(내전 이름, {팀: 참가 버튼})]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.servers = [Server(i + 1, args.api_latency / 1000) for i in range(args.guilds)]
+        # 사용자는 서버마다 고르게 나눈다
+        self.users = []
+        for i in range(args.users):
+            server = self.servers[i % len(self.servers)]
+            user = server.guild.add_member(10 ** 6 + 1 + i)
+            server.users.append(user)
+            self.users.append((server, user))
+        self.latencies = defaultdict(list)
+        self.db_time = defaultdict(float)
+        self.db_wait = defaultdict(float)
+        self.errors = defaultdict(int)
+        self.odds_changes = 0
+
+    def on_db_job(self, fn, wait, elapsed, rows, error):
+        command = current_command.get()
+        if command is not None:
+            self.db_time[command] += elapsed
+            self.db_wait[command] += wait
+
+    def on_odds_changed(self, match_id):
+        self.odds_changes += 1
+
+    def on_worker_event(self, guild_id, name, *args):
+        self.odds_changes += name == 'odds'
+        main.on_worker_event(guild_id, name, *args)
+
+    async def call(self, server, name, command, user, *args):
+        interaction = FakeInteraction(user, server.channel, server.guild.api_latency)
+        token = current_command.set(name)
+        start = time.perf_counter()
+        try:
+            await command(interaction, *args)
+        except Exception:
+            self.errors[name] += 1
+        finally:
+            self.latencies[name].append(time.perf_counter() - start)
+            current_command.reset(token)
+        return interaction
+
+    def setup_guild(self, data):
+        main.setup_guild(data)
+        # db ms / wait ms 는 DB 가 이 프로세스에 있을 때만 잰다
+        data.db.listeners.append(self.on_db_job)
+        data.betting.listeners.append(self.on_odds_changed)
+
+    async def setup(self, db_dir):
+        # 서버마다 db_dir/<guild_id>.db 를 쓴다
+        if self.args.workers:
+            main.workers = WorkerPool(self.args.workers, db_dir, on_event=self.on_worker_event)
+            main.workers.start()
+        else:
+            main.guilds.db_dir = db_dir
+            main.guilds.setup = self.setup_guild
+        # 가짜 API 는 rate limit 이 없으므로 DM 속도 제한만 풀어서 짧은 실행 안에 끝나게 한다
+        main.notifier = PayoutNotifier(FakeClient([server.guild for server in self.servers]), main.outbox, rate=10000)
+        for server in self.servers:
+            for user in server.users:
+                await main.call_guild(server.guild.id, services.adjust_points, str(user.id), self.args.points)
+            for i in range(self.args.matches):
+                interaction = await self.call(server, 'addmatch', main.add_match_command.callback, server.admin,
+                                              f'match{i}', 'A', 'B', '2030-01-01 00:00:00')
+                server.match_ids.append(int(re.search(r'ID: (\d+)', interaction.last_message).group(1)))
+            for i in range(self.args.lobbies):
+                interaction = await self.call(server, '내전개설', main.start_match.callback, server.admin, f'lobby{i}')
+                buttons = {item.team: item for item in interaction.message.view.children}
+                server.lobbies.append((f'lobby{i}', buttons))
+            await self.call(server, '배당판', main.odds_board_command.callback, server.admin)
+        # 실행 시간이 짧으므로 배당판 갱신 간격도 줄여서 합쳐지는 정도를 본다
+        for board in main.odds_boards.values():
+            board.debounce, board.min_interval = 0.05, 0.2
+
+    async def user_session(self, server, user):
+        rng = random.Random(user.id)
+        lobby, buttons = rng.choice(server.lobbies)
+        await self.call(server, 'join_team', buttons[rng.choice((1, 2))].callback, user)
+        for _ in range(self.args.rounds):
+            match_id = rng.choice(server.match_ids)
+            await self.call(server, '경기', main.matches.callback, user)
+            interaction = await self.call(server, '베팅', main.bet.callback, user, match_id, rng.choice('AB'),
+                                          rng.randint(1, 1000))
+            found = re.search(r'베팅 번호: (\d+)', interaction.last_message or '')
+            if found and rng.random() < 0.2:
+                await self.call(server, '베팅취소', main.cancel_bet_command.callback, user, int(found.group(1)))
+            await self.call(server, '포인트', main.points.callback, user, None)
+            if rng.random() < 0.2:
+                await self.call(server, '팀', main.team_status.callback, user, lobby)
+            if rng.random() < 0.1:
+                await self.call(server, '전적', main.record.callback, user, None)
+                await self.call(server, '내순위', main.my_rank.callback, user)
+
+    async def admin_session(self, server):
+        admin = server.admin
+        for match_id in server.match_ids:
+            await self.call(server, 'closebets', main.close_bets.callback, admin, match_id)
+            await self.call(server, 'setresult', main.set_result.callback, admin, match_id, self.rng.choice('AB'))
+        for lobby, _ in server.lobbies:
+            await self.call(server, '팀밸런스', main.balance_team_command.callback, admin, lobby)
+            await self.call(server, '팀마감', main.close_teams.callback, admin, lobby)
+            await self.call(server, '내전종료', main.end_match.callback, admin, lobby, self.rng.choice((1, 2)))
+        await self.call(server, '티어표', main.tier_list.callback, admin)
+
+    async def run(self, db_dir):
+        await self.setup(db_dir)
+        start = time.perf_counter()
+        await asyncio.gather(*(self.user_session(server, user) for server, user in self.users))
+        await asyncio.gather(*(self.admin_session(server) for server in self.servers))
+        elapsed = time.perf_counter() - start
+        self.odds_edits = sum(board.edits for board in main.odds_boards.values())
+        await self.check_restart()
+        for board in main.odds_boards.values():
+            board.stop()
+        await main.notifier.close(timeout=60)
+        await main.outbox.close()
+        if main.workers is not None:
+            await main.workers.close()
+        await main.guilds.close()
+        return elapsed
+
+    async def restart_odds_boards(self):
+        # 봇을 다시 시작한 것처럼 메모리의 배당판을 버리고 on_guild_available 처럼 DB 에서 다시 붙인다
+        for board in main.odds_boards.values():
+            board.stop()
+        main.odds_boards.clear()
+        for server in self.servers:
+            await main.restore_odds_boards(server.guild)
+        await asyncio.gather(*main.odds_board_removals)
+
+    async def saved_boards(self, server):
+        return await main.call_guild(server.guild.id, services.odds_board_messages)
+
+    async def check_restart(self):
+        boards = {server: main.odds_boards[server.guild.id].messages[server.channel.id] for server in self.servers}
+        for message in boards.values():
+            message.content = None
+        await self.restart_odds_boards()
+        for server, message in boards.items():
+            # 같은 메시지를 다시 고치고, /배당판 은 두 번째 게시판을 올리지 않고 그 메시지를 내린다
+            assert main.odds_boards[server.guild.id].messages[server.channel.id] is message, 'odds board not restored'
+            assert message.content is not None, 'restored odds board not refreshed'
+            sent = len(server.channel.sent)
+            await self.call(server, '배당판', main.odds_board_command.callback, server.admin)
+            assert message.deleted and len(server.channel.sent) == sent, 'odds board not taken down after restart'
+            assert await self.saved_boards(server) == [], 'removed odds board still saved'
+        # 누가 지운 게시판 메시지는 재시작 뒤 첫 갱신에서 빠지고 저장된 기록도 지워진다
+        for server in self.servers:
+            await self.call(server, '배당판', main.odds_board_command.callback, server.admin)
+            main.odds_boards[server.guild.id].messages[server.channel.id].deleted = True
+        await self.restart_odds_boards()
+        for server in self.servers:
+            assert server.channel.id not in main.odds_boards[server.guild.id].messages, 'deleted odds board restored'
+            assert await self.saved_boards(server) == [], 'deleted odds board still saved'
+        print(f'배당판 재시작 확인: {len(self.servers)}개 서버 통과')
+
+    def report(self, elapsed):
+        total = sum(len(samples) for samples in self.latencies.values())
+        mode = f'{self.args.workers} worker processes' if self.args.workers else 'in-process'
+        print(f'{self.args.users} users in {self.args.guilds} guilds ({mode}), {total} commands in {elapsed:.2f}s ({total / elapsed:,.0f} commands/s)\n')
+        print(f'{"command":<12} {"n":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}'
+              f' {"db ms":>8} {"wait ms":>8} {"errors":>6}')
+        for name, samples in self.latencies.items():
+            samples = sorted(samples)
+            n = len(samples)
+            pct = lambda p: samples[min(n - 1, int(n * p / 100))] * 1000
+            print(f'{name:<12} {n:>6} {statistics.median(samples) * 1000:>8.2f} {pct(95):>8.2f} {pct(99):>8.2f}'
+                  f' {samples[-1] * 1000:>8.2f} {self.db_time[name] / n * 1000:>8.2f}'
+                  f' {self.db_wait[name] / n * 1000:>8.2f} {self.errors[name]:>6}')
+        print('\ndb ms / wait ms: 호출당 평균 DB 실행 시간 / DB 워커 큐 대기 시간')
+        print(f'배당 변경 {self.odds_changes}회 -> 배당판 메시지 수정 {self.odds_edits}회')
+        outbox = main.outbox
+        print(f'당첨 DM: 보냄 {main.notifier.sent}, 실패 {main.notifier.failed}')
+        print(f'채널 알림: 보냄 {outbox.sent}, 합침 {outbox.coalesced}, 버림 {outbox.dropped}, 실패 {outbox.failed}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Offline command load test')
+    parser.add_argument('--users', type=int, default=100, help='동시 사용자 수')
+    parser.add_argument('--guilds', type=int, default=1, help='사용자를 나눌 서버 수 (서버마다 DB 파일 하나)')
+    parser.add_argument('--rounds', type=int, default=5, help='사용자당 베팅 라운드 수')
+    parser.add_argument('--workers', type=int, default=0, help='DB 작업을 처리할 워커 프로세스 수 (0: 봇 프로세스)')
+    parser.add_argument('--matches', type=int, default=3)
+    parser.add_argument('--lobbies', type=int, default=4)
+    parser.add_argument('--points', type=int, default=100000, help='사용자당 시작 포인트')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='디스코드 API 호출 지연 (ms)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def run_load_test():
+    args = parse_args()
+    test = LoadTest(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        elapsed = asyncio.run(test.run(tmp))
+    test.report(elapsed)
+
+
+if __name__ == '__main__':
+    run_load_test()
@@ -0,0 +1,122 @@
+# 내전종료 MMR 갱신 벤치마크: python -m benchmarks.rating
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from database import Database
+from initDB import initialize_database
+from rating import BASE_MMR, MMR_CHANGE, record_match_result
+
+LOBBY_SIZES = (10, 100, 1000, 10000)
+CONCURRENT_LOBBIES = (10, 100, 500)
+
+
+def legacy_record_match_result(conn, match_name, winning_team):
+    # 이전 구현: 플레이어마다 SELECT 두 번, upsert 한 번
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, team FROM teams WHERE match_name = ?", (match_name,))
+    rows = cursor.fetchall()
+    total_mmr = []
+    for user_id, team in rows:
+        cursor.execute("SELECT mmr FROM records WHERE user_id = ?", (user_id,))
+        mmr = cursor.fetchone()
+        total_mmr.append(mmr[0] if mmr else BASE_MMR)
+    avg_mmr_match = sum(total_mmr) / len(total_mmr) if total_mmr else BASE_MMR
+    for user_id, team in rows:
+        cursor.execute("SELECT mmr, streak FROM records WHERE user_id = ?", (user_id,))
+        user_data = cursor.fetchone()
+        user_mmr, streak = user_data if user_data else (BASE_MMR, 0)
+        mmr_diff = user_mmr - avg_mmr_match
+        mmr_change = MMR_CHANGE - int(mmr_diff / 100) if mmr_diff > 0 else MMR_CHANGE + int(mmr_diff / 100)
+        if mmr_change < 0:
+            mmr_change = 1
+        if team == winning_team:
+            new_streak = streak + 1 if streak > 0 else 1
+            if new_streak >= 3:
+                mmr_change = int(mmr_change * ((abs(new_streak) - 2) / 10 + 1))
+            cursor.execute('''
+                INSERT INTO records (user_id, wins, losses, mmr, streak) VALUES (?, 1, 0, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET wins = wins + 1, mmr = mmr + ?, streak = ?
+            ''', (user_id, BASE_MMR + mmr_change, new_streak, mmr_change, new_streak))
+        else:
+            new_streak = streak - 1 if streak < 0 else -1
+            if new_streak <= -3:
+                mmr_change = int(mmr_change * ((abs(new_streak) - 2) / 10 + 1))
+            cursor.execute('''
+                INSERT INTO records (user_id, wins, losses, mmr, streak) VALUES (?, 0, 1, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET losses = losses + 1, mmr = mmr - ?, streak = ?
+            ''', (user_id, BASE_MMR - mmr_change, new_streak, mmr_change, new_streak))
+    cursor.execute("DELETE FROM teams WHERE match_name = ?", (match_name,))
+    conn.commit()
+
+
+def build_database(path, lobbies, lobby_size):
+    initialize_database(path)
+    conn = sqlite3.connect(path)
+    rng = random.Random(lobby_size)
+    users = lobbies * lobby_size
+    conn.executemany('INSERT INTO records (user_id, wins, losses, mmr, streak) VALUES (?, 0, 0, ?, ?)',
+                     ((str(u), rng.randint(800, 2800), rng.randint(-5, 5)) for u in range(users) if u % 3))
+    conn.executemany('INSERT INTO teams (match_name, user_id, team) VALUES (?, ?, ?)',
+                     ((f'lobby{u // lobby_size}', str(u), 1 + u % 2) for u in range(users)))
+    conn.commit()
+    conn.close()
+
+
+def records(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute('SELECT * FROM records'))
+    finally:
+        conn.close()
+
+
+def bench_lobby_sizes(tmp):
+    print(f'{"players":>8} {"legacy (ms)":>12} {"batch (ms)":>11} {"speedup":>8}')
+    for size in LOBBY_SIZES:
+        results = []
+        for name, fn in (('legacy', legacy_record_match_result), ('batch', record_match_result)):
+            path = os.path.join(tmp, f'{name}-size{size}.db')
+            build_database(path, 1, size)
+            conn = sqlite3.connect(path)
+            start = time.perf_counter()
+            fn(conn, 'lobby0', 1)
+            results.append(time.perf_counter() - start)
+            conn.close()
+        assert records(os.path.join(tmp, f'legacy-size{size}.db')) == records(os.path.join(tmp, f'batch-size{size}.db'))
+        legacy, batch = results
+        print(f'{size:>8} {legacy * 1000:>12.1f} {batch * 1000:>11.1f} {legacy / batch:>7.1f}x')
+
+
+async def end_lobbies(db, fn, lobbies):
+    return await asyncio.gather(*(db.run(fn, f'lobby{i}', 1 + i % 2) for i in range(lobbies)))
+
+
+def bench_concurrent(tmp):
+    print(f'\n{"lobbies":>8} {"legacy (ms)":>12} {"batch (ms)":>11} {"speedup":>8}   (10 players each, ended concurrently)')
+    for lobbies in CONCURRENT_LOBBIES:
+        results = []
+        for name, fn in (('legacy', legacy_record_match_result), ('batch', record_match_result)):
+            path = os.path.join(tmp, f'{name}-lobbies{lobbies}.db')
+            build_database(path, lobbies, 10)
+            db = Database(path)
+            db.start()
+            start = time.perf_counter()
+            asyncio.run(end_lobbies(db, fn, lobbies))
+            results.append(time.perf_counter() - start)
+            db.close()
+        legacy, batch = results
+        print(f'{lobbies:>8} {legacy * 1000:>12.1f} {batch * 1000:>11.1f} {legacy / batch:>7.1f}x')
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_lobby_sizes(tmp)
+        bench_concurrent(tmp)
+
+
+if __name__ == '__main__':
+    main()
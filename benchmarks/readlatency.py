@@ -0,0 +1,74 @@
+# 정산 중 읽기 지연 벤치마크: python -m benchmarks.readlatency [bets]
+# 100k 베팅 정산(close_match)이 쓰기 워커에서 도는 동안 읽기를 계속 보내고, 쓰기 워커 큐를 거치는 경우(db.run)와
+# 읽기 전용 커넥션 풀(db.read)을 쓰는 경우의 읽기 지연을 비교한다.
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.settlement import build_database
+from benchmarks.throughput import percentile
+from betting import BettingEngine
+from database import Database
+
+READERS = 8
+
+
+def read_points(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute('SELECT points FROM users WHERE user_id = ?', (user_id,))
+    return cursor.fetchone()
+
+
+async def reader(read, n_users, until, latencies, rng):
+    while not until.done():
+        start = time.perf_counter()
+        await read(read_points, str(rng.randrange(n_users)))
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.001)
+
+
+async def measure(path, n_bets, use_pool):
+    db = Database(path)
+    db.start()
+    engine = BettingEngine()
+    await db.run(engine.load)
+    read = db.read if use_pool else db.run
+    n_users = len(engine.balances)
+    rng = random.Random(0)
+
+    idle = []
+    for _ in range(200):
+        start = time.perf_counter()
+        await read(read_points, str(rng.randrange(n_users)))
+        idle.append(time.perf_counter() - start)
+
+    busy = []
+    start = time.perf_counter()
+    settlement = asyncio.ensure_future(db.run(engine.close_match, 1, 'A'))
+    await asyncio.gather(*(reader(read, n_users, settlement, busy, random.Random(i)) for i in range(READERS)))
+    settle_time = time.perf_counter() - start
+    db.close()
+    return idle, busy, settle_time
+
+
+def report(label, idle, busy, settle_time):
+    ms = lambda seconds: f'{seconds * 1000:8.2f}'
+    print(f'{label:<22} idle p50 {ms(percentile(idle, 50))}  busy p50 {ms(percentile(busy, 50))}'
+          f'  p99 {ms(percentile(busy, 99))}  max {ms(max(busy))}  (n={len(busy)}, 정산 {settle_time * 1000:.0f} ms)')
+
+
+def main():
+    n_bets = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f'{n_bets} bets 정산 중 읽기 지연 (ms), 동시 읽기 {READERS}개')
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, use_pool in (('writer queue (db.run)', False), ('read pool (db.read)', True)):
+            path = os.path.join(tmp, f'{use_pool}.db')
+            build_database(path, n_bets).close()
+            report(label, *asyncio.run(measure(path, n_bets, use_pool)))
+
+
+if __name__ == '__main__':
+    main()
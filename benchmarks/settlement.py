@@ -0,0 +1,87 @@
+# 정산(close_match) 벤치마크: python -m benchmarks.settlement
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from betting import BettingEngine
+from initDB import initialize_database
+from pools import PoolBook
+
+SIZES = (1000, 10000, 100000)
+BETS_PER_USER = 5
+
+
+def legacy_close_match(conn, match_id, winning_team):
+    # 이전 구현: 유저마다 SELECT 한 번, INSERT OR REPLACE 한 번
+    cursor = conn.cursor()
+    cursor.execute('UPDATE matches SET result = ? WHERE match_id = ?', (winning_team, match_id,))
+    cursor.execute('SELECT team1, team2, team1_dividend, team2_dividend FROM matches WHERE match_id = ?', (match_id,))
+    team1, team2, team1_dividend, team2_dividend = cursor.fetchone()
+    winning_dividend = team1_dividend if winning_team == team1 else team2_dividend
+    cursor.execute('SELECT user_id, team, amount FROM bets WHERE match_id = ?', (match_id,))
+    bets = cursor.fetchall()
+    user_points = {}
+    for user_id, team, amount in bets:
+        if user_id not in user_points:
+            cursor.execute('SELECT points FROM users WHERE user_id = ?', (user_id,))
+            result = cursor.fetchone()
+            user_points[user_id] = result[0] if result else 0
+    for user_id, team, amount in bets:
+        if team == winning_team:
+            user_points[user_id] += round(amount * winning_dividend * 0.95)
+    for user_id, points in user_points.items():
+        cursor.execute('INSERT OR REPLACE INTO users (user_id, points) VALUES (?, ?)', (user_id, points))
+    cursor.execute('UPDATE matches SET closed = 1 WHERE match_id = ?', (match_id,))
+    conn.commit()
+
+
+def build_database(path, n_bets):
+    initialize_database(path)
+    conn = sqlite3.connect(path)
+    rng = random.Random(n_bets)
+    n_users = max(1, n_bets // BETS_PER_USER)
+    conn.executemany('INSERT INTO users (user_id, points) VALUES (?, ?)',
+                     ((str(u), 1000000) for u in range(n_users)))
+    conn.execute("INSERT INTO matches (match_id, match_name, team1, team2, date, team1_dividend, team2_dividend) "
+                 "VALUES (1, 'bench', 'A', 'B', '2024-01-01 00:00:00', 1.0, 1.0)")
+    conn.executemany('INSERT INTO bets (user_id, match_id, team, amount, timestamp) VALUES (?, 1, ?, ?, ?)',
+                     ((str(rng.randrange(n_users)), rng.choice('AB'), rng.choice((100, 500, 1000, 5000)),
+                       '2024-01-01 00:00:00') for _ in range(n_bets)))
+    # matches 의 총액/배당을 bets 와 맞춰 두어야 두 구현이 같은 배당으로 정산한다
+    pools = PoolBook()
+    pools.load(conn, {1: ('A', 'B')})
+    pools.flush(conn)
+    return conn
+
+
+def timed(path, n_bets, settle, prepare=None):
+    conn = build_database(path, n_bets)
+    try:
+        if prepare:
+            prepare(conn)
+        start = time.perf_counter()
+        settle(conn)
+        elapsed = time.perf_counter() - start
+        points = dict(conn.execute('SELECT user_id, points FROM users'))
+    finally:
+        conn.close()
+    return elapsed, points
+
+
+def main():
+    print(f'{"bets":>8} {"legacy (ms)":>12} {"set-based (ms)":>15} {"speedup":>8}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_bets in SIZES:
+            engine = BettingEngine()
+            legacy, legacy_points = timed(os.path.join(tmp, f'legacy{n_bets}.db'), n_bets,
+                                          lambda conn: legacy_close_match(conn, 1, 'A'))
+            current, current_points = timed(os.path.join(tmp, f'current{n_bets}.db'), n_bets,
+                                            lambda conn: engine.close_match(conn, 1, 'A'), engine.load)
+            assert legacy_points == current_points, 'settlement results differ'
+            print(f'{n_bets:>8} {legacy * 1000:>12.1f} {current * 1000:>15.1f} {legacy / current:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# 서버 데이터 시작 시간 벤치마크 (DB 에서 적재 vs 스냅샷 복원): python -m benchmarks.startup
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from guilds import GuildData
+from initDB import initialize_database
+
+SIZES = (10000, 100000, 300000)  # 유저 수
+OPEN_MATCHES = 20
+BETS_PER_USER = 3
+
+
+def build_database(path, n_users):
+    initialize_database(path)
+    conn = sqlite3.connect(path)
+    rng = random.Random(n_users)
+    conn.executemany('INSERT INTO users (user_id, points) VALUES (?, ?)',
+                     ((str(u), rng.randrange(1000, 1000000)) for u in range(n_users)))
+    conn.executemany('INSERT INTO records (user_id, wins, losses, mmr) VALUES (?, 0, 0, ?)',
+                     ((str(u), rng.randrange(800, 2200)) for u in range(n_users)))
+    conn.executemany("INSERT INTO matches (match_id, match_name, team1, team2, date, team1_dividend, team2_dividend) "
+                     "VALUES (?, ?, 'A', 'B', '2099-01-01 00:00:00', 1.0, 1.0)",
+                     ((m, f'bench{m}') for m in range(1, OPEN_MATCHES + 1)))
+    conn.executemany('INSERT INTO bets (user_id, match_id, team, amount, timestamp) VALUES (?, ?, ?, ?, ?)',
+                     ((str(rng.randrange(n_users)), rng.randrange(1, OPEN_MATCHES + 1), rng.choice('AB'),
+                       rng.choice((100, 500, 1000)), '2024-01-01 00:00:00') for _ in range(n_users * BETS_PER_USER)))
+    conn.commit()
+    conn.close()
+
+
+async def timed_start(path):
+    data = GuildData(0, path)
+    start = time.perf_counter()
+    await data.start()
+    elapsed = time.perf_counter() - start
+    state = (data.betting.balances, data.betting.bet_totals, data.betting.matches,
+             {match_id: data.betting.get_odds(match_id) for match_id in data.betting.matches},
+             data.leaderboard.page(0, 1000), len(data.leaderboard))
+    await data.close()  # 스냅샷 저장
+    return elapsed, state
+
+
+async def run():
+    print(f'{"users":>8} {"db load (ms)":>13} {"snapshot (ms)":>14} {"speedup":>8}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_users in SIZES:
+            path = os.path.join(tmp, f'{n_users}.db')
+            build_database(path, n_users)
+            cold, cold_state = await timed_start(path)
+            warm, warm_state = await timed_start(path)
+            assert cold_state == warm_state, 'restored state differs from database'
+            print(f'{n_users:>8} {cold * 1000:>13.1f} {warm * 1000:>14.1f} {cold / warm:>7.1f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+# 동시 베팅 처리량 벤치마크: python -m benchmarks.throughput [tasks] [ops_per_task]
+# 같은 작업을 기본 rollback journal, WAL + PRAGMA 튜닝, 그리고 그룹 커밋까지 켠 설정에서 각각 돌려 비교한다.
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from betting import BettingEngine
+from database import Database, DEFAULT_PRAGMAS
+from initDB import initialize_database
+
+CONFIGS = (
+    ('rollback journal', (), False),
+    ('WAL + tuned', DEFAULT_PRAGMAS, False),
+    ('WAL + tuned + group commit', DEFAULT_PRAGMAS, True),
+)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def user_session(db, engine, user_id, ops, latencies, rng, grouped):
+    run_write = db.run_grouped if grouped else db.run
+    my_bets = []
+    for _ in range(ops):
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.5:
+            bet_id, reason = await run_write(engine.place_bet, user_id, 1, rng.choice(('A', 'B')), rng.randint(1, 100))
+            op = 'place_bet'
+            if bet_id:
+                my_bets.append(bet_id)
+        elif roll < 0.7 and my_bets:
+            await run_write(engine.cancel_bet, user_id, my_bets.pop())
+            op = 'cancel_bet'
+        else:
+            engine.get_user_points(user_id)
+            op = 'get_user_points'
+        latencies[op].append(time.perf_counter() - start)
+
+
+async def run(db, engine, tasks, ops, grouped):
+    await db.run(engine.load)
+    await db.run(engine.add_match, 'bench', 'A', 'B', '2024-01-01 00:00:00')
+    for user_id in range(tasks):
+        await db.run(engine.set_user_points, str(user_id), 10 ** 9)
+
+    latencies = {'place_bet': [], 'cancel_bet': [], 'get_user_points': []}
+    rng = random.Random(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(user_session(db, engine, str(user_id), ops, latencies, rng, grouped) for user_id in range(tasks)))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f'{tasks} concurrent tasks x {ops} ops')
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (name, pragmas, grouped) in enumerate(CONFIGS):
+            path = os.path.join(tmp, f'{i}.db')
+            initialize_database(path)
+            db = Database(path, pragmas)
+            db.start()
+            try:
+                elapsed, latencies = asyncio.run(run(db, BettingEngine(), tasks, ops, grouped))
+            finally:
+                db.close()
+            total = sum(len(samples) for samples in latencies.values())
+            print(f'\n{name}: {total / elapsed:,.0f} ops/s')
+            for op, samples in latencies.items():
+                print(f'  {op:<16} n={len(samples):<6} p50={statistics.median(samples) * 1000 if samples else 0:8.2f} ms'
+                      f'  p99={percentile(samples, 99) * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta
+
+from pools import PoolBook
+
+MAX_TOTAL_BET_PER_USER = 500000
+CANCELATION_WINDOW = timedelta(minutes=5)
+
+# place_bet 거절 사유
+INVALID_AMOUNT = 'invalid_amount'
+NO_MATCH = 'no_match'
+BETTING_CLOSED = 'betting_closed'
+INVALID_TEAM = 'invalid_team'
+LIMIT_EXCEEDED = 'limit_exceeded'
+INSUFFICIENT_POINTS = 'insufficient_points'
+
+
+class BettingEngine:
+    """포인트 잔액과 (유저, 경기)별 베팅 합계를 메모리에 들고 있는 write-through 캐시.
+
+    쓰기 메서드는 모두 ``db.run(engine.method, ...)`` 으로 db 워커 스레드에서만 실행되므로
+    검증과 차감이 하나의 트랜잭션 안에서 원자적으로 일어난다. 캐시는 커밋이 성공한 뒤에만 갱신한다.
+    """
+
+    def __init__(self):
+        self.balances = {}     # user_id -> points
+        self.bet_totals = {}   # match_id -> {user_id: 베팅 합계}
+        self.matches = {}      # 정산 전 경기: match_id -> [team1, team2, closed]
+        self.pools = PoolBook()  # 정산 전 경기의 팀별 베팅 총액과 배당
+        self.listeners = []    # listener(match_id): 경기의 베팅 상태가 바뀌고 커밋된 뒤 워커 스레드에서 호출
+
+    def load(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id, points FROM users')
+        self.balances = dict(cursor.fetchall())
+
+        cursor.execute('SELECT match_id, team1, team2, closed FROM matches WHERE result IS NULL')
+        self.matches = {match_id: [team1, team2, bool(closed)] for match_id, team1, team2, closed in cursor.fetchall()}
+
+        cursor.execute('''
+        SELECT match_id, user_id, SUM(amount) FROM bets
+        WHERE match_id IN (SELECT match_id FROM matches WHERE result IS NULL)
+        GROUP BY match_id, user_id
+        ''')
+        self.bet_totals = {}
+        for match_id, user_id, total in cursor.fetchall():
+            self.bet_totals.setdefault(match_id, {})[user_id] = total
+
+        self.pools.load(conn, {match_id: (team1, team2) for match_id, (team1, team2, closed) in self.matches.items()})
+        self.flush_pools(conn)
+
+    def snapshot(self):
+        # 깨끗하게 종료할 때 저장해 두었다가 DB 가 그대로면 다음 시작 때 load 대신 restore 한다 (snapshots.py)
+        return {'balances': self.balances, 'bet_totals': self.bet_totals,
+                'matches': self.matches, 'pools': self.pools.snapshot()}
+
+    def restore(self, state):
+        self.balances = state['balances']
+        self.bet_totals = state['bet_totals']
+        self.matches = state['matches']
+        self.pools.restore(state['pools'])
+
+    # 읽기 전용: 이벤트 루프에서 바로 호출해도 된다
+    def get_user_points(self, user_id):
+        return self.balances.get(user_id, 0)
+
+    def is_betting_closed(self, match_id):
+        match = self.matches.get(match_id)
+        return match is None or match[2]
+
+    def get_odds(self, match_id):
+        """(team1_total_bet, team2_total_bet, team1_dividend, team2_dividend), 정산된 경기는 None"""
+        pool = self.pools.get(match_id)
+        return pool.odds() if pool is not None else None
+
+    def flush_pools(self, conn):
+        # 바뀐 베팅 총액/배당을 matches 테이블에 한꺼번에 기록
+        return self.pools.flush(conn)
+
+    def _notify(self, match_id):
+        for listener in self.listeners:
+            listener(match_id)
+
+    def add_match(self, conn, match_name, team1, team2, date):
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO matches (match_name, team1, team2, date, team1_dividend, team2_dividend)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (match_name, team1, team2, date, 1.0, 1.0))
+        match_id = cursor.lastrowid
+        conn.commit()
+        self.matches[match_id] = [team1, team2, False]
+        self.pools.open(match_id, team1, team2)
+        self._notify(match_id)
+        return match_id
+
+    def close_betting(self, conn, match_id):
+        self._set_closed(conn, match_id, True)
+
+    def open_betting(self, conn, match_id):
+        self._set_closed(conn, match_id, False)
+
+    def _set_closed(self, conn, match_id, closed):
+        cursor = conn.cursor()
+        cursor.execute('UPDATE matches SET closed = ? WHERE match_id = ?', (int(closed), match_id))
+        if closed:
+            self.pools.write(cursor, match_id)
+        conn.commit()
+        if match_id in self.matches:
+            self.matches[match_id][2] = closed
+            self._notify(match_id)
+
+    def place_bet(self, conn, user_id, match_id, team, amount):
+        """베팅 하나를 검증하고 기록한다. (bet_id, None) 또는 (None, 거절 사유)를 돌려준다."""
+        if amount <= 0:
+            return None, INVALID_AMOUNT
+
+        match = self.matches.get(match_id)
+        if match is None:
+            return None, NO_MATCH
+
+        team1, team2, closed = match
+        if closed:
+            return None, BETTING_CLOSED
+        if team not in (team1, team2):
+            return None, INVALID_TEAM
+
+        match_totals = self.bet_totals.get(match_id, {})
+        total_bet_by_user = match_totals.get(user_id, 0)
+        if total_bet_by_user + amount > MAX_TOTAL_BET_PER_USER:
+            return None, LIMIT_EXCEEDED
+
+        balance = self.balances.get(user_id, 0)
+        if balance < amount:
+            return None, INSUFFICIENT_POINTS
+
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO bets (user_id, match_id, team, amount, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, match_id, team, amount, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        bet_id = cursor.lastrowid
+        cursor.execute('INSERT OR REPLACE INTO users (user_id, points) VALUES (?, ?)', (user_id, balance - amount))
+        conn.commit()
+
+        self.balances[user_id] = balance - amount
+        self.bet_totals.setdefault(match_id, {})[user_id] = total_bet_by_user + amount
+        self.pools.add(match_id, team, amount)
+        self._notify(match_id)
+        return bet_id, None
+
+    def cancel_bet(self, conn, user_id, bet_id):
+        cursor = conn.cursor()
+
+        # Retrieve the bet details
+        cursor.execute('SELECT match_id, team, amount, timestamp FROM bets WHERE bet_id = ? AND user_id = ?', (bet_id, user_id))
+        bet = cursor.fetchone()
+        if not bet:
+            return False
+
+        match_id, team, amount, bet_timestamp = bet
+
+        # Check if the cancellation window has passed
+        if datetime.now() - datetime.strptime(bet_timestamp, '%Y-%m-%d %H:%M:%S') > CANCELATION_WINDOW:
+            return False
+
+        # Check if betting is closed for the match
+        if self.is_betting_closed(match_id):
+            return False
+
+        cursor.execute('DELETE FROM bets WHERE bet_id = ? AND user_id = ?', (bet_id, user_id))
+
+        # Refund the user points
+        balance = self.balances.get(user_id, 0) + amount
+        cursor.execute('INSERT OR REPLACE INTO users (user_id, points) VALUES (?, ?)', (user_id, balance))
+        conn.commit()
+
+        self.balances[user_id] = balance
+        match_totals = self.bet_totals.get(match_id, {})
+        match_totals[user_id] = match_totals.get(user_id, 0) - amount
+        self.pools.add(match_id, team, -amount)
+        self._notify(match_id)
+        return True
+
+    def set_user_points(self, conn, user_id, points):
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR REPLACE INTO users (user_id, points) VALUES (?, ?)', (user_id, points))
+        conn.commit()
+        self.balances[user_id] = points
+
+    def adjust_points(self, conn, user_id, delta):
+        """잔액을 delta 만큼 바꾼다. 음수가 되면 바꾸지 않고 (False, 현재 잔액)을 돌려준다."""
+        balance = self.balances.get(user_id, 0)
+        if balance + delta < 0:
+            return False, balance
+        self.set_user_points(conn, user_id, balance + delta)
+        return True, balance + delta
+
+    def close_match(self, conn, match_id, winning_team):
+        """경기 결과를 기록하고 배당금을 한 번에 정산한다. {user_id: 지급액}을 돌려주고,
+        경기가 없거나 이미 정산되었으면 None 을 돌려준다."""
+        cursor = conn.cursor()
+
+        # Update the match result (이미 정산된 경기는 다시 지급하지 않는다)
+        cursor.execute('UPDATE matches SET result = ?, closed = 1 WHERE match_id = ? AND result IS NULL', (winning_team, match_id))
+        if cursor.rowcount == 0:
+            return None
+
+        pool = self.pools.get(match_id)
+        if pool is not None:
+            # 최종 베팅 총액과 배당을 결과와 같은 트랜잭션에 기록
+            self.pools.write(cursor, match_id)
+            winning_dividend = pool.dividend(winning_team)
+        else:
+            cursor.execute('SELECT team1, team2, team1_dividend, team2_dividend FROM matches WHERE match_id = ?', (match_id,))
+            team1, team2, team1_dividend, team2_dividend = cursor.fetchone()
+            winning_dividend = team1_dividend if winning_team == team1 else team2_dividend
+
+        # 반올림은 베팅 단위로 해야 하므로 금액별 지급액을 한 번만 계산해 두고 한 번에 합산한다
+        cursor.execute('SELECT user_id, amount FROM bets WHERE match_id = ? AND team = ?', (match_id, winning_team))
+        winnings_by_amount = {}
+        payouts = {}
+        for user_id, amount in cursor:
+            winnings = winnings_by_amount.get(amount)
+            if winnings is None:
+                winnings = winnings_by_amount[amount] = round(amount * winning_dividend * 0.95)
+            payouts[user_id] = payouts.get(user_id, 0) + winnings
+
+        cursor.executemany('''
+        INSERT INTO users (user_id, points) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET points = points + excluded.points
+        ''', payouts.items())
+        conn.commit()
+
+        for user_id, winnings in payouts.items():
+            self.balances[user_id] = self.balances.get(user_id, 0) + winnings
+        self.matches.pop(match_id, None)
+        self.bet_totals.pop(match_id, None)
+        self.pools.pop(match_id)
+        self._notify(match_id)
+        return payouts
+
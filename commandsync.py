@@ -0,0 +1,35 @@
+import hashlib
+import json
+import os
+
+COMMAND_HASH_FILE = 'command_sync.json'  # application_id -> 마지막으로 sync 한 명령어 정의의 해시
+
+
+def command_hash(tree):
+    """트리에 등록된 전역 명령어 정의(이름, 설명, 인자, 기본 권한 등)의 sha256."""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()),
+                     key=lambda command: (command.get('type', 1), command['name']))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+async def sync_if_changed(tree, application_id, path=COMMAND_HASH_FILE):
+    """명령어 정의가 마지막 sync 때와 다를 때만 ``tree.sync()`` 를 부른다. sync 했으면 True.
+
+    전역 명령어 sync 는 횟수 제한이 빡빡하므로 재시작할 때마다 부르지 않는다.
+    디스코드 쪽에서 명령어가 어긋났으면 path 파일을 지우고 다시 시작하면 된다.
+    """
+    digest = command_hash(tree)
+    try:
+        with open(path, encoding='utf-8') as f:
+            synced = json.load(f)
+    except (FileNotFoundError, ValueError):
+        synced = {}
+    key = str(application_id)
+    if synced.get(key) == digest:
+        return False
+    await tree.sync()
+    synced[key] = digest
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(synced, f)
+    os.replace(path + '.tmp', path)
+    return True
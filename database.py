@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+DB_PATH = 'points.db'
+
+# 커넥션을 열 때 한 번 적용하는 PRAGMA. WAL 에서는 synchronous=NORMAL 이어도 커밋이 깨지지 않는다
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),      # 16MB
+    ('mmap_size', 268435456),    # 256MB
+    ('temp_store', 'MEMORY'),
+)
+
+_NOT_FETCHED = object()
+
+
+class Database:
+    """points.db 전용 워커 스레드 하나가 영구 커넥션을 소유하고 모든 작업을 순서대로 실행한다.
+
+    작업은 ``fn(conn, *args)`` 형태의 일반 함수이며, 코루틴에서는 ``await db.run(fn, ...)``,
+    스크립트에서는 ``db.run_sync(fn, ...)`` 로 호출한다. 한 작업이 끝났는데 커밋되지 않은
+    트랜잭션이 남아 있으면 롤백하므로 작업 하나가 곧 트랜잭션 하나다.
+
+    ``listeners`` 에 등록한 함수는 작업이 끝날 때마다 ``listener(fn, wait, elapsed, rows, error)`` 로
+    호출된다. wait 는 큐에서 기다린 시간(예전 db_lock 대기), elapsed 는 실행 시간(초),
+    rows 는 작업이 INSERT/UPDATE/DELETE 한 행 수이며,
+    작업을 요청한 쪽의 contextvars 컨텍스트 안에서 워커 스레드가 호출한다.
+
+    ``run_grouped`` 로 들어온 작업은 ``group_window`` 초 안에 이어서 들어온 다른 묶음 작업과
+    함께 한 트랜잭션으로 커밋되어 fsync 를 한 번만 한다.
+
+    ``read`` 로 들어온 작업은 쓰기 워커가 아니라 ``readers`` 개의 읽기 전용 커넥션 풀에서 실행된다.
+    WAL 에서는 읽기가 마지막으로 커밋된 스냅샷을 보므로 긴 정산이 돌고 있어도 기다리지 않는다.
+    """
+
+    def __init__(self, path=DB_PATH, pragmas=DEFAULT_PRAGMAS, group_window=0.002, max_group_size=256, readers=4):
+        self.path = path
+        self.pragmas = pragmas
+        self.group_window = group_window
+        self.max_group_size = max_group_size
+        self.readers = readers
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._read_pool = None
+        self._read_local = threading.local()
+        self._read_conns = []
+        self._read_conns_lock = threading.Lock()
+        self.listeners = []
+        # 묶음 커밋이 실패했을 때 메모리 캐시를 디스크 상태로 되돌리는 함수들: fn(conn)
+        self.resync_hooks = []
+
+    def start(self):
+        if self._thread is not None:
+            return
+        ready = Future()
+        self._thread = threading.Thread(target=self._worker, args=(ready,), name='db-worker', daemon=True)
+        self._thread.start()
+        ready.result()
+        if self.readers:
+            self._read_pool = ThreadPoolExecutor(self.readers, thread_name_prefix='db-reader')
+
+    def close(self):
+        if self._thread is None:
+            return
+        if self._read_pool is not None:
+            self._read_pool.shutdown(wait=True)
+            self._read_pool = None
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns = []
+        self._jobs.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _read_connection(self):
+        # 읽기 스레드마다 하나씩, 처음 쓸 때 연다. journal_mode 는 쓰기 커넥션이 이미 WAL 로 바꿔 두었다
+        conn = getattr(self._read_local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=30, check_same_thread=False)
+            for name, value in self.pragmas:
+                if name != 'journal_mode':
+                    conn.execute(f'PRAGMA {name} = {value}')
+            conn.execute('PRAGMA query_only = 1')
+            self._read_local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
+
+    def _run_read(self, fn, args, context, submitted):
+        conn = self._read_connection()
+        started = time.perf_counter()
+        error = None
+        try:
+            return context.run(fn, conn, *args)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # 읽기 트랜잭션을 끝내야 다음 읽기가 새 스냅샷을 본다
+            if conn.in_transaction:
+                conn.rollback()
+            finished = time.perf_counter()
+            for listener in self.listeners:
+                try:
+                    context.run(listener, fn, started - submitted, finished - started, 0, error)
+                except Exception:
+                    log.exception('db listener %r failed', listener)
+
+    def _worker(self, ready):
+        try:
+            conn = self._connect()
+        except BaseException as e:
+            ready.set_exception(e)
+            return
+        ready.set_result(None)
+
+        job = self._jobs.get()
+        while job is not None:
+            if not job[5]:
+                self._run_job(conn, job)
+                job = self._jobs.get()
+                continue
+
+            # group_window 안에 연달아 들어온 묶음 작업을 모아서 한 트랜잭션으로 커밋한다
+            group = [job]
+            job = _NOT_FETCHED
+            deadline = time.perf_counter() + self.group_window
+            while len(group) < self.max_group_size:
+                try:
+                    next_job = self._jobs.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if next_job is None or not next_job[5]:
+                    job = next_job
+                    break
+                group.append(next_job)
+            self._run_group(conn, group)
+            if job is _NOT_FETCHED:
+                job = self._jobs.get()
+        conn.close()
+
+    def _run_job(self, conn, job):
+        future, fn, args, context, submitted, grouped = job
+        if not future.set_running_or_notify_cancel():
+            return
+        started = time.perf_counter()
+        changes = conn.total_changes
+        error = None
+        result = None
+        try:
+            result = context.run(fn, conn, *args)
+        except BaseException as e:
+            error = e
+        # 실패했거나 커밋하지 않고 return 한 작업은 커넥션을 닫았을 때처럼 버린다
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except Exception as e:
+                log.exception('db rollback failed')
+                if error is None:
+                    result, error = None, e
+        self._finish(job, started, time.perf_counter(), conn.total_changes - changes, result, error)
+
+    def _run_group(self, conn, group):
+        savepoint = _SavepointConnection(conn)
+        done = []  # [job, started, finished, rows, result, error]
+        remaining = iter(group)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for job in remaining:
+                future, fn, args, context, submitted, grouped = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                entry = [job, time.perf_counter(), None, 0, None, None]
+                done.append(entry)
+                changes = conn.total_changes
+                conn.execute('SAVEPOINT job')
+                try:
+                    entry[4] = context.run(fn, savepoint, *args)
+                except BaseException as e:
+                    entry[5] = e
+                # 작업이 commit() 하지 않은 부분은 버린다
+                conn.execute('ROLLBACK TO SAVEPOINT job')
+                conn.execute('RELEASE SAVEPOINT job')
+                entry[2] = time.perf_counter()
+                entry[3] = conn.total_changes - changes
+            conn.commit()
+        except BaseException as e:
+            # BEGIN(잠금 대기 시간 초과 등), SAVEPOINT, COMMIT 중 하나라도 실패하면 묶음 전체가 실패한다.
+            # 워커 스레드는 계속 살아서 다음 작업을 처리한다
+            self._recover(conn)
+            finished = time.perf_counter()
+            for job in remaining:
+                if job[0].set_running_or_notify_cancel():
+                    done.append([job, finished, finished, 0, None, None])
+            for entry in done:
+                if entry[2] is None:
+                    entry[2] = finished
+                entry[4], entry[5] = None, e
+        for job, started, finished, rows, result, error in done:
+            self._finish(job, started, finished, rows, result, error)
+
+    def _recover(self, conn):
+        # 트랜잭션을 버리고 메모리 캐시를 디스크 상태로 되돌린다
+        try:
+            conn.rollback()
+        except Exception:
+            log.exception('db rollback failed')
+        for hook in self.resync_hooks:
+            try:
+                hook(conn)
+            except Exception:
+                log.exception('db resync hook %r failed', hook)
+
+    def _finish(self, job, started, finished, rows, result, error):
+        future, fn, args, context, submitted, grouped = job
+        for listener in self.listeners:
+            try:
+                context.run(listener, fn, started - submitted, finished - started, rows, error)
+            except Exception:
+                log.exception('db listener %r failed', listener)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def submit(self, fn, *args, grouped=False):
+        if self._thread is None:
+            raise RuntimeError('Database is not started')
+        future = Future()
+        self._jobs.put((future, fn, args, contextvars.copy_context(), time.perf_counter(), grouped))
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    async def run_grouped(self, fn, *args):
+        """run 과 같지만, 짧은 시간 안에 함께 들어온 다른 run_grouped 작업과 한 트랜잭션으로
+        커밋된다(그룹 커밋). 각 작업은 SAVEPOINT 로 분리되어 자기 결과와 예외를 따로 받는다."""
+        return await asyncio.wrap_future(self.submit(fn, *args, grouped=True))
+
+    def run_sync(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    async def read(self, fn, *args):
+        """읽기만 하는 작업을 읽기 전용 커넥션에서 실행한다. 쓰기 워커 큐를 거치지 않으므로
+        앞선 쓰기 작업을 기다리지 않으며, 이미 커밋된 결과까지만 본다."""
+        if self._read_pool is None:
+            return await self.run(fn, *args)
+        context = contextvars.copy_context()
+        future = self._read_pool.submit(self._run_read, fn, args, context, time.perf_counter())
+        return await asyncio.wrap_future(future)
+
+
+class _SavepointConnection:
+    # 그룹 커밋 중인 작업에 넘기는 커넥션. commit/rollback 이 작업의 SAVEPOINT 에만 적용된다
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        self._conn.execute('RELEASE SAVEPOINT job')
+        self._conn.execute('SAVEPOINT job')
+
+    def rollback(self):
+        self._conn.execute('ROLLBACK TO SAVEPOINT job')
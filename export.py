@@ -0,0 +1,233 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CHUNK_SIZE = 5000
+STATE_FILE = 'export_state.json'
+
+# (이름, [(컬럼, 타입)], 읽을 테이블들, 증분). 보관된 경기/베팅도 함께 내보낸다.
+# 증분은 (상태 파일의 키, 기준 컬럼, 읽을 테이블들) 이고 None 이면 매번 전체를 내보낸다.
+# 경기는 정산 전에는 결과/배당이 바뀌므로 증분에서는 정산되어 보관된 경기만 보관 순서대로 한 번씩 내보낸다
+EXPORTS = (
+    ('bets',
+     [('bet_id', 'int'), ('user_id', 'str'), ('match_id', 'int'), ('team', 'str'), ('amount', 'int'), ('timestamp', 'str')],
+     ('bets', 'bets_archive'),
+     ('bets', 'bet_id', ('bets', 'bets_archive'))),
+    ('matches',
+     [('match_id', 'int'), ('match_name', 'str'), ('team1', 'str'), ('team2', 'str'), ('date', 'str'), ('result', 'str'),
+      ('team1_dividend', 'float'), ('team2_dividend', 'float'), ('closed', 'int'),
+      ('team1_total_bet', 'int'), ('team2_total_bet', 'int')],
+     ('matches', 'matches_archive'),
+     ('matches_archive_seq', 'archive_seq', ('matches_archive',))),
+    ('users', [('user_id', 'str'), ('points', 'int')], ('users',), None),
+    ('records',
+     [('user_id', 'str'), ('wins', 'int'), ('losses', 'int'), ('mmr', 'int'), ('streak', 'int')],
+     ('records',), None),
+)
+
+
+class CsvWriter:
+    extension = 'csv'
+
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, kind in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlWriter:
+    extension = 'jsonl'
+
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.names = [name for name, kind in columns]
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(dict(zip(self.names, row)), ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    extension = 'parquet'
+
+    def __init__(self, path, columns):
+        types = {'int': pyarrow.int64(), 'str': pyarrow.string(), 'float': pyarrow.float64()}
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        # 청크 하나가 row group 하나가 된다
+        columns = list(zip(*rows))
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'parquet': ParquetWriter}
+
+
+def load_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(out_dir, state):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def output_path(out_dir, name, stamp, fmt):
+    return os.path.join(out_dir, f'{name}-{stamp}.{WRITERS[fmt].extension}')
+
+
+def unique_stamp(out_dir, formats):
+    # 같은 초에 여러 번 내보내도 앞선 파일을 덮어쓰지 않도록 마이크로초까지 쓰고, 그래도 겹치면 번호를 붙인다
+    base = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    stamp, n = base, 0
+    while any(os.path.exists(output_path(out_dir, name, stamp, fmt)) for name, *_ in EXPORTS for fmt in formats):
+        n += 1
+        stamp = f'{base}-{n}'
+    return stamp
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def export_table(cursor, out_dir, stamp, formats, name, columns, tables, key=None, since=None):
+    """테이블 하나를 CHUNK_SIZE 행씩 읽어 형식마다 .part 파일 하나로 쓴다. key 가 있으면 key > since 인 행만 읽는다.
+    (행 수, 가장 큰 key 값, 완성된 파일 경로들) 을 돌려준다. .part 를 완성된 이름으로 바꾸는 것은 export 가 한다."""
+    names = [column for column, kind in columns]
+    # 기준 컬럼이 내보내는 컬럼이 아니면 끝에 붙여 읽고 쓰기 전에 뗀다
+    extra_key = key is not None and key not in names
+    select = ', '.join(names + [key] if extra_key else names)
+    where = f' WHERE {key} > ?' if key and since is not None else ''
+    query = ' UNION ALL '.join(f'SELECT {select} FROM {table}{where}' for table in tables)
+    cursor.execute(query, (since,) * len(tables) if where else ())
+
+    paths = [output_path(out_dir, name, stamp, fmt) for fmt in formats]
+    writers = [WRITERS[fmt](path + '.part', columns) for fmt, path in zip(formats, paths)]
+    key_index = (len(names) if extra_key else names.index(key)) if key else None
+    count = 0
+    last_key = since
+    try:
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            if key_index is not None:
+                chunk_max = max(row[key_index] for row in rows)
+                last_key = chunk_max if last_key is None else max(last_key, chunk_max)
+            if extra_key:
+                rows = [row[:-1] for row in rows]
+            for writer in writers:
+                writer.write(rows)
+            count += len(rows)
+    except BaseException:
+        for writer in writers:
+            writer.close()
+        for path in paths:
+            os.remove(path + '.part')
+        raise
+    for writer in writers:
+        writer.close()
+    return count, last_key, paths
+
+
+def export(db_path, out_dir, formats=('csv', 'jsonl'), incremental=False):
+    """읽기 전용 커넥션의 한 읽기 트랜잭션 안에서 모든 테이블을 내보낸다. WAL 이므로 봇의 쓰기를 막지 않고,
+    내보내는 동안 들어온 쓰기는 보이지 않는 일관된 스냅샷이다. incremental 이면 bets 는 지난 번에 내보낸
+    bet_id 이후만, matches 는 지난 번 이후에 정산되어 보관된 경기만 내보낸다. {이름: 행 수} 를 돌려준다."""
+    if 'parquet' in formats and pyarrow is None:
+        raise RuntimeError('parquet 형식에는 pyarrow 가 필요합니다')
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir) if incremental else {}
+    stamp = unique_stamp(out_dir, formats)
+
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, timeout=30, isolation_level=None)
+    counts = {}
+    new_state = dict(state)
+    paths = []
+    try:
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            for name, columns, tables, incremental_by in EXPORTS:
+                if incremental and incremental_by is not None:
+                    state_key, key, tables = incremental_by
+                    since = state.get(state_key)
+                else:
+                    state_key, key, since = None, None, None
+                counts[name], last_key, table_paths = export_table(cursor, out_dir, stamp, formats, name, columns,
+                                                                   tables, key, since)
+                paths.extend(table_paths)
+                if state_key and last_key is not None:
+                    new_state[state_key] = last_key
+            cursor.execute('COMMIT')
+        finally:
+            conn.close()
+        # 모든 파일을 디스크에 쓴 뒤에 완성된 이름을 붙인다. 같은 이름이 이미 있으면 덮어쓰지 않고 실패한다
+        for path in paths:
+            _fsync(path + '.part')
+        for path in paths:
+            os.link(path + '.part', path)
+    finally:
+        # 중간에 실패해도 반쯤 쓴 파일이 남지 않는다
+        for path in paths:
+            if os.path.exists(path + '.part'):
+                os.remove(path + '.part')
+    # 증분 기준은 모든 파일이 완성된 뒤에만 옮긴다
+    save_state(out_dir, new_state)
+    return counts
+
+
+if __name__ == '__main__':
+    # python export.py [points.db] [-o exports] [--format csv,jsonl,parquet] [--incremental]
+    parser = argparse.ArgumentParser(description='Export points.db tables for analytics')
+    parser.add_argument('db', nargs='?', default='points.db')
+    parser.add_argument('-o', '--out', default='exports')
+    parser.add_argument('--format', default='csv,jsonl', help='쉼표로 구분 (csv, jsonl, parquet)')
+    parser.add_argument('--incremental', action='store_true', help='지난 내보내기 이후의 베팅과 정산된 경기만')
+    args = parser.parse_args()
+    formats = tuple(fmt.strip() for fmt in args.format.split(',') if fmt.strip())
+    unknown = [fmt for fmt in formats if fmt not in WRITERS]
+    if unknown:
+        sys.exit(f'알 수 없는 형식: {", ".join(unknown)}')
+    if 'parquet' in formats and pyarrow is None:
+        sys.exit('parquet 형식에는 pyarrow 가 필요합니다 (pip install pyarrow)')
+    started = time.perf_counter()
+    counts = export(args.db, args.out, formats, args.incremental)
+    print(', '.join(f'{name} {count}행' for name, count in counts.items()) +
+          f' ({time.perf_counter() - started:.2f}s) -> {args.out}')
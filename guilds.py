@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import sqlite3
+
+from archive import archive_all, settled_match_ids
+from backup import backup
+from betting import BettingEngine
+from database import DB_PATH, Database
+from leaderboard import Leaderboard
+from lobbies import LOBBY_TTL, LobbyManager
+from metrics import PhaseTimer
+from migrations import migrate
+from scheduler import BettingScheduler
+from snapshots import load_snapshot, save_snapshot, snapshot_path
+
+log = logging.getLogger(__name__)
+
+GUILD_DB_DIR = 'guilds'  # 서버마다 guilds/<guild_id>.db
+POOL_FLUSH_INTERVAL = 5  # 초마다 바뀐 베팅 총액/배당을 matches 테이블에 기록
+LOBBY_SWEEP_INTERVAL = 10 * 60  # 초마다 오래 쓰이지 않은 내전을 지운다
+DATA_TABLES = ('users', 'records', 'matches', 'matches_archive', 'bets', 'bets_archive', 'teams')
+
+
+def has_data(db_path):
+    """db_path 에 유저/전적/경기/베팅/팀이 하나라도 있으면 True. 파일이 없으면 False."""
+    if not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return any(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is not None
+                   for table in DATA_TABLES if table in tables)
+    finally:
+        conn.close()
+
+
+def adopt_legacy_db(guild_id, db_dir=GUILD_DB_DIR, legacy_path=DB_PATH):
+    """서버별 DB 이전의 points.db 를 guild_id 서버의 DB(guilds/<guild_id>.db)로 옮긴다. 봇이 그 서버의 DB 를
+    열기 전에만 불러야 한다. 원본은 points.db.migrated 로 남긴다. 옮긴 경로를 돌려준다.
+
+    이 서버의 DB 에 이미 데이터가 있으면 어느 쪽을 쓸지 정할 수 없으므로 RuntimeError.
+    """
+    target = os.path.join(db_dir, f'{guild_id}.db')
+    if has_data(target):
+        raise RuntimeError(f'{legacy_path} 와 {target} 에 모두 데이터가 있습니다. '
+                           f'{legacy_path} 를 계속 쓰려면 LEGACY_GUILD_ID 를 {guild_id} 로 정하세요')
+    # 빈 DB 가 남긴 WAL/스냅샷이 옮긴 DB 에 섞이지 않게 지운다
+    for stale in (target + '-wal', target + '-shm', snapshot_path(target)):
+        if os.path.exists(stale):
+            os.remove(stale)
+    backup(legacy_path, db_dir, keep=None, pause=0, name=f'{guild_id}.db')
+    # 다음 시작 때 다시 옮기지 않도록 원본의 이름을 바꾼다
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(legacy_path + suffix):
+            os.replace(legacy_path + suffix, legacy_path + '.migrated' + suffix)
+    if os.path.exists(snapshot_path(legacy_path)):
+        os.remove(snapshot_path(legacy_path))
+    return target
+
+
+class GuildData:
+    """서버 하나의 데이터와 메모리 상태: 자기 DB 파일과 쓰기 워커, 베팅 엔진, 순위표, 마감 스케줄러, 내전 상태.
+
+    서버마다 DB 와 워커가 따로 있으므로 한 서버의 긴 정산이나 몰리는 베팅이 다른 서버의 명령어를
+    기다리게 하지 않고, 같은 이름의 내전이나 같은 경기 번호도 서버끼리 섞이지 않는다.
+    """
+
+    def __init__(self, guild_id, path, readers=2, lobby_ttl=LOBBY_TTL):
+        self.guild_id = guild_id
+        self.db = Database(path, readers=readers)
+        self.betting = BettingEngine()
+        self.db.resync_hooks.append(self.betting.load)
+        self.leaderboard = Leaderboard()
+        self.scheduler = BettingScheduler(self.db, self.betting)
+        self.lobbies = LobbyManager(lobby_ttl)
+        self.db.resync_hooks.append(self.lobbies.load)
+        self._pool_flusher = None
+        self._lobby_sweeper = None
+
+    async def start(self):
+        timer = PhaseTimer()
+        # DB 를 열기 전에 읽는다. 지난번에 깨끗하게 닫힌 뒤로 DB 가 그대로일 때만 쓸 수 있다
+        state = await asyncio.to_thread(load_snapshot, self.db.path)
+        timer.mark('snapshot')
+        self.db.start()
+        # 스키마 마이그레이션과 캐시 적재는 서버마다 프로세스당 한 번만
+        applied = await self.db.run(migrate)
+        timer.mark('migrate')
+        archived = await self.db.run(settled_match_ids)  # 보관하지 못한 채 끝난 경기
+        await archive_all(self.db, archived)
+        timer.mark('archive')
+        if state is not None and not applied and not archived:
+            self.restore(state)
+            timer.mark('restore')
+        else:
+            await self.db.run(self.betting.load)
+            await self.db.run(self.leaderboard.load)
+            await self.db.run(self.lobbies.load)
+            timer.mark('load')
+        await self.scheduler.start()
+        self._pool_flusher = asyncio.create_task(self._flush_pools_periodically())
+        self._lobby_sweeper = asyncio.create_task(self._expire_lobbies_periodically())
+        timer.mark('scheduler')
+        log.info('guild %s ready: %s', self.guild_id, timer)
+
+    def snapshot(self):
+        return {'betting': self.betting.snapshot(), 'leaderboard': self.leaderboard.snapshot(),
+                'lobbies': self.lobbies.snapshot()}
+
+    def restore(self, state):
+        self.betting.restore(state['betting'])
+        self.leaderboard.restore(state['leaderboard'])
+        self.lobbies.restore(state['lobbies'])
+
+    async def close(self):
+        self.scheduler.stop()
+        if self._pool_flusher is not None:
+            self._pool_flusher.cancel()
+            self._pool_flusher = None
+            self._lobby_sweeper.cancel()
+            self._lobby_sweeper = None
+            await self.db.run(self.betting.flush_pools)  # 마지막 주기에 바뀐 배당까지 기록
+            self.db.close()
+            # DB 를 닫아 WAL 이 정리된 뒤에 저장해야 다음 시작 때 지문이 맞는다
+            try:
+                await asyncio.to_thread(save_snapshot, self.db.path, self.snapshot())
+            except Exception:
+                log.exception('failed to save snapshot for guild %s', self.guild_id)
+        else:
+            self.db.close()
+
+    async def _flush_pools_periodically(self):
+        while True:
+            await asyncio.sleep(POOL_FLUSH_INTERVAL)
+            try:
+                await self.db.run(self.betting.flush_pools)
+            except Exception:
+                log.exception('failed to flush betting pools for guild %s', self.guild_id)
+
+    async def _expire_lobbies_periodically(self):
+        while True:
+            await asyncio.sleep(LOBBY_SWEEP_INTERVAL)
+            try:
+                expired = await self.db.run(self.lobbies.expire)
+            except Exception:
+                log.exception('failed to expire lobbies for guild %s', self.guild_id)
+                continue
+            for lobby in expired:
+                for listener in self.lobbies.listeners:
+                    listener(*lobby)
+
+
+class GuildRegistry:
+    """guild_id -> GuildData. 서버의 데이터는 처음 필요할 때 한 번만 만들고 시작한다.
+
+    ``legacy_guild_id`` 서버는 예전처럼 points.db 를 그대로 쓴다. ``setup(data)`` 는 GuildData 를
+    만든 직후, 시작하기 전에 호출되므로 리스너를 붙이는 데 쓴다.
+    """
+
+    def __init__(self, db_dir=GUILD_DB_DIR, legacy_guild_id=None, setup=None, lobby_ttl=LOBBY_TTL):
+        self.db_dir = db_dir
+        self.legacy_guild_id = legacy_guild_id
+        self.setup = setup
+        self.lobby_ttl = lobby_ttl
+        self._guilds = {}  # guild_id -> GuildData 를 돌려주는 시작 작업
+
+    def path_for(self, guild_id):
+        if guild_id == self.legacy_guild_id:
+            return DB_PATH
+        return os.path.join(self.db_dir, f'{guild_id}.db')
+
+    async def get(self, guild_id):
+        task = self._guilds.get(guild_id)
+        if task is None:
+            task = self._guilds[guild_id] = asyncio.ensure_future(self._start(guild_id))
+        # 기다리던 명령어가 취소되어도 시작은 끝까지 진행한다
+        return await asyncio.shield(task)
+
+    async def _start(self, guild_id):
+        os.makedirs(self.db_dir, exist_ok=True)
+        data = GuildData(guild_id, self.path_for(guild_id), lobby_ttl=self.lobby_ttl)
+        if self.setup is not None:
+            self.setup(data)
+        try:
+            await data.start()
+        except BaseException:
+            # 다음 요청 때 처음부터 다시 시작한다
+            self._guilds.pop(guild_id, None)
+            data.scheduler.stop()
+            data.db.close()
+            raise
+        return data
+
+    def started(self):
+        return [task.result() for task in self._guilds.values()
+                if task.done() and not task.cancelled() and task.exception() is None]
+
+    async def close(self):
+        for data in self.started():
+            await data.close()
+        self._guilds.clear()
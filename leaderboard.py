@@ -0,0 +1,79 @@
+from bisect import bisect_left, insort
+
+TIERS = [
+    "Iron IV", "Iron III", "Iron II", "Iron I",
+    "Bronze IV", "Bronze III", "Bronze II", "Bronze I",
+    "Silver IV", "Silver III", "Silver II", "Silver I",
+    "Gold IV", "Gold III", "Gold II", "Gold I",
+    "Platinum IV", "Platinum III", "Platinum II", "Platinum I",
+    "Emerald IV", "Emerald III", "Emerald II", "Emerald I",
+    "Diamond IV", "Diamond III", "Diamond II", "Diamond I",
+    "Master", "Grandmaster", "Challenger"
+]
+
+
+def get_tier(mmr):
+    if mmr < 500:
+        return TIERS[0]
+    elif mmr >= 3400:
+        return TIERS[-1]
+    # 100 mmr per tier
+    return TIERS[(mmr - 500) // 100 + 1]
+
+
+class Leaderboard:
+    """MMR 내림차순으로 정렬된 순위표. records 를 한 번 읽은 뒤에는 MMR 이 바뀔 때마다
+    해당 유저만 다시 끼워 넣는다. 순위 조회는 이진 탐색이다."""
+
+    def __init__(self):
+        self._order = []  # (-mmr, user_id) 오름차순 = MMR 내림차순
+        self._mmr = {}    # user_id -> mmr
+
+    def __len__(self):
+        return len(self._order)
+
+    def load(self, conn):
+        rows = conn.execute('SELECT user_id, mmr FROM records').fetchall()
+        self._mmr = dict(rows)
+        self._order = sorted((-mmr, user_id) for user_id, mmr in rows)
+
+    def snapshot(self):
+        return self._order
+
+    def restore(self, order):
+        # 이미 정렬된 목록이므로 다시 정렬하지 않는다
+        self._order = order
+        self._mmr = {user_id: -neg_mmr for neg_mmr, user_id in order}
+
+    def update(self, user_id, mmr):
+        user_id = str(user_id)
+        old = self._mmr.get(user_id)
+        if old == mmr:
+            return
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, user_id))]
+        self._mmr[user_id] = mmr
+        insort(self._order, (-mmr, user_id))
+
+    def update_many(self, mmrs):
+        for user_id, mmr in mmrs.items():
+            self.update(user_id, mmr)
+
+    def get_mmr(self, user_id):
+        return self._mmr.get(str(user_id))
+
+    def rank(self, user_id):
+        """1부터 시작하는 순위. 같은 MMR 이면 같은 순위를 준다. 기록이 없으면 None."""
+        mmr = self._mmr.get(str(user_id))
+        if mmr is None:
+            return None
+        return bisect_left(self._order, (-mmr,)) + 1
+
+    def page(self, page, page_size):
+        """page 번째(0부터) 페이지의 [(순위, user_id, mmr), ...]"""
+        start = page * page_size
+        return [(self.rank(user_id), user_id, -neg_mmr)
+                for neg_mmr, user_id in self._order[start:start + page_size]]
+
+    def page_count(self, page_size):
+        return max(1, -(-len(self._order) // page_size))
@@ -0,0 +1,214 @@
+from datetime import datetime, timedelta
+
+from rating import record_match_result
+
+LOBBY_TTL = 12 * 60 * 60  # 초. 이 시간 동안 참가/마감 등 아무 변화가 없는 내전은 참가자와 함께 지운다
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _now():
+    return datetime.now().replace(microsecond=0)
+
+
+def _touch(cursor, lobby, now):
+    cursor.execute('UPDATE lobbies SET updated_at = ? WHERE lobby_id = ?', (now.strftime(DATE_FORMAT), lobby.lobby_id))
+
+
+class Lobby:
+    """내전 하나. members: user_id -> 팀 번호(1 또는 2)"""
+
+    __slots__ = ('lobby_id', 'name', 'closed', 'members', 'channel_id', 'message_id', 'updated_at')
+
+    def __init__(self, lobby_id, name, closed, members, channel_id, message_id, updated_at):
+        self.lobby_id = lobby_id
+        self.name = name
+        self.closed = closed
+        self.members = members
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.updated_at = updated_at
+
+    def row(self):
+        return (self.lobby_id, self.name, self.closed, self.members, self.channel_id, self.message_id, self.updated_at)
+
+    def team_size(self, team):
+        return sum(1 for member_team in self.members.values() if member_team == team)
+
+
+class LobbyManager:
+    """서버의 내전 상태(참가 마감 여부, 참가자, 참가 버튼 메시지)를 메모리에 들고 있는 write-through 캐시.
+
+    BettingEngine 처럼 쓰기 메서드는 ``db.run(lobbies.method, ...)`` 으로 db 워커 스레드에서만 실행되고
+    커밋한 뒤에만 캐시를 고친다. /팀, 팀 밸런스, 팀 마감은 DB 를 읽지 않는다.
+    참가 버튼의 custom_id 에는 lobby_id 가 들어가므로 봇을 다시 시작해도 예전 메시지의 버튼이 동작한다.
+    ``ttl`` 초 동안 변화가 없는 내전은 expire 가 지우므로 끝내지 않은 내전이 쌓이지 않는다.
+    """
+
+    def __init__(self, ttl=LOBBY_TTL):
+        self.ttl = ttl
+        self.lobbies = {}    # match_name -> Lobby
+        self.by_id = {}      # lobby_id -> Lobby
+        self.listeners = []  # listener(match_name, channel_id, message_id): 만료된 내전마다 이벤트 루프에서 호출
+
+    def load(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('SELECT lobby_id, match_name, closed, channel_id, message_id, updated_at FROM lobbies')
+        self.lobbies = {name: Lobby(lobby_id, name, bool(closed), {}, channel_id, message_id,
+                                    datetime.strptime(updated_at, DATE_FORMAT))
+                        for lobby_id, name, closed, channel_id, message_id, updated_at in cursor.fetchall()}
+        self.by_id = {lobby.lobby_id: lobby for lobby in self.lobbies.values()}
+
+        cursor.execute('SELECT match_name, user_id, team FROM teams')
+        for name, user_id, team in cursor.fetchall():
+            lobby = self.lobbies.get(name)
+            if lobby is not None:
+                lobby.members[user_id] = team
+
+    def snapshot(self):
+        return [lobby.row() for lobby in self.lobbies.values()]
+
+    def restore(self, rows):
+        self.lobbies = {row[1]: Lobby(*row) for row in rows}
+        self.by_id = {lobby.lobby_id: lobby for lobby in self.lobbies.values()}
+
+    # 읽기 전용: 이벤트 루프에서 바로 호출해도 된다
+    def get(self, lobby_id):
+        return self.by_id.get(lobby_id)
+
+    def members(self, match_name):
+        """[(user_id, team), ...], 없는 내전이면 빈 목록"""
+        lobby = self.lobbies.get(match_name)
+        # list() 는 GIL 을 놓지 않으므로 db 워커가 동시에 참가자를 고쳐도 안전하다
+        return list(lobby.members.items()) if lobby is not None else []
+
+    # 쓰기: db 워커 스레드에서만 호출
+    def open(self, conn, match_name, channel_id):
+        """내전을 (다시) 열고 lobby_id 를 돌려준다. 이미 있던 참가자는 그대로 둔다."""
+        now = _now()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO lobbies (match_name, closed, channel_id, updated_at) VALUES (?, 0, ?, ?)
+            ON CONFLICT(match_name) DO UPDATE SET
+                closed = 0, channel_id = excluded.channel_id, updated_at = excluded.updated_at
+            RETURNING lobby_id
+        ''', (match_name, channel_id, now.strftime(DATE_FORMAT)))
+        lobby_id = cursor.fetchone()[0]
+        conn.commit()
+
+        lobby = self.lobbies.get(match_name)
+        if lobby is None:
+            lobby = Lobby(lobby_id, match_name, False, {}, channel_id, None, now)
+            self.lobbies[match_name] = self.by_id[lobby_id] = lobby
+        else:
+            lobby.closed, lobby.channel_id, lobby.updated_at = False, channel_id, now
+        return lobby_id
+
+    def set_message(self, conn, lobby_id, message_id):
+        lobby = self.by_id.get(lobby_id)
+        if lobby is None:
+            return
+        conn.execute('UPDATE lobbies SET message_id = ? WHERE lobby_id = ?', (message_id, lobby_id))
+        conn.commit()
+        lobby.message_id = message_id
+
+    def join(self, conn, lobby_id, user_id, team):
+        """참가 버튼. 없거나 마감된 내전이면 None, 아니면 (내전 이름, 참가한 뒤의 그 팀 인원 수)"""
+        lobby = self.by_id.get(lobby_id)
+        if lobby is None or lobby.closed:
+            return None
+        self._set_member(conn, lobby, str(user_id), team)
+        return lobby.name, lobby.team_size(team)
+
+    def add(self, conn, match_name, user_id, team):
+        # 관리자의 팀원 추가는 마감 여부와 상관없다. 개설하지 않은 내전이면 마감된 내전으로 만든다
+        lobby = self.lobbies.get(match_name)
+        if lobby is None:
+            now = _now()
+            cursor = conn.execute('INSERT INTO lobbies (match_name, closed, updated_at) VALUES (?, 1, ?) RETURNING lobby_id',
+                                  (match_name, now.strftime(DATE_FORMAT)))
+            lobby = Lobby(cursor.fetchone()[0], match_name, True, {}, None, None, now)
+        self._set_member(conn, lobby, str(user_id), team)
+        self.lobbies[match_name] = self.by_id[lobby.lobby_id] = lobby
+
+    def _set_member(self, conn, lobby, user_id, team):
+        now = _now()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO teams (match_name, user_id, team)
+            VALUES (?, ?, ?)
+            ON CONFLICT(match_name, user_id) DO UPDATE SET team = excluded.team
+        ''', (lobby.name, user_id, team))
+        _touch(cursor, lobby, now)
+        conn.commit()
+        lobby.members[user_id] = team
+        lobby.updated_at = now
+
+    def remove(self, conn, match_name, user_id):
+        """빠진 인원 수(0 또는 1)"""
+        user_id = str(user_id)
+        lobby = self.lobbies.get(match_name)
+        if lobby is None or user_id not in lobby.members:
+            return 0
+        now = _now()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM teams WHERE match_name = ? AND user_id = ?', (match_name, user_id))
+        _touch(cursor, lobby, now)
+        conn.commit()
+        del lobby.members[user_id]
+        lobby.updated_at = now
+        return 1
+
+    def assign(self, conn, match_name, team1_ids, team2_ids):
+        lobby = self.lobbies.get(match_name)
+        if lobby is None:
+            return
+        teams = {user_id: 1 for user_id in team1_ids}
+        teams.update((user_id, 2) for user_id in team2_ids)
+        now = _now()
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE teams SET team = ? WHERE match_name = ? AND user_id = ?',
+                           [(team, match_name, user_id) for user_id, team in teams.items()])
+        _touch(cursor, lobby, now)
+        conn.commit()
+        for user_id, team in teams.items():
+            if user_id in lobby.members:
+                lobby.members[user_id] = team
+        lobby.updated_at = now
+
+    def close(self, conn, match_name):
+        lobby = self.lobbies.get(match_name)
+        if lobby is None or lobby.closed:
+            return
+        now = _now()
+        conn.execute('UPDATE lobbies SET closed = 1, updated_at = ? WHERE lobby_id = ?',
+                     (now.strftime(DATE_FORMAT), lobby.lobby_id))
+        conn.commit()
+        lobby.closed = True
+        lobby.updated_at = now
+
+    def end(self, conn, match_name, winning_team):
+        """승패를 기록하고 내전을 지운다. {user_id: 새 MMR}"""
+        conn.execute('DELETE FROM lobbies WHERE match_name = ?', (match_name,))
+        new_mmrs = record_match_result(conn, match_name, winning_team)  # teams 삭제와 함께 한 트랜잭션으로 커밋
+        self._forget(match_name)
+        return new_mmrs
+
+    def expire(self, conn, now=None):
+        """ttl 동안 변화가 없는 내전을 참가자와 함께 지운다. [(내전 이름, 채널 ID, 메시지 ID), ...]"""
+        cutoff = (now or datetime.now()) - timedelta(seconds=self.ttl)
+        expired = [lobby for lobby in self.lobbies.values() if lobby.updated_at < cutoff]
+        if not expired:
+            return []
+        names = [(lobby.name,) for lobby in expired]
+        cursor = conn.cursor()
+        cursor.executemany('DELETE FROM teams WHERE match_name = ?', names)
+        cursor.executemany('DELETE FROM lobbies WHERE match_name = ?', names)
+        conn.commit()
+        for lobby in expired:
+            self._forget(lobby.name)
+        return [(lobby.name, lobby.channel_id, lobby.message_id) for lobby in expired]
+
+    def _forget(self, match_name):
+        lobby = self.lobbies.pop(match_name, None)
+        if lobby is not None:
+            self.by_id.pop(lobby.lobby_id, None)
@@ -1,480 +1,406 @@
 import discord
 from discord import app_commands
 from discord.ui import Button, View
-import sqlite3
-from datetime import datetime, timedelta
-from tokenDiscord import TOKEN
-from threading import Lock
+from datetime import datetime
 import asyncio
-
-MAX_TOTAL_BET_PER_USER = 500000
-CANCELATION_WINDOW = timedelta(minutes=5)
-team_closed = {}  # 팀 참가 마감 상태를 관리하는 변수
-BASE_MMR = 1600  # 기본 MMR 값 골드4
-MMR_CHANGE = 50
+import os
+import services
+from balance import average_gap
+from commandsync import sync_if_changed
+from database import DB_PATH
+from guilds import GuildRegistry, adopt_legacy_db, has_data
+from members import MemberCache
+from rating import BASE_MMR
+from leaderboard import get_tier
+from metrics import Metrics, MetricsServer, InstrumentedCommandTree, PhaseTimer
+from oddsboard import OddsBoard
+from outbound import Outbox, PayoutNotifier
+from workers import WorkerPool
+from betting import (MAX_TOTAL_BET_PER_USER, INVALID_AMOUNT, NO_MATCH,
+                     INVALID_TEAM, INSUFFICIENT_POINTS)
+
+METRICS_PORT = 9108  # http://127.0.0.1:9108/metrics (Prometheus)
+WINNER_NOTIFY_MODE = 'dm'  # 'dm': 당첨자마다 DM, 'digest': 경기 채널에 요약 한 번
+EXPORT_DIR = 'exports'  # /export 결과를 쓰는 디렉터리 (서버마다 exports/<guild_id>)
+BACKUP_INTERVAL = 6 * 60 * 60  # 자동 백업 주기(초). 백업은 backups/ 에 DB 파일마다 최근 7개만 남는다
+# 서버별 DB 이전부터 쓰던 서버 ID. 이 서버는 points.db 를 그대로 쓴다. None 이고 points.db 에 데이터가 있으면
+# 봇이 한 서버에만 있을 때는 시작할 때 그 서버의 DB 로 옮기고, 여러 서버에 있으면 시작하지 않는다
+LEGACY_GUILD_ID = None
+# 0: 명령어를 봇 프로세스에서 바로 처리한다.
+# 1 이상: 봇 프로세스는 상호작용에 defer 로 응답만 하고 DB 작업은 이 수만큼의 워커 프로세스가 처리한다
+WORKER_PROCESSES = 0
+LOBBY_TTL = 12 * 60 * 60  # 초. 이 시간 동안 참가/마감 등 아무 변화가 없는 내전은 지운다
+metrics = Metrics()
 
 # Intents
 intents = discord.Intents.default()
 intents.message_content = True
+# on_member_join/update/remove 로 멤버 이름 캐시를 갱신한다. 개발자 포털(Bot > Privileged Gateway Intents)에서
+# SERVER MEMBERS INTENT 도 켜야 한다
+intents.members = True
 
-# Initialize bot
-class MyBot(discord.Client):
+# Initialize bot (샤드 수는 Discord 가 권장하는 값으로 자동 결정)
+class MyBot(discord.AutoShardedClient):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.tree = discord.app_commands.CommandTree(self)
-        self.team_lock = asyncio.Lock()  # Lock 초기화
+        self.tree = InstrumentedCommandTree(self, metrics)
+        self.backup_task = None
 
     async def setup_hook(self):
-        await self.tree.sync()
-
-bot = MyBot(intents=intents)
-
-# Database lock
-db_lock = Lock()
-
-# Singleton database connection
-def get_db_connection():
-    conn = sqlite3.connect('points.db', timeout=30)
-    return conn
-
-# Database interaction functions
-def initialize_database():
-    conn = sqlite3.connect('points.db')
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        user_id TEXT PRIMARY KEY,
-        points INTEGER DEFAULT 0
-    )
-    ''')
-
-    # Create matches table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS matches (
-        match_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        match_name TEXT NOT NULL,
-        team1 TEXT NOT NULL,
-        team2 TEXT NOT NULL,
-        date TIMESTAMP NOT NULL,
-        result TEXT,
-        team1_dividend REAL DEFAULT 1.0,
-        team2_dividend REAL DEFAULT 1.0,
-        closed INTEGER DEFAULT 0,
-        team1_total_bet INTEGER DEFAULT 0,
-        team2_total_bet INTEGER DEFAULT 0
-    )
-    ''')
-
-    # Create bets table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS bets (
-        bet_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT NOT NULL,
-        match_id INTEGER NOT NULL,
-        team TEXT NOT NULL,
-        amount INTEGER NOT NULL,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (match_id) REFERENCES matches(match_id)
-    )
-    ''')
-
-    # Create teams table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS teams (
-        match_name TEXT,
-        user_id TEXT,
-        team INTEGER,
-        PRIMARY KEY (match_name, user_id)
-    )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS records (
-            user_id TEXT PRIMARY KEY,
-            wins INTEGER DEFAULT 0,
-            losses INTEGER DEFAULT 0,
-            mmr INTEGER DEFAULT 1600,
-            streak INTEGER DEFAULT 0
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
-
-def add_match(match_name, team1, team2, date):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO matches (match_name, team1, team2, date, team1_dividend, team2_dividend)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (match_name, team1, team2, date, 1.0, 1.0))
-        conn.commit()
-
-def get_matches():
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM matches WHERE result IS NULL')
-        matches = cursor.fetchall()
-        return matches
-
-def place_bet(user_id, match_id, team, amount):
-    if is_betting_closed(match_id):
-        return False
-
-    # Check total bets by this user on this match
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT SUM(amount) FROM bets WHERE user_id = ? AND match_id = ?', (user_id, match_id))
-        total_bet_by_user = cursor.fetchone()[0] or 0
-
-    if total_bet_by_user + amount > MAX_TOTAL_BET_PER_USER:
-        return False, None  # Total bet exceeds limit
-    
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Fetch the team names and check if the match exists
-        cursor.execute('SELECT team1, team2 FROM matches WHERE match_id = ?', (match_id,))
-        match = cursor.fetchone()
-        if not match:
-            return False
-        
-        team1, team2 = match
-        
-        # Insert the bet
-        cursor.execute('''
-        INSERT INTO bets (user_id, match_id, team, amount, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, match_id, team, amount, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-
-        # Get the inserted bet_id
-        bet_id = cursor.lastrowid
-        
-        # Update total bet amounts
-        if team == team1:
-            cursor.execute('UPDATE matches SET team1_total_bet = team1_total_bet + ? WHERE match_id = ?', (amount, match_id))
-        elif team == team2:
-            cursor.execute('UPDATE matches SET team2_total_bet = team2_total_bet + ? WHERE match_id = ?', (amount, match_id))
-        else:
-            return False
-        
-        # Update dividends
-        cursor.execute('SELECT team1_total_bet, team2_total_bet FROM matches WHERE match_id = ?', (match_id,))
-        totals = cursor.fetchone()
-        if not totals:
-            return False
-
-        team1_total_bet, team2_total_bet = totals
-        total_bet = team1_total_bet + team2_total_bet
-
-        if total_bet == 0:
-            return False
-
-        team1_dividend = total_bet / team1_total_bet if team1_total_bet > 0 else 1.0
-        team2_dividend = total_bet / team2_total_bet if team2_total_bet > 0 else 1.0
-
-        # 소숫점 둘째 자리 까지 반올림
-        team1_dividend = round(team1_dividend, 2)
-        team2_dividend = round(team2_dividend, 2)
-
-        cursor.execute('UPDATE matches SET team1_dividend = ?, team2_dividend = ? WHERE match_id = ?',
-                       (team1_dividend, team2_dividend, match_id))
-        
-        conn.commit()
-        return True, bet_id
-
-def get_user_points(user_id):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT points FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        return result[0] if result else 0
-
-def set_user_points(user_id, points):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('INSERT OR REPLACE INTO users (user_id, points) VALUES (?, ?)', (user_id, points))
-        conn.commit()
-
-def close_match(match_id, winning_team):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Update the match result
-        cursor.execute('UPDATE matches SET result = ? WHERE match_id = ?', (winning_team, match_id,))
-        
-        # Get the match details
-        cursor.execute('SELECT team1, team2, team1_dividend, team2_dividend FROM matches WHERE match_id = ?', (match_id,))
-        match = cursor.fetchone()
-        
-        if not match:
-            return
-        
-        team1, team2, team1_dividend, team2_dividend = match
-        winning_dividend = team1_dividend if winning_team == team1 else team2_dividend
-        
-        # Get all bets on the match
-        cursor.execute('SELECT user_id, team, amount FROM bets WHERE match_id = ?', (match_id,))
-        bets = cursor.fetchall()
-        
-        # Fetch current points for all users with bets on the match
-        user_points = {}
-        for bet in bets:
-            user_id, team, amount = bet
-            if user_id not in user_points:
-                cursor.execute('SELECT points FROM users WHERE user_id = ?', (user_id,))
-                result = cursor.fetchone()
-                user_points[user_id] = result[0] if result else 0
-        
-        # Calculate winnings and update points
-        for bet in bets:
-            user_id, team, amount = bet
-            if team == winning_team:
-                winnings = amount * winning_dividend * 0.95
-                winnings = round(winnings)
-                user_points[user_id] += winnings
-        
-        # Update user points in a single transaction
-        for user_id, points in user_points.items():
-            cursor.execute('INSERT OR REPLACE INTO users (user_id, points) VALUES (?, ?)', (user_id, points))
-        
-        # Close betting for the match
-        cursor.execute('UPDATE matches SET closed = 1 WHERE match_id = ?', (match_id,))
-        conn.commit()
-
-def get_match_result(match_id):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT match_name, team1, team2, result FROM matches WHERE match_id = ?', (match_id,))
-        match = cursor.fetchone()
-        return match
-
-def close_betting(match_id):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('UPDATE matches SET closed = 1 WHERE match_id = ?', (match_id,))
-        conn.commit()
-
-def open_betting(match_id):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('UPDATE matches SET closed = 0 WHERE match_id = ?', (match_id,))
-        conn.commit()
-
-def is_betting_closed(match_id):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT closed FROM matches WHERE match_id = ?', (match_id,))
-        result = cursor.fetchone()
-        return result[0] == 1 if result else False
-
-def cancel_bet(user_id, bet_id):
-    with db_lock, get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Retrieve the bet details
-        cursor.execute('SELECT match_id, team, amount, timestamp FROM bets WHERE bet_id = ? AND user_id = ?', (bet_id, user_id))
-        bet = cursor.fetchone()
-        if not bet:
-            return False
-        
-        match_id, team, amount, bet_timestamp = bet
-
-         # Check if the cancellation window has passed
-        if datetime.now() - datetime.strptime(bet_timestamp, '%Y-%m-%d %H:%M:%S') > CANCELATION_WINDOW:
-            return False  # Cancellation window has passed
-
-        # Check if betting is closed for the match
-        cursor.execute('SELECT team1, team2, closed FROM matches WHERE match_id = ?', (match_id,))
-        match = cursor.fetchone()
-        team1, team2, closed = match
-        if closed:
-            return False
-
-        # Remove the bet
-        cursor.execute('DELETE FROM bets WHERE bet_id = ? AND user_id = ?', (bet_id, user_id))
-        
-        # Update total bet amounts
-        if team == team1:
-            cursor.execute('UPDATE matches SET team1_total_bet = team1_total_bet - ? WHERE match_id = ?', (amount, match_id))
-        if team == team2:
-            cursor.execute('UPDATE matches SET team2_total_bet = team2_total_bet - ? WHERE match_id = ?', (amount, match_id))
-
-        # Refund the user points
-        cursor.execute('SELECT points FROM users WHERE user_id = ?', (user_id,))
-        user_points = cursor.fetchone()[0]
-        updated_points = user_points + amount
-        cursor.execute('UPDATE users SET points = ? WHERE user_id = ?', (updated_points, user_id))
-
-        # Update dividends
-        cursor.execute('SELECT team1_total_bet, team2_total_bet FROM matches WHERE match_id = ?', (match_id,))
-        totals = cursor.fetchone()
-        if not totals:
-            return False
-        
-        team1_total_bet, team2_total_bet = totals
-        total_bet = team1_total_bet + team2_total_bet
-
-        if total_bet == 0:
-            return False
-        
-        team1_dividend = total_bet / team1_total_bet if team1_total_bet > 0 else 1.0
-        team2_dividend = total_bet / team2_total_bet if team2_total_bet > 0 else 1.0
-
-        cursor.execute('UPDATE matches SET team1_dividend = ?, team2_dividend = ? WHERE match_id = ?', (team1_dividend, team2_dividend, match_id))
-        
-        conn.commit()
-        return True
+        # 서버별 DB 는 서버가 연결되거나 처음 명령어가 올 때 연다 (call_guild)
+        timer = PhaseTimer()
+        # 서버의 DB 를 열기 전에 (워커도 열 수 있으므로 워커를 띄우기 전에)
+        await adopt_legacy_database(self)
+        timer.mark('legacy db')
+        if workers is not None:
+            workers.start()
+            timer.mark('workers')
+        self.backup_task = asyncio.create_task(backup_periodically())
+        # 예전 내전 메시지의 참가 버튼도 custom_id 로 다시 연결된다
+        self.add_dynamic_items(LobbyJoinButton)
+        await metrics_server.start()
+        timer.mark('metrics')
+        # 명령어 정의가 바뀌었을 때만 sync (전역 sync 는 횟수 제한이 있다)
+        synced = await sync_if_changed(self.tree, self.application_id)
+        timer.mark('command sync' if synced else 'command sync (변경 없음, 건너뜀)')
+        print(f'시작 준비 완료: {timer}')
+
+    async def close(self):
+        if self.backup_task is not None:
+            self.backup_task.cancel()
+            self.backup_task = None
+        for board in odds_boards.values():
+            board.stop()
+        await metrics_server.stop()
+        await notifier.close()
+        await outbox.close()
+        await super().close()
+        if workers is not None:
+            await workers.close()
+        await guilds.close()
+
+# 멤버 목록 전체는 시작할 때 받지 않는다. 필요한 멤버만 MemberCache 가 query_members 로 가져온다
+bot = MyBot(intents=intents, chunk_guilds_at_startup=False)
+
+# 배당판은 채널 메시지를 고치므로 워커 모드에서도 봇 프로세스에 있다
+odds_boards = {}  # guild_id -> OddsBoard
+
+def odds_board_for(guild_id):
+    board = odds_boards.get(guild_id)
+    if board is None:
+        board = odds_boards[guild_id] = OddsBoard(lambda: call_guild(guild_id, services.render_odds_board))
+        board.listeners.append(lambda channel_id: on_odds_board_removed(guild_id, channel_id))
+        board.start()
+    return board
+
+async def restore_odds_boards(guild):
+    # 재시작 전에 띄운 배당판을 다시 붙이고 바로 지금 배당으로 고친다. 지워진 메시지는 이 갱신에서 NotFound 로 빠진다
+    board = odds_board_for(guild.id)
+    adopted = False
+    for channel_id, message_id in await call_guild(guild.id, services.odds_board_messages):
+        channel = guild.get_channel_or_thread(channel_id)
+        if channel is None:  # 채널이 지워졌다
+            await call_guild(guild.id, services.remove_odds_board, channel_id)
+            continue
+        adopted |= board.adopt(channel_id, channel.get_partial_message(message_id))
+    if adopted:
+        await board.refresh()
+
+odds_board_removals = set()
+
+def on_odds_board_removed(guild_id, channel_id):
+    task = asyncio.ensure_future(forget_odds_board(guild_id, channel_id))
+    odds_board_removals.add(task)
+    task.add_done_callback(odds_board_removals.discard)
+
+async def forget_odds_board(guild_id, channel_id):
+    try:
+        await call_guild(guild_id, services.remove_odds_board, channel_id)
+    except Exception as e:
+        print(f"배당판 기록 삭제 실패: {e}")
+
+# 서버마다 DB 파일과 쓰기 워커, 베팅 엔진, 순위표가 따로 있다
+def setup_guild(data):
+    data.db.listeners.append(metrics.observe_db)
+    data.betting.listeners.append(odds_board_for(data.guild_id).touch)
+    data.lobbies.listeners.append(on_lobby_expired)
+
+def on_worker_event(guild_id, name, *args):
+    if name == 'odds':
+        odds_board_for(guild_id).touch(*args)
+    elif name == 'lobby_expired':
+        on_lobby_expired(*args)
+
+# 만료된 내전 메시지에서 참가 버튼을 없앤다
+lobby_message_edits = set()
+
+def on_lobby_expired(match_name, channel_id, message_id):
+    task = asyncio.ensure_future(clear_lobby_message(match_name, channel_id, message_id))
+    lobby_message_edits.add(task)
+    task.add_done_callback(lobby_message_edits.discard)
+
+async def clear_lobby_message(match_name, channel_id, message_id):
+    channel = bot.get_channel(channel_id) if channel_id is not None else None
+    if channel is None or message_id is None:
+        return
+    try:
+        await channel.get_partial_message(message_id).edit(
+            content=f"'{match_name}' 내전이 오랫동안 사용되지 않아 닫혔습니다.", view=None)
+    except discord.HTTPException as e:
+        print(f"내전 메시지 수정 실패: {e}")
+
+guilds = GuildRegistry(legacy_guild_id=LEGACY_GUILD_ID, setup=setup_guild, lobby_ttl=LOBBY_TTL)
+workers = (WorkerPool(WORKER_PROCESSES, legacy_guild_id=LEGACY_GUILD_ID, on_event=on_worker_event, lobby_ttl=LOBBY_TTL)
+           if WORKER_PROCESSES else None)
+metrics_server = MetricsServer(metrics, port=METRICS_PORT)
+member_cache = MemberCache()
+outbox = Outbox()  # 명령어 응답이 아닌 채널 알림은 모두 여기로 보낸다
+notifier = PayoutNotifier(bot, outbox, mode=WINNER_NOTIFY_MODE)
+
+async def call_guild(guild_id, fn, *args):
+    # services 의 fn(data, *args) 를 서버 데이터를 가진 곳(이 프로세스 또는 워커)에서 실행한다
+    if workers is not None:
+        return await workers.call(guild_id, fn, *args)
+    return await fn(await guilds.get(guild_id), *args)
+
+async def call(interaction: discord.Interaction, fn, *args, ephemeral=False):
+    # 워커 모드에서는 먼저 defer 해서 3초 응답 기한을 지킨다. 응답은 reply 가 follow-up 으로 보낸다
+    if interaction.guild_id is None:
+        raise app_commands.NoPrivateMessage()
+    if workers is not None and not interaction.response.is_done():
+        await interaction.response.defer(ephemeral=ephemeral)
+    return await call_guild(interaction.guild_id, fn, *args)
+
+async def reply(interaction: discord.Interaction, content, ephemeral=False, **kwargs):
+    # 보낸 메시지의 ID 를 돌려준다
+    if interaction.response.is_done():
+        return (await interaction.followup.send(content, ephemeral=ephemeral, **kwargs)).id
+    return (await interaction.response.send_message(content, ephemeral=ephemeral, **kwargs)).message_id
+
+async def run_backup(guild_id):
+    path, pages, elapsed = await call_guild(guild_id, services.backup_data)
+    print(f'백업 완료: {path} ({pages} pages, {elapsed:.2f}s)')
+    return path, pages, elapsed
+
+async def backup_periodically():
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        for guild in bot.guilds:
+            try:
+                await run_backup(guild.id)
+            except Exception as e:
+                print(f'서버 {guild.id} 백업 실패: {e}')
+
+async def adopt_legacy_database(client):
+    """LEGACY_GUILD_ID 없이 데이터가 든 points.db 가 있으면 봇이 있는 유일한 서버의 DB 로 옮긴다.
+    서버가 하나가 아니면 어느 서버의 데이터인지 알 수 없으므로 시작하지 않는다."""
+    if LEGACY_GUILD_ID is not None or not await asyncio.to_thread(has_data, DB_PATH):
+        return
+    # setup_hook 은 게이트웨이 연결 전이라 client.guilds 가 비어 있으므로 REST 로 묻는다
+    guild_ids = [guild.id async for guild in client.fetch_guilds(limit=2)]
+    if len(guild_ids) != 1:
+        where = '여러 서버에 있어' if guild_ids else '어느 서버에도 없어'
+        raise RuntimeError(f'{DB_PATH} 에 예전 데이터가 있지만 봇이 {where} 어느 서버의 데이터인지 알 수 없습니다. '
+                           f'main.py 의 LEGACY_GUILD_ID 를 그 서버 ID 로 정하고 다시 시작하세요')
+    path = await asyncio.to_thread(adopt_legacy_db, guild_ids[0])
+    print(f'{DB_PATH} 를 서버 {guild_ids[0]} 의 DB 로 옮겼습니다: {path} (원본은 {DB_PATH}.migrated)')
 
 # Bot events
 @bot.event
 async def on_ready():
-    initialize_database()
     print(f'Logged in as {bot.user.name}')
 
+# 서버가 연결되면 그 서버의 DB 를 미리 열어 자동 마감 스케줄이 돌게 하고, 재시작 전에 띄운 배당판을 다시 붙인다
+@bot.event
+async def on_guild_available(guild):
+    await call_guild(guild.id, services.open_guild)
+    await restore_odds_boards(guild)
+
+@bot.event
+async def on_guild_join(guild):
+    await call_guild(guild.id, services.open_guild)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    bot.tree.finish(interaction, command)
+
+# 멤버 이름 캐시는 게이트웨이 이벤트와 상호작용으로 채운다
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    member_cache.put(interaction.user)
+
+@bot.event
+async def on_member_join(member):
+    member_cache.put(member)
+
+@bot.event
+async def on_member_update(before, after):
+    member_cache.put(after)
+
+@bot.event
+async def on_member_remove(member):
+    member_cache.discard(member.guild.id, member.id)
+
 # Bot commands for matches and betting 명령어 수정은 전부 여기서 위는 건들지 말아주세요
 @bot.tree.command(name="addmatch", description="Add a new match")
 @app_commands.checks.has_permissions(administrator=True)
-async def add_match_command(ctx, match_name: str, team1: str, team2: str, date: str):
-    add_match(match_name, team1, team2, datetime.strptime(date, '%Y-%m-%d %H:%M:%S'))
-    await ctx.send(f'***경기: {match_name}*** {team1} vs {team2} 일자: {date} 배당 {1.0} / {1.0} 추가되었습니다.')
+async def add_match_command(interaction: discord.Interaction, match_name: str, team1: str, team2: str, date: str):
+    match_date = datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+    match_id = await call(interaction, services.add_match, match_name, team1, team2, match_date)
+    await reply(interaction, f'***ID: {match_id}, 경기: {match_name}*** {team1} vs {team2} 일자: {date} 배당 {1.0} / {1.0} 추가되었습니다.')
 
 @bot.tree.command(name="경기", description="다가오는 경기를 확인합니다.")
 async def matches(interaction: discord.Interaction):
-    matches = get_matches()
-    if not matches:
-        await interaction.response.send_message('다가오는 경기가 없습니다.')
+    message = await call(interaction, services.upcoming_matches)
+    if message is None:
+        await reply(interaction, '다가오는 경기가 없습니다.')
         return
-    message = '다가오는 경기:\n'
-    for match in matches:
-        match_id, match_name, team1, team2, date, result, team1_dividend, team2_dividend, closed, team1_total_bet, team2_total_bet = match
-        message += (f'***ID: {match_id}, 경기: {match_name}, 팀: {team1} vs {team2}, Date: {date}***'
-                    f'\n배당: {team1_dividend} ({team1}) / {team2_dividend} ({team2})'
-                    f'\n총 베팅 금액: {team1_total_bet} ({team1}) / {team2_total_bet} ({team2})'
-                    f'\n베팅 가능 여부: {"닫힘" if closed else "열림"}\n')
-    await interaction.response.send_message(message)
+    await reply(interaction, message)
+
+@bot.tree.command(name="배당판", description="이 채널에 실시간 배당판을 띄우거나 내립니다.")
+@app_commands.checks.has_permissions(administrator=True)
+async def odds_board_command(interaction: discord.Interaction):
+    odds_board = odds_board_for(interaction.guild_id)
+    if await odds_board.detach(interaction.channel_id):
+        await interaction.response.send_message('이 채널의 실시간 배당판을 내렸습니다.', ephemeral=True)
+        await call_guild(interaction.guild_id, services.remove_odds_board, interaction.channel_id)
+        return
+    await interaction.response.defer(ephemeral=True)
+    message = await odds_board.attach(interaction.channel)
+    # 재시작한 뒤에도 이 메시지를 계속 고치고 /배당판 으로 내릴 수 있게 저장한다
+    await call_guild(interaction.guild_id, services.save_odds_board, interaction.channel_id, message.id)
+    await interaction.followup.send('이 채널에 실시간 배당판을 띄웠습니다. 베팅이 들어오면 몇 초 간격으로 갱신됩니다.', ephemeral=True)
+
+@odds_board_command.error
+async def odds_board_error(interaction: discord.Interaction, error):
+    if isinstance(error, app_commands.MissingPermissions):
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+    else:
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 @bot.tree.command(name="베팅", description="경기에 포인트를 베팅합니다.")
 async def bet(interaction: discord.Interaction, match_id: int, team: str, amount: int):
     user_id = str(interaction.user.id)
-    points = get_user_points(user_id)
-    if points < amount:
-        await interaction.response.send_message('베팅에 필요한 포인트가 부족합니다.')
-        return
     if amount > MAX_TOTAL_BET_PER_USER:
         await interaction.response.send_message(f'베팅 금액은 {MAX_TOTAL_BET_PER_USER}포인트를 초과할 수 없습니다.')
         return
-    success, bet_id = place_bet(user_id, match_id, team, amount)
-    if not success:
-        await interaction.response.send_message('이 경기는 베팅이 닫혔거나 총 베팅 금액을 초과하였습니다.')
+    bet_id, reason = await call(interaction, services.place_bet, user_id, match_id, team, amount)
+    if reason == INSUFFICIENT_POINTS:
+        await reply(interaction, '베팅에 필요한 포인트가 부족합니다.')
+        return
+    if reason == INVALID_AMOUNT:
+        await reply(interaction, '베팅 금액은 0보다 커야 합니다.')
+        return
+    if reason == NO_MATCH:
+        await reply(interaction, f'매치 번호 {match_id}에 해당하는 경기를 찾지 못했거나 이미 정산되었습니다.')
         return
-    set_user_points(user_id, points - amount)
-    await interaction.response.send_message(f'{team}에 {amount} 포인트 베팅 - 매치 번호: {match_id}. 베팅 번호: {bet_id}')
+    if reason == INVALID_TEAM:
+        await reply(interaction, f'팀 {team} 경기 번호 {match_id}에 없습니다.')
+        return
+    if reason:
+        await reply(interaction, '이 경기는 베팅이 닫혔거나 총 베팅 금액을 초과하였습니다.')
+        return
+    await reply(interaction, f'{team}에 {amount} 포인트 베팅 - 매치 번호: {match_id}. 베팅 번호: {bet_id}')
 
 
 @bot.tree.command(name="베팅취소", description="베팅을 취소합니다.")
 async def cancel_bet_command(interaction: discord.Interaction, bet_id: int):
     user_id = str(interaction.user.id)
-    if cancel_bet(user_id, bet_id):
-        await interaction.response.send_message(f'배팅 번호 {bet_id} 취소되었습니다.')
+    if await call(interaction, services.cancel_bet, user_id, bet_id):
+        await reply(interaction, f'배팅 번호 {bet_id} 취소되었습니다.')
     else:
-        await interaction.response.send_message(f'배팅 번호 {bet_id} 를 취소할 수 없습니다. 베팅 시간이 5분을 넘었거나 베팅 번호가 잘못되었습니다.')
+        await reply(interaction, f'배팅 번호 {bet_id} 를 취소할 수 없습니다. 베팅 시간이 5분을 넘었거나 베팅 번호가 잘못되었습니다.')
 
 
 @bot.tree.command(name="closebets", description="매치에 대한 배팅을 마감합니다.")
 @app_commands.checks.has_permissions(administrator=True)
 async def close_bets(interaction: discord.Interaction, match_id: int):
-    close_betting(match_id)
-    
-    conn = sqlite3.connect('points.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT team1, team2, team1_total_bet, team2_total_bet, team1_dividend, team2_dividend FROM matches WHERE match_id = ?', (match_id,))
-    match = cursor.fetchone()
-    
+    match = await call(interaction, services.close_bets, match_id)
+
     if not match:
-        await interaction.response.send_message(f'매치 번호 {match_id}에 해당하는 경기를 찾지 못했습니다.')
-        conn.close()
+        await reply(interaction, f'매치 번호 {match_id}에 해당하는 경기를 찾지 못했습니다.')
         return
-    
+
     team1, team2, team1_total_bet, team2_total_bet, team1_dividend, team2_dividend = match
-    conn.close()
-    
-    await interaction.response.send_message(f'매치 번호 {match_id}에 대한 배팅이 마감되었습니다.\n'
-                                            f'팀 {team1}: 총 베팅 금액 = {team1_total_bet}, 배당 = {team1_dividend}\n'
-                                            f'팀 {team2}: 총 베팅 금액 = {team2_total_bet}, 배당 = {team2_dividend}')
+
+    await reply(interaction, f'매치 번호 {match_id}에 대한 배팅이 마감되었습니다.\n'
+                             f'팀 {team1}: 총 베팅 금액 = {team1_total_bet}, 배당 = {team1_dividend}\n'
+                             f'팀 {team2}: 총 베팅 금액 = {team2_total_bet}, 배당 = {team2_dividend}')
 
 @close_bets.error
 async def close_bets_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
 @bot.tree.command(name="openbets", description="매치에 대한 베팅을 엽니다.")
 @app_commands.checks.has_permissions(administrator=True)
 async def open_bet(interaction: discord.Interaction, match_id: int):
-    open_betting(match_id)
-    await interaction.response.send_message(f'Betting opened for match ID {match_id}.')
+    await call(interaction, services.open_bets, match_id)
+    await reply(interaction, f'Betting opened for match ID {match_id}.')
 
 @open_bet.error
 async def open_bet_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
 @bot.tree.command(name="setresult", description="매치 결과를 설정합니다.")
 @app_commands.checks.has_permissions(administrator=True)
 async def set_result(interaction: discord.Interaction, match_id: int, winning_team: str):
-    with sqlite3.connect('points.db') as conn:
-        cursor = conn.cursor()
-        # Check if the match exists
-        cursor.execute('SELECT team1, team2 FROM matches WHERE match_id = ?', (match_id,))
-        match = cursor.fetchone()
-        if not match:
-            await interaction.response.send_message(f'매치 번호 {match_id}에 해당하는 경기를 찾지 못했습니다.')
-            return
-        
-        team1, team2 = match
-        if winning_team not in (team1, team2):
-            await interaction.response.send_message(f'팀 {winning_team} 경기 번호 {match_id}에 없습니다.')
-            return
-        
-        # Close the match and distribute winnings
-        close_match(match_id, winning_team)
-        await interaction.response.send_message(f'경기 번호 {match_id} 결과 {winning_team} 승리. 정산되었습니다.')
+    # Close the match and distribute winnings
+    match, payouts, balances = await call(interaction, services.settle_match, match_id, winning_team)
+    if not match:
+        await reply(interaction, f'매치 번호 {match_id}에 해당하는 경기를 찾지 못했습니다.')
+        return
+
+    team1, team2 = match
+    if winning_team not in (team1, team2):
+        await reply(interaction, f'팀 {winning_team} 경기 번호 {match_id}에 없습니다.')
+        return
+
+    if payouts is None:
+        await reply(interaction, f'경기 번호 {match_id}는 이미 정산되었습니다.')
+        return
+    # 당첨 알림은 백그라운드에서 보내므로 응답을 기다리게 하지 않는다
+    notifier.notify(interaction.channel, f'경기 번호 {match_id} 결과: {winning_team} 승리!', payouts, balances.get)
+    await reply(interaction, f'경기 번호 {match_id} 결과 {winning_team} 승리. 정산되었습니다. 당첨자 {len(payouts)}명에게 알림을 보냅니다.')
+    # 응답한 뒤에 정산된 경기와 베팅을 보관 테이블로 옮긴다. 실패하면 다음 시작 때 다시 옮긴다
+    try:
+        await call_guild(interaction.guild_id, services.archive_match, match_id)
+    except Exception as e:
+        print(f'경기 {match_id} 보관 실패: {e}')
 
 @set_result.error
 async def set_result_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
 @bot.tree.command(name="결과", description="매치 결과를 확인합니다.")
 async def result(interaction: discord.Interaction, match_id: int):
-    match = get_match_result(match_id)
+    match = await call(interaction, services.match_result, match_id)
     if not match:
-        await interaction.response.send_message(f'No match found with ID {match_id}.')
+        await reply(interaction, f'No match found with ID {match_id}.')
         return
     match_name, team1, team2, result = match
     if result:
-        await interaction.response.send_message(f'경기: {match_name}\n팀: {team1} vs {team2}\n결과: {result}')
+        await reply(interaction, f'경기: {match_name}\n팀: {team1} vs {team2}\n결과: {result}')
     else:
-        await interaction.response.send_message(f'경기: {match_name}\n팀: {team1} vs {team2}\n결과: 경기가 완료되지 않았습니다.')
+        await reply(interaction, f'경기: {match_name}\n팀: {team1} vs {team2}\n결과: 경기가 완료되지 않았습니다.')
 
 
 @bot.tree.command(name="포인트", description="사용자의 포인트를 확인합니다.")
 async def points(interaction: discord.Interaction, user: discord.Member = None):
     user = user or interaction.user
-    points = get_user_points(str(user.id))
-    await interaction.response.send_message(f'{user.display_name}님은 {points}포인트를 보유 중입니다.')
+    points = await call(interaction, services.user_points, str(user.id))
+    await reply(interaction, f'{user.display_name}님은 {points}포인트를 보유 중입니다.')
 
 # 포인트 확인
 @bot.tree.command(name="포인트확인", description="다른 사용자의 포인트를 확인합니다.")
@@ -482,15 +408,15 @@ async def points(interaction: discord.Interaction, user: discord.Member = None):
 @app_commands.describe(member="확인할 사용자")
 async def check_points(interaction: discord.Interaction, member: discord.Member):
     user_id = str(member.id)
-    points = get_user_points(user_id)
-    await interaction.response.send_message(f'{member.display_name}님은 {points}포인트를 보유 중입니다.')
+    points = await call(interaction, services.user_points, user_id)
+    await reply(interaction, f'{member.display_name}님은 {points}포인트를 보유 중입니다.')
 
 @check_points.error
 async def check_points_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
 
@@ -498,37 +424,40 @@ async def check_points_error(interaction: discord.Interaction, error):
 @app_commands.checks.has_permissions(administrator=True)
 async def add_points(interaction: discord.Interaction, user: discord.Member, amount: int):
     user_id = str(user.id)
-    current_points = get_user_points(user_id)
-    set_user_points(user_id, current_points + amount)
-    await interaction.response.send_message(f'{amount}포인트를 {user.display_name}님에게 추가하였습니다.')
+    added, current_points = await call(interaction, services.adjust_points, user_id, amount)
+
+    if not added:
+        await reply(interaction, f'{user.display_name}님의 포인트가 부족합니다. 현재 포인트: {current_points}포인트')
+        return
+
+    await reply(interaction, f'{amount}포인트를 {user.display_name}님에게 추가하였습니다. 현재 포인트: {current_points}포인트')
 
 @add_points.error
 async def add_points_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
 @bot.tree.command(name="removepoints", description="사용자의 포인트를 제거합니다.")
 @app_commands.checks.has_permissions(administrator=True)
 async def remove_points(interaction: discord.Interaction, user: discord.Member, amount: int):
     user_id = str(user.id)
-    current_points = get_user_points(user_id)
-    
-    if current_points < amount:
-        await interaction.response.send_message(f'{user.display_name}님의 포인트가 부족합니다. 현재 포인트: {current_points}포인트')
+    removed, current_points = await call(interaction, services.adjust_points, user_id, -amount)
+
+    if not removed:
+        await reply(interaction, f'{user.display_name}님의 포인트가 부족합니다. 현재 포인트: {current_points}포인트')
         return
-    
-    set_user_points(user_id, max(0, current_points - amount))
-    await interaction.response.send_message(f'{user.display_name}님의 {amount}포인트를 제거하였습니다. 현재 포인트: {current_points - amount}포인트')
+
+    await reply(interaction, f'{user.display_name}님의 {amount}포인트를 제거하였습니다. 현재 포인트: {current_points}포인트')
 
 @remove_points.error
 async def remove_points_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
 
@@ -544,12 +473,14 @@ async def help(interaction: discord.Interaction):
     `/내전개설 <내전_이름>` - 내전 개설
     `/팀 <내전_이름>` - 팀 상태 조회
     `/팀마감 <내전_이름>` - 팀 마감
+    `/팀밸런스 <내전_이름> [apply]` - MMR 차이가 가장 작은 팀 나누기 (적용은 관리자)
     `/떠나기 <내전_이름>` - 팀 참가 취소
     `/내전종료 <내전_이름> <이긴_팀>` - 내전 종료 및 승패 기록
     `/전적 [@사용자]` - 전적 조회
-    `/티어표` - 티어표          
+    `/티어표` - 티어표
+    `/내순위` - 내 티어표 순위
     `/도움말` - 도움말
-                                            
+
     **관리자 명령어:**
     `/addpoints <user> <amount>` - 포인트 추가
     `/포인트확인 <user>` - 포인트 확인
@@ -560,63 +491,107 @@ async def help(interaction: discord.Interaction):
     `/openbets <match_id>` - 베팅 열기
     `/setresult <match_id> <winning_team>` - 경기 결과 설정
     `/removepoints <user> <amount>` - 포인트 제거
+    `/stats` - 명령어/DB 처리 시간 통계
+    `/배당판` - 이 채널에 실시간 배당판 띄우기/내리기
+    `/export [incremental]` - 데이터 내보내기 (CSV, JSONL)
+    `/backup` - 이 서버의 DB 백업 (복원: `python backup.py restore <파일> guilds/<서버 ID>.db`, 봇을 멈춘 뒤)
     ''', ephemeral=True)
 
 
 
+@bot.tree.command(name="stats", description="명령어와 DB 처리 시간 통계를 확인합니다.")
+@app_commands.checks.has_permissions(administrator=True)
+async def stats(interaction: discord.Interaction):
+    await interaction.response.send_message(metrics.summary(), ephemeral=True)
+
+@stats.error
+async def stats_error(interaction: discord.Interaction, error):
+    if isinstance(error, app_commands.MissingPermissions):
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+    else:
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+
+
+
+@bot.tree.command(name="export", description="베팅/포인트/전적 데이터를 CSV, JSONL 로 내보냅니다.")
+@app_commands.checks.has_permissions(administrator=True)
+async def export_command(interaction: discord.Interaction, incremental: bool = True):
+    await interaction.response.defer(ephemeral=True)
+    out_dir = os.path.join(EXPORT_DIR, str(interaction.guild_id))
+    counts = await call(interaction, services.export_data, out_dir, incremental)
+    summary = ', '.join(f'{name} {count}행' for name, count in counts.items())
+    await interaction.followup.send(f'`{out_dir}` 에 내보냈습니다: {summary}', ephemeral=True)
+
+@export_command.error
+async def export_error(interaction: discord.Interaction, error):
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+    else:
+        await interaction.followup.send("내보내기 중 오류가 발생했습니다.", ephemeral=True)
+
+
+
+@bot.tree.command(name="backup", description="이 서버의 DB 를 지금 백업합니다.")
+@app_commands.checks.has_permissions(administrator=True)
+async def backup_command(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    if interaction.guild_id is None:
+        raise app_commands.NoPrivateMessage()
+    path, pages, elapsed = await run_backup(interaction.guild_id)
+    await interaction.followup.send(f'백업 완료: `{path}` ({pages} 페이지, {elapsed:.2f}초)', ephemeral=True)
+
+@backup_command.error
+async def backup_error(interaction: discord.Interaction, error):
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+    else:
+        await interaction.followup.send("백업 중 오류가 발생했습니다.", ephemeral=True)
+
+
+
 #-------- 내전 관련 명령어 --------
-# 내전 개설 명령어
+# 내전 참가 버튼. custom_id 에 내전 번호와 팀이 들어 있어서 봇을 다시 시작해도 예전 메시지의 버튼이 동작하고,
+# 메시지마다 View 를 메모리에 들고 있지 않는다
+class LobbyJoinButton(discord.ui.DynamicItem[Button], template=r'lobby:(?P<lobby_id>[0-9]+):(?P<team>[12])'):
+    def __init__(self, lobby_id: int, team: int):
+        super().__init__(Button(label=f"팀{team} 참가", style=discord.ButtonStyle.primary,
+                                custom_id=f"lobby:{lobby_id}:{team}"))
+        self.lobby_id = lobby_id
+        self.team = team
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match):
+        return cls(int(match['lobby_id']), int(match['team']))
+
+    async def callback(self, interaction: discord.Interaction):
+        await join_team(interaction, self.lobby_id, self.team)
+
 # 내전 개설 명령어
 @bot.tree.command(name="내전개설", description="내전을 개설합니다.")
 async def start_match(interaction: discord.Interaction, match_name: str):
-    global team_closed
-    team_closed[match_name] = False  # 팀 참가를 열림 상태로 설정
+    lobby_id = await call(interaction, services.open_lobby, match_name, interaction.channel_id)
 
-    button_team1 = Button(label="팀1 참가", style=discord.ButtonStyle.primary)
-    button_team2 = Button(label="팀2 참가", style=discord.ButtonStyle.primary)
+    view = View(timeout=None)
+    view.add_item(LobbyJoinButton(lobby_id, 1))
+    view.add_item(LobbyJoinButton(lobby_id, 2))
 
-    async def join_team1(button_interaction: discord.Interaction):
-        await join_team(button_interaction, match_name, 1)
-    
-    async def join_team2(button_interaction: discord.Interaction):
-        await join_team(button_interaction, match_name, 2)
-
-    button_team1.callback = join_team1
-    button_team2.callback = join_team2
-
-    view = View()
-    view.add_item(button_team1)
-    view.add_item(button_team2)
-
-    await interaction.response.send_message(f"'{match_name}' 내전에 버튼을 눌러 팀에 참가하세요.:", view=view)
+    message_id = await reply(interaction, f"'{match_name}' 내전에 버튼을 눌러 팀에 참가하세요.:", view=view)
+    await call_guild(interaction.guild_id, services.set_lobby_message, lobby_id, message_id)
 
 # 팀 참가 함수
-async def join_team(interaction: discord.Interaction, match_name: str, team: int):
-    if team_closed.get(match_name, True):
-        await interaction.response.send_message("더 이상 팀 참가가 불가능합니다.", ephemeral=True)
+async def join_team(interaction: discord.Interaction, lobby_id: int, team: int):
+    user_id = interaction.user.id
+    joined = await call(interaction, services.join_lobby, lobby_id, user_id, team, ephemeral=True)
+    if joined is None:
+        await reply(interaction, "더 이상 팀 참가가 불가능합니다.", ephemeral=True)
         return
+    match_name, team_count = joined
 
-    user_id = interaction.user.id
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO teams (match_name, user_id, team)
-            VALUES (?, ?, ?)
-            ON CONFLICT(match_name, user_id) DO UPDATE SET team = excluded.team
-        ''', (match_name, user_id, team))
-        
-        # 팀 인원 수 확인
-        cursor.execute('SELECT COUNT(*) FROM teams WHERE match_name = ? AND team = ?', (match_name, team))
-        team_count = cursor.fetchone()[0]
-        conn.commit()
-        conn.close()
-    
-    await interaction.response.send_message(f"'{match_name}' 팀{team} 참가 완료!", ephemeral=True)
-
-    # 팀 인원이 5명에 도달하면 알림 보내기
+    await reply(interaction, f"'{match_name}' 팀{team} 참가 완료!", ephemeral=True)
+
+    # 팀 인원이 5명에 도달하면 알림 보내기 (아직 안 보낸 같은 내전 알림과 합쳐진다)
     if team_count == 5:
-        await interaction.channel.send(f"'{match_name}' 팀{team}의 인원이 5명에 도달했습니다!")
+        outbox.post(interaction.channel, f"'{match_name}' 팀{team}의 인원이 5명에 도달했습니다!", key=('team_full', match_name))
 
 
 
@@ -625,12 +600,7 @@ async def join_team(interaction: discord.Interaction, match_name: str, team: int
 async def team_status(interaction: discord.Interaction, match_name: str):
     await interaction.response.defer()
 
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, team FROM teams WHERE match_name = ?", (match_name,))
-        rows = cursor.fetchall()
-        conn.close()
+    rows = await call(interaction, services.team_members, match_name)
 
     if not rows:
         await interaction.followup.send("해당 내전에 참가한 사용자가 없습니다.")
@@ -639,15 +609,11 @@ async def team_status(interaction: discord.Interaction, match_name: str):
     teams = {1: [], 2: []}
     team_mmr = {1: [], 2: []}
 
-    guild = interaction.guild
-
-    tasks = []
-    for row in rows:
-        user_id, team = row
-        task = fetch_user_data(guild, user_id, team, teams, team_mmr)
-        tasks.append(task)
-
-    await asyncio.gather(*tasks)
+    names = await member_cache.resolve(interaction.guild, [row[0] for row in rows])
+    for user_id, team, mmr_value in rows:
+        display_name = names.get(user_id, str(user_id))
+        teams[team].append(display_name + " " + str(mmr_value))
+        team_mmr[team].append(mmr_value)
 
     avg_mmr_team1 = sum(team_mmr[1]) / len(team_mmr[1]) if team_mmr[1] else BASE_MMR
     avg_mmr_team2 = sum(team_mmr[2]) / len(team_mmr[2]) if team_mmr[2] else BASE_MMR
@@ -657,20 +623,29 @@ async def team_status(interaction: discord.Interaction, match_name: str):
 
     await interaction.followup.send(f"**'{match_name}' 팀1:**\n{team1_members}\n평균 MMR: {avg_mmr_team1:.2f}\n\n**'{match_name}' 팀2:**\n{team2_members}\n평균 MMR: {avg_mmr_team2:.2f}")
 
-async def fetch_user_data(guild, user_id, team, teams, team_mmr):
-    user = await guild.fetch_member(user_id)
-    display_name = user.nick if user.nick else user.display_name
 
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT mmr FROM records WHERE user_id = ?", (user_id,))
-        mmr = cursor.fetchone()
-        conn.close()
+# 팀 밸런스 명령어
+@bot.tree.command(name="팀밸런스", description="참가자를 평균 MMR 차이가 가장 작은 두 팀으로 나눕니다.")
+async def balance_team_command(interaction: discord.Interaction, match_name: str, apply: bool = False):
+    if apply and not interaction.permissions.administrator:
+        await interaction.response.send_message("팀 배정은 관리자만 할 수 있습니다.", ephemeral=True)
+        return
+    await interaction.response.defer()
 
-    mmr_value = mmr[0] if mmr else BASE_MMR
-    teams[team].append(display_name + " " + str(mmr_value))
-    team_mmr[team].append(mmr_value)
+    balanced = await call(interaction, services.balance_lobby, match_name, apply)
+    if balanced is None:
+        await interaction.followup.send("팀을 나눌 참가자가 부족합니다.")
+        return
+    team1, team2, moved = balanced
+
+    names = await member_cache.resolve(interaction.guild, [user_id for user_id, _ in team1 + team2])
+    lines = []
+    for number, team in ((1, team1), (2, team2)):
+        avg_mmr = sum(mmr for _, mmr in team) / len(team)
+        members = "\n".join(f"{names.get(user_id, str(user_id))} {mmr}" for user_id, mmr in team)
+        lines.append(f"**'{match_name}' 팀{number}:**\n{members}\n평균 MMR: {avg_mmr:.2f}")
+    status = f"{moved}명의 팀을 바꿨습니다." if apply else f"적용하면 {moved}명의 팀이 바뀝니다. (관리자: apply:True)"
+    await interaction.followup.send("\n\n".join(lines) + f"\n\n평균 MMR 차이: {average_gap(team1, team2):.2f}\n{status}")
 
 
 # 팀원 추가 명령어
@@ -680,51 +655,36 @@ async def add_team_member(interaction: discord.Interaction, match_name: str, mem
     if team not in [1, 2]:
         await interaction.response.send_message("팀 번호는 1 또는 2이어야 합니다.", ephemeral=True)
         return
-    
+
     user_id = member.id
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO teams (match_name, user_id, team)
-            VALUES (?, ?, ?)
-            ON CONFLICT(match_name, user_id) DO UPDATE SET team = excluded.team
-        ''', (match_name, user_id, team))
-        conn.commit()
-        conn.close()
-    
-    await interaction.response.send_message(f"{member.display_name}님을 '{match_name}' 내전의 팀{team}에 추가했습니다.")
+    await call(interaction, services.add_team_member, match_name, user_id, team)
+
+    await reply(interaction, f"{member.display_name}님을 '{match_name}' 내전의 팀{team}에 추가했습니다.")
 
 @add_team_member.error
 async def add_team_member_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 @bot.tree.command(name="팀원제거", description="내전에서 팀원을 제거합니다.")
 @app_commands.checks.has_permissions(administrator=True)
 async def remove_team_member(interaction: discord.Interaction, match_name: str, member: discord.Member):
     user_id = member.id
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM teams WHERE match_name = ? AND user_id = ?", (match_name, user_id))
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-    
+    rows_affected = await call(interaction, services.remove_team_member, match_name, user_id)
+
     if rows_affected > 0:
-        await interaction.response.send_message(f"{member.display_name}님을 '{match_name}' 내전에서 제거했습니다.")
+        await reply(interaction, f"{member.display_name}님을 '{match_name}' 내전에서 제거했습니다.")
     else:
-        await interaction.response.send_message(f"{member.display_name}님은 '{match_name}' 내전에 참가하고 있지 않습니다.", ephemeral=True)
+        await reply(interaction, f"{member.display_name}님은 '{match_name}' 내전에 참가하고 있지 않습니다.", ephemeral=True)
 
 @remove_team_member.error
 async def remove_team_member_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
 
@@ -732,45 +692,20 @@ async def remove_team_member_error(interaction: discord.Interaction, error):
 @bot.tree.command(name="팀마감", description="내전 팀 참가를 마감합니다.")
 async def close_teams(interaction: discord.Interaction, match_name: str):
     await interaction.response.defer()
-    async with bot.team_lock:
-        global team_closed
-        team_closed[match_name] = True
-        
-        with db_lock:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id, team FROM teams WHERE match_name = ?", (match_name,))
-            rows = cursor.fetchall()
-            team_mmr = {1: [], 2: []}
-            for row in rows:
-                user_id, team = row
-                cursor.execute("SELECT mmr FROM records WHERE user_id = ?", (user_id,))
-                mmr = cursor.fetchone()
-                if mmr:
-                    team_mmr[team].append(mmr[0])
-                else:
-                    team_mmr[team].append(BASE_MMR)
-
-            avg_mmr_team1 = sum(team_mmr[1]) / len(team_mmr[1]) if team_mmr[1] else BASE_MMR
-            avg_mmr_team2 = sum(team_mmr[2]) / len(team_mmr[2]) if team_mmr[2] else BASE_MMR
-            
-            conn.close()
-        
-        await interaction.followup.send(f"'{match_name} 내전 팀 참가가 종료되었습니다'.\n"
-                                                f"팀1 평균MMR: {avg_mmr_team1:.2f}\n"
-                                                f"팀2 평균MMR: {avg_mmr_team2:.2f}")
+    team_mmr = await call(interaction, services.close_lobby, match_name)
+    avg_mmr_team1 = sum(team_mmr[1]) / len(team_mmr[1]) if team_mmr[1] else BASE_MMR
+    avg_mmr_team2 = sum(team_mmr[2]) / len(team_mmr[2]) if team_mmr[2] else BASE_MMR
+
+    await interaction.followup.send(f"'{match_name} 내전 팀 참가가 종료되었습니다'.\n"
+                                    f"팀1 평균MMR: {avg_mmr_team1:.2f}\n"
+                                    f"팀2 평균MMR: {avg_mmr_team2:.2f}")
 
 # 팀 참가 취소 명령어
 @bot.tree.command(name="떠나기", description="내전을 떠납니다.")
 async def leave(interaction: discord.Interaction, match_name: str):
     user_id = interaction.user.id
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM teams WHERE match_name = ? AND user_id = ?", (match_name, user_id))
-        conn.commit()
-        conn.close()
-    await interaction.response.send_message(f"{interaction.user.display_name}님이 '{match_name}' 내전을 떠났습니다.")
+    await call(interaction, services.remove_team_member, match_name, user_id)
+    await reply(interaction, f"{interaction.user.display_name}님이 '{match_name}' 내전을 떠났습니다.")
 
 
 # 내전 종료 및 승패 기록 명령어
@@ -780,181 +715,107 @@ async def end_match(interaction: discord.Interaction, match_name: str, winning_t
         await interaction.response.send_message("올바르지 않은 팀 번호입니다. 1 또는 2를 입력해주세요.")
         return
 
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Calculate average MMR for the entire match
-        cursor.execute("SELECT user_id, team FROM teams WHERE match_name = ?", (match_name,))
-        rows = cursor.fetchall()
-        total_mmr = []
-        for row in rows:
-            user_id = row[0]
-            cursor.execute("SELECT mmr FROM records WHERE user_id = ?", (user_id,))
-            mmr = cursor.fetchone()
-            if mmr:
-                total_mmr.append(mmr[0])
-            else:
-                total_mmr.append(BASE_MMR)
-
-        avg_mmr_match = sum(total_mmr) / len(total_mmr) if total_mmr else BASE_MMR
-
-        for row in rows:
-            user_id, team = row
-            cursor.execute("SELECT mmr, streak FROM records WHERE user_id = ?", (user_id,))
-            user_data = cursor.fetchone()
-            if user_data:
-                user_mmr, streak = user_data
-            else:
-                user_mmr, streak = BASE_MMR, 0
-
-            # Determine MMR change based on player's MMR vs match average MMR
-            mmr_diff = user_mmr - avg_mmr_match
-            if mmr_diff > 0:
-                mmr_change = MMR_CHANGE - int(mmr_diff / 100)
-            else:
-                mmr_change = MMR_CHANGE + int(mmr_diff / 100)
-            
-            if mmr_change < 0:
-                mmr_change = 1
-
-            if team == winning_team:
-                new_streak = streak + 1 if streak > 0 else 1
-                if new_streak >= 3:
-                    streak_multiplier = (abs(new_streak) - 2) / 10 + 1 
-                    mmr_change = int(mmr_change * streak_multiplier) # Increase MMR change based on winning streak length
-                cursor.execute('''
-                    INSERT INTO records (user_id, wins, losses, mmr, streak)
-                    VALUES (?, 1, 0, ?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET 
-                        wins = wins + 1,
-                        mmr = mmr + ?,
-                        streak = ?
-                ''', (user_id, BASE_MMR + mmr_change, new_streak, mmr_change, new_streak))
-            else:
-                new_streak = streak - 1 if streak < 0 else -1
-                if new_streak <= -3:
-                    streak_multiplier = (abs(new_streak) - 2) / 10 + 1  # Increase MMR change based on losing streak length
-                    mmr_change = int(mmr_change * streak_multiplier)
-                cursor.execute('''
-                    INSERT INTO records (user_id, wins, losses, mmr, streak)
-                    VALUES (?, 0, 1, ?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET 
-                        losses = losses + 1,
-                        mmr = mmr - ?,
-                        streak = ?
-                ''', (user_id, BASE_MMR - mmr_change, new_streak, mmr_change, new_streak))
-        conn.commit()
-        cursor.execute("DELETE FROM teams WHERE match_name = ?", (match_name,))
-        conn.commit()
-        conn.close()
-    await interaction.response.send_message(f"내전 '{match_name}' 종료. 팀{winning_team} 승리!")
+    await call(interaction, services.end_lobby, match_name, winning_team)
+    await reply(interaction, f"내전 '{match_name}' 종료. 팀{winning_team} 승리!")
 
 
 @bot.tree.command(name="전적", description="사용자의 전적을 확인합니다.")
 async def record(interaction: discord.Interaction, member: discord.Member = None):
     member = member or interaction.user
     user_id = member.id
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT wins, losses, mmr FROM records WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+    row = await call(interaction, services.user_record, user_id)
     if row:
         wins, losses, mmr = row
-        await interaction.response.send_message(f"{member.display_name} - 승: {wins}, 패: {losses}, MMR: {mmr}")
+        await reply(interaction, f"{member.display_name} - 승: {wins}, 패: {losses}, MMR: {mmr}")
     else:
-        await interaction.response.send_message(f"{member.display_name}님의 기록이 없습니다.")
+        await reply(interaction, f"{member.display_name}님의 기록이 없습니다.")
 
 
 # 티어표 명령어
+TIER_PAGE_SIZE = 20
+
+class TierListView(View):
+    def __init__(self, guild):
+        super().__init__(timeout=300)
+        self.guild = guild
+        self.page = 0
+
+    async def render(self):
+        # 순위표가 비어 있으면 None
+        self.page, page_count, entries = await call_guild(self.guild.id, services.leaderboard_page, self.page, TIER_PAGE_SIZE)
+        if not entries:
+            return None
+        names = await member_cache.resolve(self.guild, [user_id for _, user_id, _ in entries])
+
+        tier_list = []
+        for rank, user_id, mmr in entries:
+            display_name = names.get(user_id)
+            if display_name is None:  # 서버에 없는 유저
+                continue
+            tier_list.append(f"{rank}. {display_name} - {get_tier(mmr)} ({mmr} MMR)")
+
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= page_count - 1
+        tier_list_message = "\n".join(tier_list)
+        return f"**티어표** ({self.page + 1}/{page_count})\n{tier_list_message}"
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        await interaction.response.defer()
+        self.page = page
+        await interaction.edit_original_response(content=await self.render(), view=self)
+
+    @discord.ui.button(label="이전", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="다음", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        await self.show_page(interaction, self.page + 1)
+
 @bot.tree.command(name="티어표", description="모든 유저의 티어를 확인합니다.")
 async def tier_list(interaction: discord.Interaction):
     await interaction.response.defer()
-    tiers = [
-        "Iron IV", "Iron III", "Iron II", "Iron I",
-        "Bronze IV", "Bronze III", "Bronze II", "Bronze I",
-        "Silver IV", "Silver III", "Silver II", "Silver I",
-        "Gold IV", "Gold III", "Gold II", "Gold I",
-        "Platinum IV", "Platinum III", "Platinum II", "Platinum I",
-        "Emerald IV", "Emerald III", "Emerald II", "Emerald I",
-        "Diamond IV", "Diamond III", "Diamond II", "Diamond I",
-        "Master", "Grandmaster", "Challenger"
-    ]
-
-    def get_tier(mmr):
-        if mmr < 500:
-            return tiers[0]
-        elif mmr >= 3400:
-            return tiers[-1]
-        else:
-            # Calculate tier index based on MMR
-            # 100 mmr per tier
-            if mmr - 500 < 0:
-                return tiers[0]
-            return tiers[(mmr - 500) // 100 + 1]
-
-
-            #index = (mmr - 600) // 100
-            #return tiers[index]
-
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, mmr FROM records ORDER BY mmr DESC")
-        rows = cursor.fetchall()
-        conn.close()
 
-    if not rows:
+    view = TierListView(interaction.guild)
+    content = await view.render()
+    if content is None:
         await interaction.followup.send("등록된 유저가 없습니다.")
         return
 
-    tier_list = []
-    guild = interaction.guild
-
-    for row in rows:
-        user_id, mmr = row
-        try:
-            user = await guild.fetch_member(user_id)
-        except discord.errors.NotFound:
-            continue
-
-        display_name = user.nick if user.nick else user.display_name
-        tier = get_tier(mmr)
-        tier_list.append(f"{display_name} - {tier} ({mmr} MMR)")
-
-    tier_list_message = "\n".join(tier_list)
-    await interaction.followup.send(f"**티어표**\n{tier_list_message}")
+    await interaction.followup.send(content, view=view)
 
 @tier_list.error
 async def tier_list_error(interaction: discord.Interaction, error):
     await interaction.followup.send("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
+@bot.tree.command(name="내순위", description="나의 티어표 순위를 확인합니다.")
+async def my_rank(interaction: discord.Interaction):
+    user_id = interaction.user.id
+    ranked = await call(interaction, services.user_rank, user_id, ephemeral=True)
+    if ranked is None:
+        await reply(interaction, f"{interaction.user.display_name}님의 기록이 없습니다.", ephemeral=True)
+        return
+    rank, total, mmr = ranked
+    await reply(interaction, f"{interaction.user.display_name} - {rank}위 / {total}명, {get_tier(mmr)} ({mmr} MMR)", ephemeral=True)
+
+
 # 관리자 MMR 설정 명령어
 @bot.tree.command(name="set_mmr", description="사용자의 MMR을 설정합니다.")
 @app_commands.checks.has_permissions(administrator=True)
 async def set_mmr(interaction: discord.Interaction, member: discord.Member, new_mmr: int):
     user_id = member.id
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO records (user_id, wins, losses, mmr)
-            VALUES (?, 0, 0, ?)
-            ON CONFLICT(user_id) DO UPDATE SET mmr = ?
-        ''', (user_id, new_mmr, new_mmr))
-        conn.commit()
-        conn.close()
-    await interaction.response.send_message(f"{member.display_name}의 MMR이 {new_mmr}로 조정되었습니다.")
+    await call(interaction, services.set_mmr, user_id, new_mmr)
+    await reply(interaction, f"{member.display_name}의 MMR이 {new_mmr}로 조정되었습니다.")
 
 @set_mmr.error
 async def set_mmr_error(interaction: discord.Interaction, error):
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
+        await reply(interaction, "이 명령어를 사용하려면 관리자 권한이 필요합니다.", ephemeral=True)
     else:
-        await interaction.response.send_message("명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
+        await reply(interaction, "명령어 실행 중 오류가 발생했습니다.", ephemeral=True)
 
 
-bot.run(TOKEN)
+if __name__ == '__main__':
+    from tokenDiscord import TOKEN
+    bot.run(TOKEN, root_logger=True)  # 모듈 로그(서버별 시작 단계 시간 등)도 출력
@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+
+# query_members 한 번에 요청할 수 있는 최대 인원
+QUERY_CHUNK_SIZE = 100
+
+
+class MemberCache:
+    """(guild_id, user_id) -> 표시 이름 TTL/LRU 캐시.
+
+    게이트웨이 멤버 이벤트와 상호작용으로 채워지고, 캐시에 없는 멤버는 ``resolve`` 가
+    ``guild.query_members`` 로 100명씩 묶어서 한 번에 가져온다.
+    """
+
+    def __init__(self, ttl=600, maxsize=5000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._names = OrderedDict()
+
+    def get(self, guild_id, user_id):
+        key = (guild_id, int(user_id))
+        entry = self._names.get(key)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._names[key]
+            return None
+        self._names.move_to_end(key)
+        return name
+
+    def put(self, member):
+        guild = getattr(member, 'guild', None)
+        if guild is None:
+            return
+        key = (guild.id, member.id)
+        self._names[key] = (member.display_name, time.monotonic() + self.ttl)
+        self._names.move_to_end(key)
+        while len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+
+    def discard(self, guild_id, user_id):
+        self._names.pop((guild_id, int(user_id)), None)
+
+    async def resolve(self, guild, user_ids):
+        """user_id 목록의 표시 이름을 {user_id: 이름} 으로 돌려준다. 서버에 없는 유저는 빠진다."""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self.get(guild.id, user_id)
+            if name is None:
+                member = guild.get_member(int(user_id))
+                if member is not None:
+                    self.put(member)
+                    name = member.display_name
+            if name is None:
+                missing.append(int(user_id))
+            else:
+                names[user_id] = name
+
+        ids = {int(user_id): user_id for user_id in user_ids}
+        for i in range(0, len(missing), QUERY_CHUNK_SIZE):
+            chunk = missing[i:i + QUERY_CHUNK_SIZE]
+            for member in await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False):
+                self.put(member)
+                names[ids[member.id]] = member.display_name
+        return names
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+from discord import InteractionType, app_commands
+
+log = logging.getLogger(__name__)
+
+# 초 단위 히스토그램 구간 (마지막은 +Inf)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # 해당 분위가 속한 구간의 상한값 (Prometheus histogram_quantile 보다 거친 추정)
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class Metrics:
+    """명령어/DB 작업별 지연 시간 히스토그램, DB 큐 대기 시간, 변경한 행 수, 오류 수.
+    DB 쪽 값은 워커 스레드에서 들어오므로 잠금으로 보호한다."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.command_latency = {}
+        self.command_errors = {}
+        self.db_latency = {}
+        self.db_wait = {}
+        self.db_rows = {}
+        self.db_errors = {}
+
+    def observe_command(self, name, elapsed, error=None):
+        with self._lock:
+            self.command_latency.setdefault(name, Histogram()).observe(elapsed)
+            if error is not None:
+                self.command_errors[name] = self.command_errors.get(name, 0) + 1
+
+    def observe_db(self, fn, wait, elapsed, rows, error):
+        # Database.listeners 에 등록해서 쓴다
+        name = getattr(fn, '__qualname__', repr(fn))
+        with self._lock:
+            self.db_latency.setdefault(name, Histogram()).observe(elapsed)
+            self.db_wait.setdefault(name, Histogram()).observe(wait)
+            self.db_rows[name] = self.db_rows.get(name, 0) + rows
+            if error is not None:
+                self.db_errors[name] = self.db_errors.get(name, 0) + 1
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            _histogram(lines, 'yck_command_duration_seconds', 'Slash command latency', 'command', self.command_latency)
+            _counter(lines, 'yck_command_errors_total', 'Slash commands that raised', 'command', self.command_errors)
+            _histogram(lines, 'yck_db_job_duration_seconds', 'Database job execution time', 'job', self.db_latency)
+            _histogram(lines, 'yck_db_wait_seconds', 'Time a database job waited for the db worker', 'job', self.db_wait)
+            _counter(lines, 'yck_db_rows_written_total', 'Rows inserted, updated or deleted', 'job', self.db_rows)
+            _counter(lines, 'yck_db_errors_total', 'Database jobs that raised', 'job', self.db_errors)
+        lines.append('# HELP yck_uptime_seconds Seconds since the bot started')
+        lines.append('# TYPE yck_uptime_seconds gauge')
+        lines.append(f'yck_uptime_seconds {time.time() - self.started:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, limit=10):
+        """/stats 용 요약: 호출 수가 많은 명령어와 DB 작업 상위 limit 개"""
+        with self._lock:
+            commands = sorted(self.command_latency.items(), key=lambda item: -item[1].count)[:limit]
+            jobs = sorted(self.db_latency.items(), key=lambda item: -item[1].count)[:limit]
+            lines = ['**명령어** (호출 수, p50 / p99 ms, 오류)']
+            for name, hist in commands:
+                lines.append(f'`/{name}` {hist.count}회, {_ms(hist.quantile(0.5))} / {_ms(hist.quantile(0.99))}, '
+                             f'오류 {self.command_errors.get(name, 0)}')
+            lines.append('\n**DB 작업** (호출 수, 평균 실행 / 평균 대기 ms, 변경 행 수)')
+            for name, hist in jobs:
+                wait = self.db_wait[name]
+                lines.append(f'`{name}` {hist.count}회, {hist.sum / hist.count * 1000:.2f} / '
+                             f'{wait.sum / wait.count * 1000:.2f}, {self.db_rows.get(name, 0)}행')
+        return '\n'.join(lines)
+
+
+def _ms(seconds):
+    return '>10000' if seconds == float('inf') else f'{seconds * 1000:g}'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram(lines, metric, help_text, label, histograms):
+    lines.append(f'# HELP {metric} {help_text}')
+    lines.append(f'# TYPE {metric} histogram')
+    for name, hist in sorted(histograms.items()):
+        name = _label(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, hist.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f'{metric}_bucket{{{label}="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{{label}="{name}"}} {hist.sum:.6f}')
+        lines.append(f'{metric}_count{{{label}="{name}"}} {hist.count}')
+
+
+def _counter(lines, metric, help_text, label, counters):
+    lines.append(f'# HELP {metric} {help_text}')
+    lines.append(f'# TYPE {metric} counter')
+    for name, value in sorted(counters.items()):
+        lines.append(f'{metric}{{{label}="{_label(name)}"}} {value}')
+
+
+class PhaseTimer:
+    """시작 과정처럼 순서대로 진행되는 단계들의 소요 시간. ``mark(name)`` 은 직전 mark 이후의 시간을 기록한다."""
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.phases = []  # [(단계 이름, 초)]
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def __str__(self):
+        phases = ', '.join(f'{name} {elapsed * 1000:.0f}ms' for name, elapsed in self.phases)
+        return f'{phases} (합계 {self.total * 1000:.0f}ms)'
+
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """모든 슬래시 명령어의 처리 시간을 잰다. interaction_check 에서 시작하고,
+    성공하면 클라이언트의 on_app_command_completion 에서, 실패하면 on_error 에서 끝낸다."""
+
+    def __init__(self, client, metrics):
+        super().__init__(client)
+        self.metrics = metrics
+        self._started = {}
+
+    async def interaction_check(self, interaction):
+        if interaction.type is InteractionType.application_command:
+            self._started[interaction.id] = time.perf_counter()
+        return True
+
+    def finish(self, interaction, command, error=None):
+        started = self._started.pop(interaction.id, None)
+        if started is not None and command is not None:
+            self.metrics.observe_command(command.qualified_name, time.perf_counter() - started, error)
+
+    async def on_error(self, interaction, error):
+        self.finish(interaction, interaction.command, error)
+        await super().on_error(interaction, error)
+
+
+class MetricsServer:
+    """Prometheus 가 긁어갈 수 있도록 /metrics 를 로컬 HTTP 로 제공한다."""
+
+    def __init__(self, metrics, host='127.0.0.1', port=9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # 포트가 이미 쓰이고 있어도(다른 인스턴스 등) 봇은 메트릭 HTTP 없이 계속 동작한다
+            log.error('metrics endpoint disabled, cannot listen on %s:%s: %s', self.host, self.port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return False
+        log.info('metrics endpoint listening on http://%s:%s/metrics', self.host, self.port)
+        return True
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(body=self.metrics.render_prometheus().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
@@ -0,0 +1,206 @@
+import sqlite3
+import sys
+
+# 순서대로 적용되는 스키마 마이그레이션: (버전, 설명, SQL 문 목록)
+# 이미 배포된 마이그레이션은 수정하지 말고 새 버전을 뒤에 추가한다.
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            points INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS matches (
+            match_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_name TEXT NOT NULL,
+            team1 TEXT NOT NULL,
+            team2 TEXT NOT NULL,
+            date TIMESTAMP NOT NULL,
+            result TEXT,
+            team1_dividend REAL DEFAULT 1.0,
+            team2_dividend REAL DEFAULT 1.0,
+            closed INTEGER DEFAULT 0,
+            team1_total_bet INTEGER DEFAULT 0,
+            team2_total_bet INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bets (
+            bet_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            match_id INTEGER NOT NULL,
+            team TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (match_id) REFERENCES matches(match_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS teams (
+            match_name TEXT,
+            user_id TEXT,
+            team INTEGER,
+            PRIMARY KEY (match_name, user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS records (
+            user_id TEXT PRIMARY KEY,
+            wins INTEGER DEFAULT 0,
+            losses INTEGER DEFAULT 0,
+            mmr INTEGER DEFAULT 1600,
+            streak INTEGER DEFAULT 0
+        )
+        ''',
+    ]),
+    (2, 'indexes for hot queries', [
+        # 유저별 베팅 합계 (user_id, match_id) -> SUM(amount)
+        'CREATE INDEX IF NOT EXISTS idx_bets_user_match ON bets (user_id, match_id, amount)',
+        # 경기별 베팅 조회와 정산 (match_id, team) -> user_id, amount
+        'CREATE INDEX IF NOT EXISTS idx_bets_match_team ON bets (match_id, team, user_id, amount)',
+        # 팀 인원 수 (match_name, team)
+        'CREATE INDEX IF NOT EXISTS idx_teams_match_team ON teams (match_name, team)',
+        # 정산 전 경기 목록
+        'CREATE INDEX IF NOT EXISTS idx_matches_unsettled ON matches (match_id) WHERE result IS NULL',
+        # 티어표 정렬
+        'CREATE INDEX IF NOT EXISTS idx_records_mmr ON records (mmr DESC, user_id)',
+    ]),
+    (3, 'archive tables for settled matches and bets', [
+        # match_id/bet_id 는 원래 테이블에서 받은 값 그대로 (AUTOINCREMENT 라 다시 쓰이지 않는다)
+        '''
+        CREATE TABLE IF NOT EXISTS matches_archive (
+            match_id INTEGER PRIMARY KEY,
+            match_name TEXT NOT NULL,
+            team1 TEXT NOT NULL,
+            team2 TEXT NOT NULL,
+            date TIMESTAMP NOT NULL,
+            result TEXT,
+            team1_dividend REAL,
+            team2_dividend REAL,
+            closed INTEGER,
+            team1_total_bet INTEGER,
+            team2_total_bet INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bets_archive (
+            bet_id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            match_id INTEGER NOT NULL,
+            team TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            timestamp TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_bets_archive_match ON bets_archive (match_id, team, user_id, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_bets_archive_user ON bets_archive (user_id, match_id)',
+    ]),
+    (4, 'lobby state', [
+        # 참가 버튼의 custom_id 에 lobby_id 를 쓰므로 AUTOINCREMENT 로 지운 내전의 번호를 다시 쓰지 않는다
+        '''
+        CREATE TABLE IF NOT EXISTS lobbies (
+            lobby_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_name TEXT NOT NULL UNIQUE,
+            closed INTEGER DEFAULT 0,
+            channel_id INTEGER,
+            message_id INTEGER,
+            updated_at TIMESTAMP NOT NULL
+        )
+        ''',
+        # 예전에는 재시작하면 모든 내전의 참가가 마감됐으므로 이미 참가자가 있는 내전은 마감된 내전으로 옮긴다
+        '''
+        INSERT OR IGNORE INTO lobbies (match_name, closed, updated_at)
+        SELECT DISTINCT match_name, 1, datetime('now', 'localtime') FROM teams
+        ''',
+    ]),
+    (5, 'per-match auto close flag', [
+        # 0: 시작 시각이 지난 뒤 관리자가 다시 연 경기. 재시작해도 자동 마감하지 않는다
+        'ALTER TABLE matches ADD COLUMN auto_close INTEGER DEFAULT 1',
+    ]),
+    (6, 'archive order for incremental match exports', [
+        # 보관(정산 완료)된 순서. 증분 내보내기가 정산이 끝난 경기만 이 순서로 한 번씩 내보낸다
+        'ALTER TABLE matches_archive ADD COLUMN archive_seq INTEGER',
+        'UPDATE matches_archive SET archive_seq = match_id',
+        'CREATE INDEX IF NOT EXISTS idx_matches_archive_seq ON matches_archive (archive_seq)',
+    ]),
+    (7, 'odds board messages', [
+        # 채널마다 실시간 배당판 메시지. 재시작한 뒤에도 같은 메시지를 계속 고친다 (서버는 DB 파일마다 하나)
+        '''
+        CREATE TABLE IF NOT EXISTS odds_boards (
+            channel_id INTEGER PRIMARY KEY,
+            message_id INTEGER NOT NULL
+        )
+        ''',
+    ]),
+]
+
+# 인덱스를 타야 하는 쿼리와 EXPLAIN QUERY PLAN 에 나와야 하는 인덱스 이름
+HOT_QUERIES = [
+    ('SELECT SUM(amount) FROM bets WHERE user_id = ? AND match_id = ?', 'idx_bets_user_match'),
+    ('SELECT user_id, team, amount FROM bets WHERE match_id = ?', 'idx_bets_match_team'),
+    ('SELECT user_id, amount FROM bets WHERE match_id = ? AND team = ?', 'idx_bets_match_team'),
+    ('SELECT COUNT(*) FROM teams WHERE match_name = ? AND team = ?', 'idx_teams_match_team'),
+    ('SELECT * FROM matches WHERE result IS NULL', 'idx_matches_unsettled'),
+    ('SELECT user_id, mmr FROM records ORDER BY mmr DESC', 'idx_records_mmr'),
+    ('SELECT user_id, team, amount FROM bets_archive WHERE match_id = ?', 'idx_bets_archive_match'),
+    ('SELECT match_id, amount FROM bets_archive WHERE user_id = ?', 'idx_bets_archive_user'),
+    ('SELECT MAX(archive_seq) FROM matches_archive', 'idx_matches_archive_seq'),
+]
+
+
+def get_schema_version(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """아직 적용되지 않은 마이그레이션을 버전 순서대로 하나씩 트랜잭션으로 적용한다.
+    적용한 버전 목록을 돌려준다."""
+    current = get_schema_version(conn)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied.append(version)
+    if applied:
+        conn.execute('ANALYZE')
+    return applied
+
+
+def check_query_plans(conn):
+    """HOT_QUERIES 가 기대한 인덱스를 쓰는지 확인하고, 그렇지 않은 (쿼리, 실행 계획) 목록을 돌려준다."""
+    problems = []
+    for query, index in HOT_QUERIES:
+        params = (None,) * query.count('?')
+        plan = ' / '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params))
+        if index not in plan:
+            problems.append((query, plan))
+    return problems
+
+
+if __name__ == '__main__':
+    # python migrations.py [points.db] [--check]
+    args = [arg for arg in sys.argv[1:] if arg != '--check']
+    conn = sqlite3.connect(args[0] if args else 'points.db')
+    print(f'schema version {get_schema_version(conn)}, applied {migrate(conn) or "nothing"}')
+    if '--check' in sys.argv:
+        problems = check_query_plans(conn)
+        for query, plan in problems:
+            print(f'NOT INDEXED: {query}\n    {plan}')
+        conn.close()
+        sys.exit(1 if problems else 0)
+    conn.close()
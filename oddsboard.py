@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+log = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+class OddsBoard:
+    """채널마다 고정 메시지 하나에 열린 경기의 베팅 총액과 배당을 보여주고, 베팅이 들어오면 그 메시지를 고친다.
+
+    ``touch`` 는 바뀌었다는 표시만 하며 db 워커 스레드에서 불러도 된다. 실제 수정은 첫 touch 후
+    ``debounce`` 초, 직전 수정 후 ``min_interval`` 초가 지났을 때 한 번만 하므로 그 사이에 들어온
+    베팅은 모두 한 번의 수정으로 합쳐진다. ``render`` 는 게시판 내용을 돌려주는 코루틴 함수로,
+    수정 한 번에 한 번만 호출되고 모든 채널이 같은 내용을 받는다.
+    재시작 전에 올린 메시지는 ``adopt`` 로 다시 붙인다. 누가 메시지를 지워 그 채널의 구독이 끝나면
+    ``listeners`` 를 부르므로 저장해 둔 메시지 ID 를 지우는 데 쓴다.
+    """
+
+    def __init__(self, render, debounce=1.0, min_interval=3.0):
+        self.render = render
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.messages = {}  # channel_id -> discord.Message 또는 discord.PartialMessage
+        self.listeners = []  # listener(channel_id): 게시판 메시지가 지워져 구독이 끝난 채널마다 호출
+        self.edits = 0
+        self._content = None
+        self._last_edit = 0.0
+        self._dirty = asyncio.Event()
+        self._loop = None
+        self._task = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
+
+    async def attach(self, channel):
+        # 채널에 게시판을 새로 올린다. 이미 있으면 예전 메시지는 더 이상 고치지 않는다
+        content = _truncate(await self.render())
+        message = await channel.send(content)
+        try:
+            await message.pin()
+        except discord.HTTPException:
+            pass  # 메시지 관리 권한이 없으면 고정 없이 쓴다
+        self.messages[channel.id] = message
+        self._content = content
+        return message
+
+    def adopt(self, channel_id, message):
+        """재시작 전에 올린 게시판 메시지(보통 ``channel.get_partial_message``)를 다시 고치기 시작한다.
+        다음 refresh 는 내용이 같아도 모든 메시지를 고친다. 이미 그 채널에 게시판이 있으면 False."""
+        if channel_id in self.messages:
+            return False
+        self.messages[channel_id] = message
+        self._content = None
+        return True
+
+    async def detach(self, channel_id):
+        message = self.messages.pop(channel_id, None)
+        if message is None:
+            return False
+        try:
+            await message.delete()
+        except discord.HTTPException:
+            pass
+        return True
+
+    def touch(self, *args):
+        loop = self._loop
+        if loop is None or not self.messages:
+            return
+        loop.call_soon_threadsafe(self._dirty.set)
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(max(self.debounce, self._last_edit + self.min_interval - time.monotonic()))
+            self._dirty.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                log.exception('failed to refresh odds board')
+
+    async def refresh(self):
+        if not self.messages:
+            return
+        content = _truncate(await self.render())
+        if content == self._content:
+            return
+        self._content = content
+        self._last_edit = time.monotonic()
+        for channel_id, message in list(self.messages.items()):
+            try:
+                await message.edit(content=content)
+                self.edits += 1
+            except discord.NotFound:
+                # 누가 게시판 메시지를 지웠으면 그 채널은 구독을 끝낸다
+                self.messages.pop(channel_id, None)
+                for listener in self.listeners:
+                    listener(channel_id)
+            except discord.HTTPException as e:
+                log.warning('failed to edit odds board in channel %s: %s', channel_id, e)
+
+
+def _truncate(content):
+    if len(content) <= MAX_MESSAGE_LENGTH:
+        return content
+    return content[:MAX_MESSAGE_LENGTH - 2] + '\n…'
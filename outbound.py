@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import discord
+
+log = logging.getLogger(__name__)
+
+
+class _Bucket:
+    # rate 개를 per 초에 걸쳐 다시 채우는 토큰 버킷
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self):
+        """토큰 하나를 쓰고 0을 돌려준다. 없으면 다음 토큰까지 기다릴 초를 돌려준다."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+    async def acquire(self):
+        while (delay := self.take()) > 0:
+            await asyncio.sleep(delay)
+
+
+class _Message:
+    __slots__ = ('channel', 'content', 'key')
+
+    def __init__(self, channel, content, key):
+        self.channel = channel
+        self.content = content
+        self.key = key
+
+    def merge(self, content, replace):
+        if replace:
+            self.content = content
+            return
+        lines = self.content.split('\n')
+        lines += [line for line in content.split('\n') if line not in lines]
+        self.content = '\n'.join(lines)
+
+
+class Outbox:
+    """명령어 처리와 상관없이 채널에 보내는 메시지(알림, 공지)의 발신 큐.
+
+    ``post`` 는 큐에 넣고 바로 돌아오며, 채널마다 작업 하나가 채널별 버킷(기본 5초에 5개)과
+    봇 전체 버킷을 지키면서 순서대로 보낸다. 같은 ``key`` 의 메시지가 아직 큐에 있으면 새 메시지를
+    따로 보내지 않고 거기에 합친다(같은 줄은 한 번만). 큐가 ``max_queue`` 를 넘으면 오래된 것부터 버린다.
+    """
+
+    def __init__(self, rate=5, per=5.0, global_rate=40, max_retries=3, max_queue=100):
+        self.rate = rate
+        self.per = per
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self._global = _Bucket(global_rate, 1.0)
+        self._buckets = {}   # channel_id -> _Bucket
+        self._queues = {}    # channel_id -> deque[_Message]
+        self._keys = {}      # (channel_id, key) -> 아직 보내지 않은 _Message
+        self._workers = {}   # channel_id -> Task
+
+    def post(self, channel, content, key=None, replace=False):
+        if key is not None:
+            queued = self._keys.get((channel.id, key))
+            if queued is not None:
+                queued.merge(content, replace)
+                self.coalesced += 1
+                return
+
+        queue = self._queues.setdefault(channel.id, deque())
+        if len(queue) >= self.max_queue:
+            oldest = queue.popleft()
+            if oldest.key is not None:
+                self._keys.pop((channel.id, oldest.key), None)
+            self.dropped += 1
+            log.warning('outbox for channel %s is full, dropped a message', channel.id)
+        message = _Message(channel, content, key)
+        queue.append(message)
+        if key is not None:
+            self._keys[(channel.id, key)] = message
+        if channel.id not in self._workers:
+            self._workers[channel.id] = asyncio.create_task(self._drain(channel.id, queue))
+
+    async def _drain(self, channel_id, queue):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = _Bucket(self.rate, self.per)
+        try:
+            while queue:
+                await bucket.acquire()
+                await self._global.acquire()
+                # 토큰을 기다리는 동안 들어온 메시지는 합쳐졌으므로 이제 큐에서 뺀다
+                message = queue.popleft()
+                if message.key is not None:
+                    self._keys.pop((channel_id, message.key), None)
+                await self._send(message)
+        finally:
+            self._workers.pop(channel_id, None)
+            if not queue:
+                self._queues.pop(channel_id, None)
+
+    async def _send(self, message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await message.channel.send(message.content)
+                self.sent += 1
+                return
+            except (discord.Forbidden, discord.NotFound) as e:
+                log.warning('cannot send to channel %s: %s', message.channel.id, e)
+                break
+            except (discord.HTTPException, discord.RateLimited) as e:
+                if attempt == self.max_retries:
+                    log.warning('giving up sending to channel %s: %s', message.channel.id, e)
+                    break
+                await asyncio.sleep(getattr(e, 'retry_after', None) or 2 ** attempt)
+        self.failed += 1
+
+    async def close(self, timeout=5.0):
+        # 종료 전에 남은 메시지를 timeout 초까지 보내 보고, 나머지는 버린다
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        done, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+
+class PayoutNotifier:
+    """정산 결과를 당첨자에게 알린다. ``notify`` 는 바로 돌아오고 백그라운드 작업이 보낸다.
+
+    mode='dm' 이면 당첨자마다 DM 을 ``concurrency`` 개까지 동시에, 초당 ``rate`` 개를 넘지 않게 보낸다.
+    실패한 DM 은 백오프 후 다시 시도하고, 끝내 못 보낸 유저(DM 차단 등)는 채널 요약으로 모아 outbox 로 보낸다.
+    mode='digest' 면 처음부터 채널 요약만 보낸다.
+    """
+
+    def __init__(self, client, outbox, mode='dm', concurrency=5, rate=5, max_retries=3):
+        self.client = client
+        self.outbox = outbox
+        self.mode = mode
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self._bucket = _Bucket(rate, 1.0)
+        self._tasks = set()
+
+    def notify(self, channel, title, payouts, balance_of):
+        # payouts: {user_id: 당첨금}, balance_of(user_id) -> 현재 포인트
+        if not payouts:
+            return
+        task = asyncio.create_task(self._fan_out(channel, title, dict(payouts), balance_of))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fan_out(self, channel, title, payouts, balance_of):
+        undelivered = payouts
+        if self.mode == 'dm':
+            undelivered = {}
+            pending = iter(payouts.items())
+
+            async def worker():
+                # 모든 worker 가 같은 이터레이터에서 꺼내므로 동시에 보내는 DM 은 concurrency 개뿐이다
+                for user_id, winnings in pending:
+                    content = f'{title}\n당첨금 {winnings} 포인트가 지급되었습니다. 현재 포인트: {balance_of(user_id)}'
+                    if not await self._send_dm(user_id, content):
+                        undelivered[user_id] = winnings
+
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(payouts)))))
+        if undelivered and channel is not None:
+            for content in _digest(title, undelivered):
+                self.outbox.post(channel, content)
+
+    async def _send_dm(self, user_id, content):
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            try:
+                user = self.client.get_user(int(user_id)) or await self.client.fetch_user(int(user_id))
+                await user.send(content)
+                self.sent += 1
+                return True
+            except (discord.Forbidden, discord.NotFound):
+                break
+            except (discord.HTTPException, discord.RateLimited) as e:
+                if attempt == self.max_retries:
+                    log.warning('giving up sending payout DM to %s: %s', user_id, e)
+                    break
+                await asyncio.sleep(getattr(e, 'retry_after', None) or 2 ** attempt)
+        self.failed += 1
+        return False
+
+    async def close(self, timeout=5.0):
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+
+def _digest(title, payouts, limit=1900):
+    # 당첨금이 큰 순서로, 메시지 길이 제한에 맞춰 여러 개로 나눈다
+    lines = [f'<@{user_id}> +{winnings}' for user_id, winnings in sorted(payouts.items(), key=lambda item: -item[1])]
+    content = f'{title} 당첨자:'
+    for line in lines:
+        if len(content) + len(line) + 1 > limit:
+            yield content
+            content = f'{title} 당첨자 (계속):'
+        content += '\n' + line
+    yield content
@@ -0,0 +1,111 @@
+class Pool:
+    """경기 하나의 팀별 베팅 총액. 배당은 총액에서 바로 계산한다."""
+
+    __slots__ = ('team1', 'team2', 'team1_total', 'team2_total')
+
+    def __init__(self, team1, team2, team1_total=0, team2_total=0):
+        self.team1 = team1
+        self.team2 = team2
+        self.team1_total = team1_total
+        self.team2_total = team2_total
+
+    def add(self, team, amount):
+        # 취소는 amount 를 음수로 넘긴다
+        if team == self.team1:
+            self.team1_total += amount
+        elif team == self.team2:
+            self.team2_total += amount
+
+    def dividends(self):
+        total_bet = self.team1_total + self.team2_total
+        team1_dividend = total_bet / self.team1_total if self.team1_total > 0 else 1.0
+        team2_dividend = total_bet / self.team2_total if self.team2_total > 0 else 1.0
+        # 소숫점 둘째 자리 까지 반올림
+        return round(team1_dividend, 2), round(team2_dividend, 2)
+
+    def dividend(self, team):
+        team1_dividend, team2_dividend = self.dividends()
+        return team1_dividend if team == self.team1 else team2_dividend
+
+    def odds(self):
+        """(team1_total_bet, team2_total_bet, team1_dividend, team2_dividend)"""
+        return (self.team1_total, self.team2_total) + self.dividends()
+
+    def row(self, match_id):
+        # matches 테이블 UPDATE 파라미터 순서
+        return self.odds() + (match_id,)
+
+
+class PoolBook:
+    """정산 전 경기들의 베팅 풀. 베팅/취소마다 O(1)로 갱신하고, matches 테이블의
+    total_bet/dividend 컬럼에는 flush 할 때 바뀐 경기만 한꺼번에 쓴다.
+
+    기준 데이터는 bets 테이블이므로 load 는 bets 합계로 풀을 다시 만든다. flush 전에 봇이
+    죽어도 다음 시작 때 정확한 값으로 복구된다.
+    """
+
+    UPDATE_SQL = '''
+    UPDATE matches SET team1_total_bet = ?, team2_total_bet = ?, team1_dividend = ?, team2_dividend = ?
+    WHERE match_id = ?
+    '''
+
+    def __init__(self):
+        self.pools = {}
+        self.dirty = set()
+
+    def load(self, conn, matches):
+        # matches: {match_id: (team1, team2)}
+        self.pools = {match_id: Pool(team1, team2) for match_id, (team1, team2) in matches.items()}
+        self.dirty = set()
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT bets.match_id, bets.team, SUM(bets.amount) FROM bets
+        JOIN matches ON matches.match_id = bets.match_id
+        WHERE matches.result IS NULL
+        GROUP BY bets.match_id, bets.team
+        ''')
+        for match_id, team, total in cursor.fetchall():
+            pool = self.pools.get(match_id)
+            if pool is not None:
+                pool.add(team, total)
+        # 예전 버전이 남긴 컬럼 값과 다를 수 있으므로 전부 한 번 맞춰 둔다
+        self.dirty.update(self.pools)
+
+    def snapshot(self):
+        return {match_id: (pool.team1, pool.team2, pool.team1_total, pool.team2_total)
+                for match_id, pool in self.pools.items()}, set(self.dirty)
+
+    def restore(self, state):
+        pools, dirty = state
+        self.pools = {match_id: Pool(*row) for match_id, row in pools.items()}
+        self.dirty = set(dirty)
+
+    def get(self, match_id):
+        return self.pools.get(match_id)
+
+    def open(self, match_id, team1, team2):
+        self.pools[match_id] = Pool(team1, team2)
+
+    def add(self, match_id, team, amount):
+        self.pools[match_id].add(team, amount)
+        self.dirty.add(match_id)
+
+    def pop(self, match_id):
+        self.dirty.discard(match_id)
+        return self.pools.pop(match_id, None)
+
+    def write(self, cursor, match_id):
+        # 경기 하나를 지금 바로 기록 (마감/정산 트랜잭션 안에서 호출)
+        pool = self.pools.get(match_id)
+        if pool is not None:
+            cursor.execute(self.UPDATE_SQL, pool.row(match_id))
+            self.dirty.discard(match_id)
+
+    def flush(self, conn):
+        if not self.dirty:
+            return 0
+        rows = [self.pools[match_id].row(match_id) for match_id in self.dirty if match_id in self.pools]
+        conn.cursor().executemany(self.UPDATE_SQL, rows)
+        conn.commit()
+        self.dirty.clear()
+        return len(rows)
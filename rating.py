@@ -0,0 +1,67 @@
+BASE_MMR = 1600  # 기본 MMR 값 골드4
+MMR_CHANGE = 50
+
+
+def compute_rating_changes(players, winning_team):
+    """players: [(user_id, team, mmr, streak), ...] 를 받아
+    [(user_id, won, mmr_change, new_streak), ...] 를 돌려준다. mmr_change 는 부호가 붙은 값이다."""
+    if not players:
+        return []
+    avg_mmr_match = sum(player[2] for player in players) / len(players)
+
+    changes = []
+    for user_id, team, user_mmr, streak in players:
+        # Determine MMR change based on player's MMR vs match average MMR
+        mmr_diff = user_mmr - avg_mmr_match
+        if mmr_diff > 0:
+            mmr_change = MMR_CHANGE - int(mmr_diff / 100)
+        else:
+            mmr_change = MMR_CHANGE + int(mmr_diff / 100)
+        if mmr_change < 0:
+            mmr_change = 1
+
+        won = team == winning_team
+        if won:
+            new_streak = streak + 1 if streak > 0 else 1
+        else:
+            new_streak = streak - 1 if streak < 0 else -1
+
+        # 3연승/3연패부터 연속 기록 길이에 따라 변동폭 증가
+        if abs(new_streak) >= 3:
+            streak_multiplier = (abs(new_streak) - 2) / 10 + 1
+            mmr_change = int(mmr_change * streak_multiplier)
+
+        changes.append((user_id, won, mmr_change if won else -mmr_change, new_streak))
+    return changes
+
+
+def load_players(conn, match_name):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT teams.user_id, teams.team, COALESCE(records.mmr, ?), COALESCE(records.streak, 0)
+        FROM teams LEFT JOIN records ON records.user_id = teams.user_id
+        WHERE teams.match_name = ?
+    ''', (BASE_MMR, match_name))
+    return cursor.fetchall()
+
+
+def record_match_result(conn, match_name, winning_team):
+    """내전 결과를 한 트랜잭션으로 기록하고 {user_id: 새 MMR} 을 돌려준다."""
+    players = load_players(conn, match_name)
+    changes = compute_rating_changes(players, winning_team)
+
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO records (user_id, wins, losses, mmr, streak)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            wins = wins + excluded.wins,
+            losses = losses + excluded.losses,
+            mmr = mmr + ?,
+            streak = excluded.streak
+    ''', [(user_id, int(won), int(not won), BASE_MMR + mmr_change, new_streak, mmr_change)
+          for user_id, won, mmr_change, new_streak in changes])
+    cursor.execute("DELETE FROM teams WHERE match_name = ?", (match_name,))
+    conn.commit()
+
+    return {player[0]: player[2] + change[2] for player, change in zip(players, changes)}
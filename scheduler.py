@@ -0,0 +1,104 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+def parse_match_date(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def load_open_deadlines(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT match_id, date FROM matches WHERE result IS NULL AND closed = 0 AND auto_close = 1')
+    return cursor.fetchall()
+
+
+def set_auto_close(conn, match_id, auto_close):
+    conn.execute('UPDATE matches SET auto_close = ? WHERE match_id = ?', (int(auto_close), match_id))
+    conn.commit()
+
+
+def get_match_date(conn, match_id):
+    cursor = conn.cursor()
+    cursor.execute('SELECT date FROM matches WHERE match_id = ? AND result IS NULL', (match_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class BettingScheduler:
+    """경기 시작 시각(matches.date)에 베팅을 자동으로 마감한다.
+
+    마감 시각은 (시각, match_id) 힙으로 관리하고, 일정이 바뀌거나 취소되면 힙에서 지우지 않고
+    ``_deadlines`` 와 맞지 않는 항목을 꺼낼 때 버린다. 재시작하면 ``start`` 가 정산 전이고 열려 있는
+    경기의 마감 시각을 다시 읽으므로 예정된 마감이 사라지지 않는다. 시작 시각이 지난 뒤 관리자가 다시 연
+    경기는 matches.auto_close 가 0 이라 재시작해도 다시 닫지 않는다.
+    """
+
+    def __init__(self, db, betting):
+        self.db = db
+        self.betting = betting
+        self._heap = []
+        self._deadlines = {}  # match_id -> 유효한 마감 시각
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        for match_id, date in await self.db.run(load_open_deadlines):
+            self.schedule(match_id, parse_match_date(date))
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, match_id, deadline):
+        self._deadlines[match_id] = deadline
+        heapq.heappush(self._heap, (deadline, match_id))
+        self._wakeup.set()
+
+    def unschedule(self, match_id):
+        self._deadlines.pop(match_id, None)
+
+    def deadline(self, match_id):
+        return self._deadlines.get(match_id)
+
+    async def reopen(self, match_id):
+        # 다시 열린 경기는 시작 시각이 아직 남아 있을 때만 자동 마감을 건다. 이미 지났으면 관리자가 일부러
+        # 연 것이므로 자동 마감을 끄고 DB 에 남겨서 재시작한 뒤에도 유지한다
+        date = await self.db.run(get_match_date, match_id)
+        if date is None:
+            return
+        deadline = parse_match_date(date)
+        auto_close = deadline > datetime.now()
+        await self.db.run(set_auto_close, match_id, auto_close)
+        if auto_close:
+            self.schedule(match_id, deadline)
+        else:
+            self.unschedule(match_id)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = datetime.now()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, match_id = heapq.heappop(self._heap)
+                if self._deadlines.get(match_id) != deadline:
+                    continue
+                del self._deadlines[match_id]
+                try:
+                    await self.db.run(self.betting.close_betting, match_id)
+                    log.info('betting closed automatically for match %s at %s', match_id, deadline)
+                except Exception:
+                    log.exception('failed to close betting for match %s', match_id)
+
+            timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
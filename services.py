@@ -0,0 +1,244 @@
+# 명령어가 하는 DB/메모리 상태 작업. 디스코드 객체 없이 GuildData 와 기본 타입만 주고받으므로
+# 봇 프로세스에서 바로 실행할 수도, workers.WorkerPool 로 워커 프로세스에 보낼 수도 있다.
+# 모두 ``async def fn(data, ...)`` 형태이며 돌려주는 값은 pickle 할 수 있어야 한다.
+import asyncio
+from datetime import datetime
+
+from archive import archive_all, find_match
+from backup import backup
+from balance import balance_teams
+from export import export
+from rating import BASE_MMR
+
+backup_lock = asyncio.Lock()
+
+# Database interaction functions (모두 conn 을 받아 db 스레드에서 실행됨. 읽기만 하는 함수는 db.read 로 부른다)
+def get_matches(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT match_id, match_name, team1, team2, date, result, team1_dividend, team2_dividend, closed,
+               team1_total_bet, team2_total_bet
+        FROM matches WHERE result IS NULL
+    ''')
+    matches = cursor.fetchall()
+    return matches
+
+# 정산 후 보관된 경기도 찾는다
+def get_match_result(conn, match_id):
+    return find_match(conn, 'match_name, team1, team2, result', match_id)
+
+def get_match_teams(conn, match_id):
+    return find_match(conn, 'team1, team2', match_id)
+
+def get_match_summary(conn, match_id):
+    return find_match(conn, 'team1, team2, team1_total_bet, team2_total_bet, team1_dividend, team2_dividend', match_id)
+
+def get_record(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT wins, losses, mmr FROM records WHERE user_id = ?", (user_id,))
+    return cursor.fetchone()
+
+def set_user_mmr(conn, user_id, new_mmr):
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO records (user_id, wins, losses, mmr)
+        VALUES (?, 0, 0, ?)
+        ON CONFLICT(user_id) DO UPDATE SET mmr = ?
+    ''', (user_id, new_mmr, new_mmr))
+    conn.commit()
+
+def get_odds_boards(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT channel_id, message_id FROM odds_boards')
+    return cursor.fetchall()
+
+def set_odds_board(conn, channel_id, message_id):
+    conn.execute('''
+        INSERT INTO odds_boards (channel_id, message_id) VALUES (?, ?)
+        ON CONFLICT(channel_id) DO UPDATE SET message_id = excluded.message_id
+    ''', (channel_id, message_id))
+    conn.commit()
+
+def delete_odds_board(conn, channel_id):
+    conn.execute('DELETE FROM odds_boards WHERE channel_id = ?', (channel_id,))
+    conn.commit()
+
+
+def format_matches(betting, matches):
+    message = '다가오는 경기:\n'
+    for match in matches:
+        match_id, match_name, team1, team2, date, result, team1_dividend, team2_dividend, closed, team1_total_bet, team2_total_bet = match
+        odds = betting.get_odds(match_id)  # 테이블 값은 flush 주기만큼 늦을 수 있다
+        if odds is not None:
+            team1_total_bet, team2_total_bet, team1_dividend, team2_dividend = odds
+        message += (f'***ID: {match_id}, 경기: {match_name}, 팀: {team1} vs {team2}, Date: {date}***'
+                    f'\n배당: {team1_dividend} ({team1}) / {team2_dividend} ({team2})'
+                    f'\n총 베팅 금액: {team1_total_bet} ({team1}) / {team2_total_bet} ({team2})'
+                    f'\n베팅 가능 여부: {"닫힘" if closed else "열림"}\n')
+    return message
+
+
+async def open_guild(data):
+    # 아무것도 하지 않는다. 부르는 것만으로 서버의 DB 가 열리고 캐시가 적재된다
+    pass
+
+# 베팅
+async def add_match(data, match_name, team1, team2, match_date):
+    match_id = await data.db.run(data.betting.add_match, match_name, team1, team2, match_date)
+    data.scheduler.schedule(match_id, match_date)  # 경기 시작 시각에 베팅 자동 마감
+    return match_id
+
+async def upcoming_matches(data):
+    matches = await data.db.read(get_matches)
+    return format_matches(data.betting, matches) if matches else None
+
+async def render_odds_board(data):
+    matches = await data.db.read(get_matches)
+    if not matches:
+        return '**실시간 배당판**\n다가오는 경기가 없습니다.'
+    return f'**실시간 배당판** (마지막 갱신 {datetime.now().strftime("%H:%M:%S")})\n' + format_matches(data.betting, matches)
+
+# [(channel_id, message_id), ...] - 이 서버에 띄워 둔 배당판
+async def odds_board_messages(data):
+    return await data.db.read(get_odds_boards)
+
+async def save_odds_board(data, channel_id, message_id):
+    await data.db.run(set_odds_board, channel_id, message_id)
+
+async def remove_odds_board(data, channel_id):
+    await data.db.run(delete_odds_board, channel_id)
+
+async def place_bet(data, user_id, match_id, team, amount):
+    return await data.db.run_grouped(data.betting.place_bet, user_id, match_id, team, amount)
+
+async def cancel_bet(data, user_id, bet_id):
+    return await data.db.run(data.betting.cancel_bet, user_id, bet_id)
+
+async def close_bets(data, match_id):
+    # (team1, team2, team1_total_bet, team2_total_bet, team1_dividend, team2_dividend), 없으면 None
+    await data.db.run(data.betting.close_betting, match_id)
+    data.scheduler.unschedule(match_id)
+    odds = data.betting.get_odds(match_id)
+    if odds is not None:
+        team1, team2 = data.betting.matches[match_id][:2]
+        return (team1, team2) + odds
+    return await data.db.read(get_match_summary, match_id)
+
+async def open_bets(data, match_id):
+    # 자동 마감 여부를 먼저 기록한다. 그 사이에 죽어도 경기는 닫힌 채로 남을 뿐이다
+    await data.scheduler.reopen(match_id)
+    await data.db.run(data.betting.open_betting, match_id)
+
+async def settle_match(data, match_id, winning_team):
+    # ((team1, team2) 또는 None, {user_id: 당첨금} 또는 None, {user_id: 정산 후 포인트})
+    match = await data.db.read(get_match_teams, match_id)
+    if not match or winning_team not in match:
+        return match, None, None
+    payouts = await data.db.run(data.betting.close_match, match_id, winning_team)
+    data.scheduler.unschedule(match_id)
+    if payouts is None:  # 이미 정산됨
+        return match, None, None
+    return match, payouts, {user_id: data.betting.get_user_points(user_id) for user_id in payouts}
+
+async def archive_match(data, match_id):
+    await archive_all(data.db, [match_id])
+
+async def match_result(data, match_id):
+    return await data.db.read(get_match_result, match_id)
+
+# 포인트
+async def user_points(data, user_id):
+    return data.betting.get_user_points(user_id)
+
+async def adjust_points(data, user_id, amount):
+    return await data.db.run(data.betting.adjust_points, user_id, amount)
+
+# 관리
+async def export_data(data, out_dir, incremental):
+    # 자기 읽기 전용 커넥션으로 스냅샷을 읽으므로 db 워커를 거치지 않는다
+    return await asyncio.to_thread(export, data.db.path, out_dir, ('csv', 'jsonl'), incremental)
+
+async def backup_data(data):
+    # (경로, 페이지 수, 걸린 초). 자기 읽기 전용 커넥션으로 복사하므로 db 워커도, 봇의 쓰기도 막지 않는다
+    async with backup_lock:
+        return await asyncio.to_thread(backup, data.db.path)
+
+# 내전 (참가자와 마감 여부는 data.lobbies 메모리에서 읽는다)
+def lobby_members(data, match_name):
+    # [(user_id, team, mmr), ...] - 기록이 없는 유저는 BASE_MMR
+    members = []
+    for user_id, team in data.lobbies.members(match_name):
+        mmr = data.leaderboard.get_mmr(user_id)
+        members.append((user_id, team, BASE_MMR if mmr is None else mmr))
+    return members
+
+async def open_lobby(data, match_name, channel_id):
+    return await data.db.run(data.lobbies.open, match_name, channel_id)
+
+async def set_lobby_message(data, lobby_id, message_id):
+    await data.db.run(data.lobbies.set_message, lobby_id, message_id)
+
+async def join_lobby(data, lobby_id, user_id, team):
+    # 없거나 마감된 내전이면 None, 아니면 (내전 이름, 참가한 뒤의 그 팀 인원 수)
+    lobby = data.lobbies.get(lobby_id)
+    if lobby is None or lobby.closed:
+        return None
+    return await data.db.run_grouped(data.lobbies.join, lobby_id, user_id, team)
+
+async def add_team_member(data, match_name, user_id, team):
+    await data.db.run(data.lobbies.add, match_name, user_id, team)
+
+async def remove_team_member(data, match_name, user_id):
+    return await data.db.run(data.lobbies.remove, match_name, user_id)
+
+async def team_members(data, match_name):
+    return lobby_members(data, match_name)
+
+async def balance_lobby(data, match_name, apply):
+    # (team1, team2, 바뀌는 인원) - 팀은 [(user_id, mmr), ...]. 참가자가 2명 미만이면 None
+    rows = lobby_members(data, match_name)
+    if len(rows) < 2:
+        return None
+    current = {user_id: team for user_id, team, mmr in rows}
+    # 탐색에 수십 ms 가 걸릴 수 있으므로 이벤트 루프(다른 서버의 명령어, 하트비트)를 막지 않게 스레드에서
+    team1, team2 = await asyncio.to_thread(balance_teams, [(user_id, mmr) for user_id, team, mmr in rows])
+    # 지금 팀1과 더 많이 겹치는 쪽을 팀1로 해서 옮기는 인원을 줄인다
+    if sum(current[user_id] == 1 for user_id, _ in team1) < sum(current[user_id] == 1 for user_id, _ in team2):
+        team1, team2 = team2, team1
+    moved = sum(current[user_id] != 1 for user_id, _ in team1) + sum(current[user_id] != 2 for user_id, _ in team2)
+    if apply:
+        await data.db.run(data.lobbies.assign, match_name, [user_id for user_id, _ in team1], [user_id for user_id, _ in team2])
+    return team1, team2, moved
+
+async def close_lobby(data, match_name):
+    # {팀: [mmr, ...]}
+    await data.db.run(data.lobbies.close, match_name)
+    team_mmr = {1: [], 2: []}
+    for user_id, team, mmr in lobby_members(data, match_name):
+        team_mmr[team].append(mmr)
+    return team_mmr
+
+async def end_lobby(data, match_name, winning_team):
+    new_mmrs = await data.db.run(data.lobbies.end, match_name, winning_team)
+    data.leaderboard.update_many(new_mmrs)
+
+# 전적/순위
+async def user_record(data, user_id):
+    return await data.db.read(get_record, user_id)
+
+async def leaderboard_page(data, page, page_size):
+    # (범위에 맞춘 페이지 번호, 페이지 수, [(순위, user_id, mmr), ...])
+    page_count = data.leaderboard.page_count(page_size)
+    page = max(0, min(page, page_count - 1))
+    return page, page_count, data.leaderboard.page(page, page_size)
+
+async def user_rank(data, user_id):
+    # (순위, 전체 인원, mmr), 기록이 없으면 None
+    rank = data.leaderboard.rank(user_id)
+    if rank is None:
+        return None
+    return rank, len(data.leaderboard), data.leaderboard.get_mmr(user_id)
+
+async def set_mmr(data, user_id, new_mmr):
+    await data.db.run(set_user_mmr, user_id, new_mmr)
+    data.leaderboard.update(user_id, new_mmr)
@@ -0,0 +1,53 @@
+import logging
+import os
+import pickle
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_path(db_path):
+    return db_path + '.snapshot'
+
+
+def fingerprint(db_path):
+    """깨끗하게 닫힌 DB 파일의 (크기, 수정 시각). 파일이 없거나, 열려 있거나, 비정상 종료로 WAL 이 남아 있으면 None."""
+    try:
+        if os.path.getsize(db_path + '-wal') > 0:
+            return None
+    except FileNotFoundError:
+        pass
+    try:
+        stat = os.stat(db_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def save_snapshot(db_path, state):
+    """DB 를 닫은 직후에 메모리 상태를 저장한다. 이후 DB 가 바뀌면(봇이 다시 쓰거나 복원 CLI 가 덮어쓰면)
+    지문이 달라지므로 load_snapshot 이 이 스냅샷을 버린다. 저장했으면 True."""
+    saved = fingerprint(db_path)
+    if saved is None:
+        return False
+    path = snapshot_path(db_path)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump((SNAPSHOT_VERSION, saved, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+    return True
+
+
+def load_snapshot(db_path):
+    """DB 를 열기 전에 부른다(열면 WAL 파일이 생긴다). DB 가 저장 때와 같으면 그 상태, 아니면 None."""
+    try:
+        with open(snapshot_path(db_path), 'rb') as f:
+            version, saved, state = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning('ignoring unreadable snapshot for %s: %s', db_path, e)
+        return None
+    if version != SNAPSHOT_VERSION or saved != fingerprint(db_path):
+        return None
+    return state
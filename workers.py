@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+
+from guilds import GUILD_DB_DIR, GuildRegistry
+from lobbies import LOBBY_TTL
+
+log = logging.getLogger(__name__)
+
+
+class WorkerError(Exception):
+    """워커 프로세스에서 작업이 실패했거나 워커 프로세스가 죽었다."""
+
+
+class WorkerPool:
+    """DB 를 소유하는 워커 프로세스들. 봇(게이트웨이) 프로세스는 상호작용에 응답만 하고 작업을 여기로 보낸다.
+
+    서버마다 ``guild_id % processes`` 번 워커 하나가 그 서버의 GuildData(DB 쓰기 워커, 베팅 캐시,
+    순위표, 마감 스케줄러, 내전 상태)를 소유하므로 한 서버의 상태는 항상 한 프로세스에만 있다.
+    ``await pool.call(guild_id, fn, *args)`` 는 워커에서 ``await fn(data, *args)`` 를 실행한 결과를
+    돌려준다. fn 은 모듈 최상위의 코루틴 함수(services.py)여야 하고 인자와 결과는 pickle 된다.
+    정산 같은 무거운 작업이 봇 프로세스의 이벤트 루프나 GIL 을 잡지 않으므로 다른 상호작용의
+    3초 응답 기한에 영향을 주지 않는다.
+
+    워커의 베팅 상태가 바뀌면 ``on_event(guild_id, 'odds', match_id)``, 내전이 만료되면
+    ``on_event(guild_id, 'lobby_expired', match_name, channel_id, message_id)`` 가 봇 프로세스의 이벤트 루프에서
+    호출된다. 워커가 죽으면 그 워커에 보낸 작업은 WorkerError 로 끝나고 워커는 다시 시작된다.
+    죽은 프로세스가 큐의 락을 쥔 채로 남을 수 있으므로 워커마다 작업/결과 큐와 읽기 스레드가 따로 있고
+    다시 시작할 때 모두 새로 만든다.
+    """
+
+    def __init__(self, processes, db_dir=GUILD_DB_DIR, legacy_guild_id=None, on_event=None, lobby_ttl=LOBBY_TTL):
+        self.processes = processes
+        self.db_dir = db_dir
+        self.legacy_guild_id = legacy_guild_id
+        self.lobby_ttl = lobby_ttl
+        self.on_event = on_event
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = []  # [(Process, 작업 Queue, 결과 Queue, 읽기 스레드)]
+        self._pending = {}  # job_id -> (워커 번호, Future)
+        self._ids = itertools.count()
+        self._loop = None
+        self._closing = False
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._workers = [self._spawn(index) for index in range(self.processes)]
+
+    def _spawn(self, index):
+        jobs = self._context.Queue()
+        results = self._context.Queue()
+        process = self._context.Process(target=_serve, args=(jobs, results, self.db_dir, self.legacy_guild_id, self.lobby_ttl),
+                                        name=f'worker-{index}', daemon=True)
+        process.start()
+        reader = threading.Thread(target=self._read_results, args=(index, process, results),
+                                  name=f'worker-{index}-results', daemon=True)
+        reader.start()
+        return process, jobs, results, reader
+
+    async def call(self, guild_id, fn, *args):
+        if self._closing:
+            raise WorkerError('워커 풀이 닫혔습니다')
+        index = guild_id % self.processes
+        job_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[job_id] = (index, future)
+        self._workers[index][1].put((job_id, guild_id, fn, args))
+        return await future
+
+    def _read_results(self, index, process, results):
+        while True:
+            try:
+                messages = _drain(results, timeout=1.0)
+            except queue.Empty:
+                if not process.is_alive():
+                    self._loop.call_soon_threadsafe(self._restart, index, process)
+                    return
+                continue
+            stop = None in messages
+            self._loop.call_soon_threadsafe(self._dispatch, [message for message in messages if message is not None])
+            if stop:
+                return
+
+    def _dispatch(self, messages):
+        for kind, *rest in messages:
+            if kind == 'result':
+                job_id, ok, payload = rest
+                entry = self._pending.pop(job_id, None)
+                if entry is None or entry[1].done():
+                    continue
+                if ok:
+                    entry[1].set_result(payload)
+                else:
+                    entry[1].set_exception(WorkerError(payload))
+            elif self.on_event is not None:
+                guild_id, name, args = rest
+                try:
+                    self.on_event(guild_id, name, *args)
+                except Exception:
+                    log.exception('worker event handler failed')
+
+    def _restart(self, index, process):
+        if self._closing or self._workers[index][0] is not process:
+            return
+        log.error('worker %d exited with code %s, restarting', index, process.exitcode)
+        self._fail(index, WorkerError('워커 프로세스가 종료되었습니다'))
+        self._workers[index] = self._spawn(index)
+        self.restarts += 1
+
+    def _fail(self, index, error):
+        for job_id, (worker, future) in list(self._pending.items()):
+            if index is None or worker == index:
+                del self._pending[job_id]
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self, timeout=10.0):
+        # 워커는 받은 작업을 모두 끝내고 GuildData 를 닫은 뒤 종료한다
+        if self._closing or self._loop is None:
+            return
+        self._closing = True
+        for process, jobs, results, reader in self._workers:
+            jobs.put(None)
+        await asyncio.to_thread(self._join, timeout)
+        self._fail(None, WorkerError('워커 풀이 닫혔습니다'))
+
+    def _join(self, timeout):
+        for process, jobs, results, reader in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                log.warning('worker %s did not exit in %.0fs, terminating', process.name, timeout)
+                process.terminate()
+                process.join()
+            results.put(None)
+            reader.join()
+
+
+def _drain(source, timeout=None, limit=256):
+    # 하나가 올 때까지 기다린 뒤 이미 와 있는 것을 한꺼번에 꺼낸다. 메시지마다 스레드를 오가면
+    # GIL 을 넘겨받기를 기다리느라 작업 하나에 수 ms 씩 걸린다
+    batch = [source.get(timeout=timeout)]
+    try:
+        while len(batch) < limit:
+            batch.append(source.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _serve(jobs, results, db_dir, legacy_guild_id, lobby_ttl):
+    # 워커 프로세스의 진입점
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve_jobs(jobs, results, db_dir, legacy_guild_id, lobby_ttl))
+
+
+async def _serve_jobs(jobs, results, db_dir, legacy_guild_id, lobby_ttl):
+    def setup(data):
+        # 배당판과 내전 메시지는 봇 프로세스가 고치므로 베팅 상태가 바뀌거나 내전이 만료되면 알린다
+        data.betting.listeners.append(lambda match_id: results.put(('event', data.guild_id, 'odds', (match_id,))))
+        data.lobbies.listeners.append(lambda *lobby: results.put(('event', data.guild_id, 'lobby_expired', lobby)))
+
+    registry = GuildRegistry(db_dir, legacy_guild_id, setup=setup, lobby_ttl=lobby_ttl)
+    loop = asyncio.get_running_loop()
+    tasks = set()
+
+    async def run(job_id, guild_id, fn, args):
+        try:
+            result = await fn(await registry.get(guild_id), *args)
+        except Exception as e:
+            log.exception('job %s for guild %s failed', getattr(fn, '__name__', fn), guild_id)
+            results.put(('result', job_id, False, f'{type(e).__name__}: {e}'))
+        else:
+            results.put(('result', job_id, True, result))
+
+    # 작업은 봇 프로세스에서처럼 이벤트 루프 위에서 동시에 돌고, 쓰기는 서버마다 DB 워커가 순서대로 처리한다
+    stop = False
+    while not stop:
+        for job in await loop.run_in_executor(None, _drain, jobs):
+            if job is None:
+                stop = True
+                break
+            task = asyncio.create_task(run(*job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+    await registry.close()